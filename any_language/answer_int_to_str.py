@@ -1,25 +1,22 @@
-import json
+import os
 import sys
 from pathlib import Path
 
-def convert_answers(input_file):
-    # Load the JSON file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    # Convert answers to strings
-    for entry in data:
-        if 'answer' in entry:
-            if isinstance(entry['answer'], int):
-                entry['answer'] = str(entry['answer'])
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from dataset_io import DatasetWriter, iter_dataset
 
-    # Create output filename
+def convert_answers(input_file):
+    # Create output filename, in the same format as the input (JSON, JSONL, Parquet or Arrow)
     input_path = Path(input_file)
     output_file = input_path.with_name(f"{input_path.stem}_converted{input_path.suffix}")
 
-    # Save the updated data
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Convert answers to strings, streaming the entries to the output file
+    with DatasetWriter(str(output_file)) as writer:
+        for entry in iter_dataset(input_file):
+            if 'answer' in entry:
+                if isinstance(entry['answer'], int):
+                    entry['answer'] = str(entry['answer'])
+            writer.write(entry)
 
     print(f"Conversion complete. Updated file saved as: {output_file}")
 
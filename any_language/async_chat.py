@@ -0,0 +1,260 @@
+"""
+Concurrent chat completions against an OpenAI-compatible server, to keep the
+continuous batching of a local inference server (vLLM, TGI, ...) busy.
+
+An asyncio event loop runs in a background thread with one AsyncOpenAI
+client, whose connection pool keeps `concurrency` HTTP connections alive.
+Requests are submitted from normal (synchronous) code and up to
+`concurrency` of them are in flight at any time; the server batches them on
+the GPU as they arrive instead of one at a time. imap() yields the responses
+in the order of the requests, however they complete, and consumes its input
+lazily like page_executor.imap_ordered.
+
+Connection errors, timeouts, 429 and 5xx answers are retried, by default
+without limit like chat_completion, with the Retry-After delay of the server
+or exponential backoff; a 429 holds back every request of the client. A
+request that fails otherwise (or runs out of retries) is logged and answered
+with an empty text, so one bad chunk does not end a long run.
+
+The prompt and completion tokens reported by the server are added up, so the
+throughput (tokens/s) of a run can be printed at the end.
+
+Usage:
+    with AsyncChatClient("http://localhost:8000/v1", "token-abc123", concurrency=32) as client:
+        for text, usage in client.imap(messages_list, model, model_args):
+            ...
+        client.print_stats()
+
+To try it without a GPU, run the mock server with some latency:
+    python mock_openai_server.py --port 8001 --latency 1 --jitter 1
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import httpx
+from openai import (
+    AsyncOpenAI,
+    APITimeoutError,
+    APIConnectionError,
+    RateLimitError,
+    InternalServerError,
+)
+
+from rate_limit import backoff_delay, is_rate_limit_error, retry_after
+
+RETRY_ON = (APITimeoutError, APIConnectionError, RateLimitError, InternalServerError)
+
+
+class AsyncChatClient:
+    """
+    Submits chat completions from synchronous code to an event loop thread.
+
+    The client is safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        api_key,
+        concurrency=32,
+        timeout=600,
+        max_retries=None,
+        cache=None,
+    ):
+        """
+        :param base_url: str, e.g. http://localhost:8000/v1
+        :param api_key: str
+        :param concurrency: int, requests in flight at the same time
+        :param timeout: float, seconds to wait for one completion
+        :param max_retries: int, retries of connection errors, timeouts, 429
+            and 5xx before a request fails, None to retry without limit
+        :param cache: ResponseCache or None, answers repeated requests locally
+        """
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.cache = cache
+        self.lock = threading.Lock()
+        # monotonic time until which no request is sent, after a 429
+        self.paused_until = 0.0
+        self.stats = {
+            "requests": 0,
+            "cached": 0,
+            "failed": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+        }
+        self.started = None
+        self.finished = None
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        async def setup():
+            # the pool keeps one keep-alive connection per concurrent request
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=concurrency,
+                    max_keepalive_connections=concurrency,
+                ),
+                timeout=timeout,
+            )
+            # retries are done in _complete, which also pauses on 429
+            client = AsyncOpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=0,
+                http_client=http_client,
+            )
+            return client, asyncio.Semaphore(concurrency)
+
+        self.client, self.semaphore = asyncio.run_coroutine_threadsafe(setup(), self.loop).result()
+
+    async def _complete(self, model, messages, model_args, key=None):
+        attempt = 0
+        while True:
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                text, usage = await self._create(model, messages, model_args)
+                break
+            except RETRY_ON as e:
+                attempt += 1
+                if self.max_retries is not None and attempt > self.max_retries:
+                    return self._failed(e)
+                delay = retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                if is_rate_limit_error(e):
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                print(f"Chat completion error: {str(e)}. Waiting for {delay:.1f} seconds.")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                return self._failed(e)
+        if key is not None:
+            self.cache.put(key, {"text": text, "usage": usage})
+        return text, usage
+
+    def _failed(self, error):
+        print(f"Chat completion failed, using an empty response: {str(error)}")
+        with self.lock:
+            self.stats["failed"] += 1
+        return "", {}
+
+    async def _create(self, model, messages, model_args):
+        async with self.semaphore:
+            with self.lock:
+                self.stats["in_flight"] += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model, messages=messages, **model_args
+                )
+            finally:
+                with self.lock:
+                    self.stats["in_flight"] -= 1
+        text = response.choices[0].message.content.strip()
+        usage = dict(response.usage) if response.usage is not None else {}
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            self.stats["completion_tokens"] += usage.get("completion_tokens") or 0
+            self.finished = time.perf_counter()
+        return text, usage
+
+    def submit(self, messages, model, model_args=None):
+        """
+        Queues a chat completion.
+
+        :param messages: list, array of messages
+        :param model: str
+        :param model_args: dict, e.g. temperature and max_tokens
+        return: concurrent.futures.Future of (text, usage dict); the text is
+            empty if the request failed
+        """
+        if model_args is None:
+            model_args = {}
+        if self.started is None:
+            self.started = time.perf_counter()
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(model, messages, model_args)
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self.lock:
+                    self.stats["cached"] += 1
+                future = Future()
+                future.set_result((cached["text"], cached["usage"]))
+                return future
+
+        return asyncio.run_coroutine_threadsafe(self._complete(model, messages, model_args, key), self.loop)
+
+    def imap(self, messages_list, model, model_args=None):
+        """
+        Sends every request of `messages_list` and yields the responses in the
+        same order. The input is consumed lazily, a little ahead of the
+        requests in flight.
+
+        :param messages_list: iterable of message arrays
+        return: generator of (text, usage dict)
+        """
+        # twice the concurrency queued, so that a slow request at the head of
+        # the queue does not starve the server
+        max_pending = 2 * self.concurrency
+        pending = deque()
+        try:
+            for messages in messages_list:
+                pending.append(self.submit(messages, model, model_args))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def throughput(self):
+        """
+        return: dict with the request and token counts, the elapsed seconds
+            and the tokens per second of the requests sent so far
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        stats["seconds"] = elapsed
+        stats["completion_tokens_per_s"] = stats["completion_tokens"] / elapsed if elapsed else 0.0
+        stats["tokens_per_s"] = (stats["prompt_tokens"] + stats["completion_tokens"]) / elapsed if elapsed else 0.0
+        stats["requests_per_s"] = stats["requests"] / elapsed if elapsed else 0.0
+        return stats
+
+    def print_stats(self):
+        stats = self.throughput()
+        print(
+            f"{stats['requests']} requests ({stats['cached']} cached, {stats['failed']} failed) in {stats['seconds']:.1f} s, "
+            f"up to {stats['max_in_flight']} in flight: {stats['requests_per_s']:.2f} requests/s, "
+            f"{stats['completion_tokens_per_s']:.1f} completion tokens/s, "
+            f"{stats['tokens_per_s']:.1f} tokens/s in total"
+        )
+
+    def close(self):
+        async def shutdown():
+            await self.client.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,172 @@
+"""
+Offline bulk submission through the OpenAI Batch API.
+
+Requests are appended to JSONL batch files as they are built (so page images
+are never all held in memory), the files are uploaded and submitted, and the
+jobs are polled until they finish. Results come back keyed by custom_id.
+
+The client honours OPENAI_BASE_URL, so the whole flow can be exercised offline
+against mock_openai_server.py.
+"""
+
+import json
+import os
+import time
+
+# the Batch API accepts at most 50,000 requests and 200 MB per input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024**2
+
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchWriter:
+    """
+    Writes chat completion requests to JSONL batch files, starting a new file
+    (batch_file, batch_file_1, ...) whenever the Batch API limits are reached.
+    """
+
+    def __init__(
+        self,
+        batch_file,
+        max_requests=MAX_REQUESTS_PER_FILE,
+        max_bytes=MAX_BYTES_PER_FILE,
+    ):
+        self.batch_file = batch_file
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.file = None
+        self.requests = 0
+        self.bytes = 0
+        folder = os.path.dirname(batch_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def _next_file(self):
+        if self.file is not None:
+            self.file.close()
+        root, ext = os.path.splitext(self.batch_file)
+        path = self.batch_file if not self.paths else f"{root}_{len(self.paths)}{ext}"
+        self.paths.append(path)
+        self.file = open(path, "w", encoding="utf-8")
+        self.requests = 0
+        self.bytes = 0
+
+    def add(self, custom_id, model, messages, model_args=None):
+        line = json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": model, "messages": messages, **(model_args or {})},
+            },
+            ensure_ascii=False,
+        )
+        size = len(line.encode("utf-8")) + 1
+        if (
+            self.file is None
+            or self.requests >= self.max_requests
+            or (self.requests and self.bytes + size > self.max_bytes)
+        ):
+            self._next_file()
+        self.file.write(line + "\n")
+        self.requests += 1
+        self.bytes += size
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def submit_batch(client, batch_file, completion_window="24h"):
+    """
+    Uploads a JSONL batch file and creates the batch job.
+
+    :param client: OpenAI client
+    :param batch_file: str
+    return: str, batch id
+    """
+    with open(batch_file, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint="/v1/chat/completions",
+        completion_window=completion_window,
+    )
+    print(f"Submitted {batch_file} as batch {batch.id}")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=60):
+    """
+    Polls a batch until it reaches a final status and returns it.
+    """
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(
+                f"Batch {batch_id}: {batch.status} "
+                f"({counts.completed}/{counts.total} done, {counts.failed} failed)"
+            )
+        else:
+            print(f"Batch {batch_id}: {batch.status}")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def download_results(client, batch):
+    """
+    Reads the output file of a finished batch.
+
+    return: dict, custom_id -> response text (None for failed requests)
+    """
+    results = {}
+    if batch.output_file_id:
+        content = client.files.content(batch.output_file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200 and body.get("choices"):
+                text = body["choices"][0]["message"]["content"].strip()
+            else:
+                print(f"Request {item['custom_id']} failed: {item.get('error') or body}")
+                text = None
+            results[item["custom_id"]] = text
+    if batch.error_file_id:
+        content = client.files.content(batch.error_file_id).text
+        for line in content.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                print(f"Request {item['custom_id']} failed: {item.get('error')}")
+                results.setdefault(item["custom_id"], None)
+    return results
+
+
+def run_batches(client, batch_files, poll_interval=60):
+    """
+    Submits every batch file, waits for all of them and merges their results.
+
+    return: dict, custom_id -> response text (None for failed requests)
+    """
+    batch_ids = [submit_batch(client, batch_file) for batch_file in batch_files]
+    results = {}
+    for batch_id in batch_ids:
+        batch = wait_for_batch(client, batch_id, poll_interval)
+        if batch.status != "completed":
+            print(f"Batch {batch_id} ended with status {batch.status}")
+        results.update(download_results(client, batch))
+    return results
@@ -0,0 +1,312 @@
+"""
+Local category classifier, used as a fast path before asking an LLM.
+
+Two tiers, both pure Python:
+- a keyword index: subject terms in English and Hindi and notation patterns
+  (chemical formulas, calculus and trigonometry symbols) for Chemistry,
+  Physics, Mathematics and Biology only. A question is labelled when it
+  matches at least `min_hits` distinct terms of one subject and none of the
+  others. Words with common meanings outside the subject ("cell", "acid",
+  "species") are left out or only used in compounds ("cell membrane").
+- a TF-IDF character n-gram classifier trained on questions that were
+  already labelled (earlier outputs, or the LLM answers of the current run).
+  Each category is represented by the centroid of its questions; a question
+  is labelled when it is clearly closer to one centroid than to the others.
+
+Questions neither tier is confident about are left to the LLM. Check the
+precision of each tier on labelled questions of the exam's language before
+enabling the classifier in infer_category.py.
+
+Usage (held-out accuracy and coverage on labelled files):
+    python category_classifier.py --labelled exam1.json exam2.json --threshold 0.5
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+from collections import Counter, defaultdict
+
+# English category -> patterns. Latin terms match whole words regardless of
+# case, other scripts match as substrings (Python's \b does not work with
+# Devanagari vowel signs). "re:" patterns are case-sensitive regexes.
+DEFAULT_KEYWORDS = {
+    "Chemistry": [
+        "molecule", "molar mass", "molarity", "mole fraction", "atomic number",
+        "isotope", "oxidation state", "redox", "electrolysis", "sulphuric acid",
+        "sulfuric acid", "hydrochloric acid", "nitric acid", "alkali metal",
+        "covalent", "ionic bond", "hydrocarbon", "alkane", "alkene", "benzene",
+        "titration", "valency", "periodic table", "ph value",
+        "रसायन", "अणु", "परमाणु", "ऑक्सीकरण", "अपचयन", "संयोजकता", "आवर्त सारणी",
+        "हाइड्रोकार्बन",
+        r"re:\b(?:[A-Z][a-z]?\d*){2,}(?:\s*\+\s*(?:[A-Z][a-z]?\d*)+)*\s*(?:→|⇌)",
+        r"re:\b(?:H2O|H2SO4|HCl|NaOH|NaCl|CO2|NH3|CH4|HNO3|KMnO4)\b",
+    ],
+    "Physics": [
+        "velocity", "acceleration", "angular momentum", "coefficient of friction",
+        "torque", "kinetic energy", "potential energy", "wavelength", "refraction",
+        "convex lens", "concave lens", "focal length", "magnetic field",
+        "electric field", "capacitor", "electric current", "potential difference",
+        "gravitation",
+        "त्वरण", "संवेग", "बलाघूर्ण", "गतिज ऊर्जा", "स्थितिज ऊर्जा", "तरंगदैर्ध्य",
+        "अपवर्तन", "फोकस दूरी", "चुंबकीय क्षेत्र", "विद्युत क्षेत्र", "संधारित्र",
+        "गुरुत्वाकर्षण", "विमीय सूत्र",
+        r"re:\b\d+(?:\.\d+)?\s*(?:m/s|m s-1|N|J|W|Hz|Ω|ohm|V|kg m)\b",
+    ],
+    "Mathematics": [
+        "integral", "derivative", "differentiate", "determinant", "polynomial",
+        "quadratic equation", "logarithm", "trigonometric", "parabola",
+        "arithmetic progression", "geometric progression",
+        "समाकलन", "अवकलज", "अवकलन", "आव्यूह", "सारणिक", "बहुपद", "द्विघात",
+        "लघुगणक", "त्रिकोणमितीय", "परवलय", "समांतर श्रेढ़ी", "गुणोत्तर श्रेढ़ी",
+        r"re:[∫∑∏√]|\b(?:sin|cos|tan|cot|sec|cosec|log|lim)\s*[\(\dθxα]|d[xy]\s*/\s*d[xy]|dy/dx",
+    ],
+    "Biology": [
+        "cell membrane", "cell wall", "cell division", "chromosome", "dna", "rna",
+        "enzyme", "photosynthesis", "mitosis", "meiosis", "hormone", "bacteria",
+        "gene expression", "genotype", "phenotype",
+        "कोशिका भित्ति", "कोशिका झिल्ली", "कोशिका विभाजन", "गुणसूत्र", "एंजाइम",
+        "प्रकाश संश्लेषण", "समसूत्री", "अर्धसूत्री", "हार्मोन", "जीवाणु",
+    ],
+}
+
+
+def question_text(item):
+    """
+    The text a question is classified on: the question and its options.
+    """
+    options = item.get("options") or []
+    if isinstance(options, str):
+        options = [options]
+    return " ".join([str(item.get("question", ""))] + [str(o) for o in options])
+
+
+class KeywordClassifier:
+    """
+    Labels questions whose keyword hits all point to a single category and
+    include at least one subject term. Hits are distinct terms: a word
+    repeated in a question counts once.
+    """
+
+    def __init__(self, keywords=None, categories=None, min_hits=2):
+        """
+        :param keywords: dict, category -> list of terms ("re:" prefix for regexes)
+        :param categories: iterable, keep only these categories (None keeps all)
+        :param min_hits: int, distinct terms needed to label a question
+        """
+        keywords = DEFAULT_KEYWORDS if keywords is None else keywords
+        self.min_hits = min_hits
+        self.patterns = {}
+        for category, terms in keywords.items():
+            if categories is not None and category not in categories:
+                continue
+            words, notation = [], []
+            for term in terms:
+                if term.startswith("re:"):
+                    notation.append(term[3:])
+                elif term.isascii():
+                    words.append(r"(?i:\b" + re.escape(term) + r"\b)")
+                else:
+                    words.append(re.escape(term))
+            self.patterns[category] = (
+                re.compile("|".join(words)) if words else None,
+                re.compile("|".join(notation)) if notation else None,
+            )
+
+    def predict(self, text):
+        """
+        return: tuple, (category, confidence) or (None, 0.0)
+        """
+        hits = {}
+        for category, patterns in self.patterns.items():
+            counts = [
+                len({m.group(0).lower() for m in p.finditer(text)}) if p is not None else 0
+                for p in patterns
+            ]
+            if any(counts):
+                hits[category] = counts
+        if len(hits) == 1:
+            category, (words, notation) = hits.popitem()
+            # notation is shared between subjects (physics uses sin and √ too),
+            # so it only backs up a subject term
+            if words and words + notation >= self.min_hits:
+                return category, 1.0
+        return None, 0.0
+
+
+class NgramClassifier:
+    """
+    Nearest-centroid classifier over TF-IDF weighted character n-grams, which
+    copes with any script and with OCR noise without a tokenizer.
+
+    The confidence of a prediction is the relative margin between the most
+    and the second most similar centroids: (s1 - s2) / s1.
+    """
+
+    def __init__(self, ngram_range=(2, 4), min_similarity=0.05):
+        self.ngram_range = ngram_range
+        self.min_similarity = min_similarity
+        self.idf = {}
+        self.centroids = {}
+
+    def _ngrams(self, text):
+        text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+        low, high = self.ngram_range
+        return Counter(
+            text[i:i + n]
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        )
+
+    def _vector(self, text):
+        counts = self._ngrams(text)
+        vector = {
+            gram: (1 + math.log(count)) * self.idf[gram]
+            for gram, count in counts.items()
+            if gram in self.idf
+        }
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm:
+            vector = {gram: v / norm for gram, v in vector.items()}
+        return vector
+
+    def fit(self, texts, labels):
+        """
+        :param texts: list of str
+        :param labels: list of str, category of each text
+        return: self
+        """
+        documents = [self._ngrams(text) for text in texts]
+        frequency = Counter(gram for document in documents for gram in document)
+        total = len(documents)
+        self.idf = {
+            gram: math.log((1 + total) / (1 + count)) + 1
+            for gram, count in frequency.items()
+        }
+
+        sums = defaultdict(lambda: defaultdict(float))
+        for text, label in zip(texts, labels):
+            for gram, value in self._vector(text).items():
+                sums[label][gram] += value
+        self.centroids = {}
+        for label, vector in sums.items():
+            norm = math.sqrt(sum(v * v for v in vector.values()))
+            self.centroids[label] = {gram: v / norm for gram, v in vector.items()}
+        return self
+
+    @property
+    def trained(self):
+        # a single category gives no margin to judge confidence by
+        return len(self.centroids) >= 2
+
+    def predict(self, text):
+        """
+        return: tuple, (category, confidence) or (None, 0.0)
+        """
+        if not self.trained:
+            return None, 0.0
+        vector = self._vector(text)
+        scores = sorted(
+            (
+                (sum(v * centroid.get(gram, 0.0) for gram, v in vector.items()), label)
+                for label, centroid in self.centroids.items()
+            ),
+            reverse=True,
+        )
+        (best, label), (second, _) = scores[0], scores[1]
+        if best < self.min_similarity:
+            return None, 0.0
+        return label, (best - second) / best
+
+
+class LocalClassifier:
+    """
+    Keyword tier first, then the n-gram tier; returns a category only when
+    one of them is confident enough.
+    """
+
+    def __init__(self, categories=None, threshold=0.5, keywords=None, min_hits=2):
+        """
+        :param categories: iterable, the allowed categories (None allows all)
+        :param threshold: float, minimum n-gram confidence
+        """
+        self.categories = set(categories) if categories is not None else None
+        self.threshold = threshold
+        self.keywords = KeywordClassifier(keywords, self.categories, min_hits)
+        self.ngrams = NgramClassifier()
+
+    def fit(self, items):
+        """
+        Trains the n-gram tier on labelled questions (dicts with category_en).
+        """
+        texts, labels = [], []
+        for item in items:
+            label = item.get("category_en")
+            if not label or (self.categories is not None and label not in self.categories):
+                continue
+            texts.append(question_text(item))
+            labels.append(label)
+        if texts:
+            self.ngrams.fit(texts, labels)
+        return self
+
+    def predict(self, item):
+        """
+        return: str or None, the category of a question dict
+        """
+        text = question_text(item)
+        category, _ = self.keywords.predict(text)
+        if category is not None:
+            return category
+        category, confidence = self.ngrams.predict(text)
+        if category is not None and confidence >= self.threshold:
+            return category
+        return None
+
+
+def load_labelled(paths):
+    items = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            items.extend(item for item in json.load(f) if item.get("category_en"))
+    return items
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--labelled", nargs="+", required=True, help="JSON files of questions with category_en"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.5, help="Minimum n-gram confidence"
+    )
+    parser.add_argument(
+        "--holdout", type=float, default=0.2, help="Share of questions held out for evaluation"
+    )
+
+    args = parser.parse_args()
+    items = load_labelled(args.labelled)
+    random.Random(0).shuffle(items)
+    split = int(len(items) * (1 - args.holdout))
+    classifier = LocalClassifier(threshold=args.threshold).fit(items[:split])
+
+    held_out = items[split:]
+    labelled = correct = 0
+    keyword_labelled = keyword_correct = 0
+    for item in held_out:
+        category = classifier.predict(item)
+        if category is not None:
+            labelled += 1
+            correct += category == item["category_en"]
+        keyword_category, _ = classifier.keywords.predict(question_text(item))
+        if keyword_category is not None:
+            keyword_labelled += 1
+            keyword_correct += keyword_category == item["category_en"]
+    print(f"Held-out questions: {len(held_out)}")
+    print(f"Labelled locally:   {labelled} ({labelled / max(1, len(held_out)):.1%})")
+    print(f"Accuracy on those:  {correct / max(1, labelled):.1%}")
+    print(
+        f"Keyword tier:       {keyword_labelled} labelled, "
+        f"{keyword_correct / max(1, keyword_labelled):.1%} accurate"
+    )
@@ -2,9 +2,14 @@
 
 import json
 import os
+import sys
+import csv
+import glob
+from collections import Counter
 from datetime import datetime
 import argparse
-from typing import Union
+from functools import partial
+from typing import Union, get_args, get_origin
 import re
 
 from rich.rule import Rule
@@ -13,10 +18,131 @@ from rich.panel import Panel
 from rich.tree import Tree
 from rich.text import Text
 from rich.syntax import Syntax
+from rich.table import Table
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from dataset_io import FORMATS, DatasetWriter, entry_digest, iter_dataset, read_dataset
+from near_duplicates import NearDuplicateIndex, entry_text
+from page_executor import imap_ordered
+
+def print_near_duplicates(console, clusters, max_clusters=50):
+    if not clusters:
+        console.print("[green]No near-duplicate questions found.[/green]")
+        return
+    entries = sum(len(cluster["keys"]) for cluster in clusters)
+    table = Table(title=f"Near-duplicate clusters: {len(clusters)} ({entries} entries)")
+    table.add_column("Cluster", justify="right")
+    table.add_column("Similarity", justify="right")
+    table.add_column("Entries (file:entry)")
+    table.add_column("Question")
+    for num, cluster in enumerate(clusters[:max_clusters], 1):
+        members = ", ".join(f"{os.path.basename(str(f))}:{i}" for f, i in cluster["keys"][:10])
+        if len(cluster["keys"]) > 10:
+            members += f" (+{len(cluster['keys']) - 10} more)"
+        table.add_row(str(num), f"≥{cluster['similarity']:.2f}", members, cluster["preview"])
+    console.print(table)
+    if len(clusters) > max_clusters:
+        console.print(f"[yellow]... and {len(clusters) - max_clusters} more clusters.[/yellow]")
+
+def error_type(message):
+    """
+    Groups error messages by their template: entry numbers and paths are
+    replaced, field names and types are kept.
+    """
+    message = re.sub(r"\d+", "N", message)
+    return re.sub(r"^(Duplicate of entry N) of .*$", r"\1.", message)
+
+class ErrorReport:
+    """
+    Aggregates errors instead of rendering each one: counts by error type
+    and by file, and the first `top_n` examples of each type. Every error can
+    also be exported to a JSONL or CSV file (chosen by its extension) as it is
+    found, so memory does not grow with the number of errors.
+    """
+
+    def __init__(self, console, top_n=5, export_file=None):
+        self.console = console
+        self.top_n = top_n
+        self.by_type = Counter()
+        self.by_file = Counter()
+        self.examples = {}
+        self.export_file = export_file
+        self.export = None
+        self.writer = None
+        if export_file:
+            self.export = open(export_file, 'w', encoding='utf-8', newline='')
+            if export_file.endswith('.csv'):
+                self.writer = csv.writer(self.export)
+                self.writer.writerow(["file", "entry", "type", "message"])
+
+    def __len__(self):
+        return sum(self.by_type.values())
+
+    def add(self, path, idx, message, preview=""):
+        kind = error_type(message)
+        self.by_type[kind] += 1
+        self.by_file[path] += 1
+        examples = self.examples.setdefault(kind, [])
+        if len(examples) < self.top_n:
+            examples.append((path, idx, message, preview[:80]))
+        if self.writer is not None:
+            self.writer.writerow([path, idx, kind, message])
+        elif self.export is not None:
+            self.export.write(json.dumps({"file": path, "entry": idx, "type": kind, "message": message}, ensure_ascii=False) + "\n")
+
+    def print_summary(self, max_files=20):
+        if not self.by_type:
+            return
+        table = Table(title=f"Errors by type ({len(self)} errors)")
+        table.add_column("Count", justify="right")
+        table.add_column("Error")
+        for kind, count in self.by_type.most_common():
+            table.add_row(str(count), kind)
+        self.console.print(table)
+
+        if len(self.by_file) > 1:
+            table = Table(title=f"Errors by file ({len(self.by_file)} files)")
+            table.add_column("Count", justify="right")
+            table.add_column("File")
+            for path, count in self.by_file.most_common(max_files):
+                table.add_row(str(count), str(path))
+            self.console.print(table)
+
+        table = Table(title=f"Examples (first {self.top_n} per error type)")
+        table.add_column("File:entry")
+        table.add_column("Error")
+        table.add_column("Question")
+        for kind, _ in self.by_type.most_common():
+            for path, idx, message, preview in self.examples[kind]:
+                table.add_row(f"{os.path.basename(str(path))}:{idx}", message, preview)
+        self.console.print(table)
+        if self.export is not None:
+            self.console.print(f"All errors exported to [green]{self.export_file}[/green]")
+
+    def close(self):
+        if self.export is not None:
+            self.export.close()
+            self.export = None
 
 class JSONEvaluator:
-    def __init__(self, json_file, language_code, purge_error_entries=False):
+    def __init__(self, json_file, language_code, purge_error_entries=False, near_dup_threshold=None, near_dup_index=None, report="summary", error_report=None):
+        """
+        :param near_dup_threshold: float, estimated similarity above which two
+            entries are reported as near duplicates (None disables the check)
+        :param near_dup_index: NearDuplicateIndex shared by several evaluators,
+            to find near duplicates across files; its clusters are then
+            reported by the caller
+        :param report: "summary" aggregates the errors (counts by type and
+            file, a few examples), "full" renders every error with rich
+        :param error_report: ErrorReport shared by several evaluators, then
+            printed by the caller
+        """
         self.json_file = json_file
+        self.near_dup_index = near_dup_index
+        self.owns_near_dup_index = False
+        if near_dup_index is None and near_dup_threshold:
+            self.near_dup_index = NearDuplicateIndex(threshold=near_dup_threshold)
+            self.owns_near_dup_index = True
         self.json_data = []
         self.purge_error_entries = purge_error_entries
         self.output_file = None
@@ -27,38 +153,46 @@ class JSONEvaluator:
             "category_original_lang": str, "original_question_num": Union[int, str],
             "question": str, "options": list, "answer": str,
         }
+        # accepted types and messages of the schema checks, computed once.
+        # Union types are unpacked, so isinstance accepts them on any version
+        self.schema_fields = []
+        for key, expected_type in self.schema.items():
+            if get_origin(expected_type) is Union:
+                accepted, name = get_args(expected_type), "Union"
+            else:
+                accepted, name = expected_type, expected_type.__name__
+            self.schema_fields.append(
+                (key, accepted, f"Missing or empty key '{key}'.", f"Invalid type for '{key}': expected {name}, got ")
+            )
+        # valid single-number answers per number of options, e.g. {"1", "2",
+        # "3", "4"} for four options
+        self.single_answers = {}
         self.console = Console()
+        self.report = report
+        self.error_report = error_report
+        self.owns_error_report = error_report is None
+        if error_report is None:
+            self.error_report = ErrorReport(self.console)
 
     def load_json_file(self):
         self.console.print(f"[cyan]Loading JSON file:[/cyan] {self.json_file}")
         try:
-            with open(self.json_file, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                if not isinstance(data, list):
-                    raise ValueError(f"File {self.json_file}: JSON should be a list of entries.")
-                self.json_data = data
+            self.json_data = read_dataset(self.json_file)
             return True
         except (json.JSONDecodeError, Exception) as e:
             self.console.print(f"[red]Error loading file {self.json_file}: {e}[/red]")
             return False
 
     def clean_data(self):
-        schema_keys = set(self.schema.keys())
-        def clean_value(v):
-            return v.strip() if isinstance(v, str) else [clean_value(i) for i in v] if isinstance(v, list) else v
-        
         cleaned_data = []
         has_changes = False
         spurious_fields = set()
 
         for num, entry in enumerate(self.json_data):
-            cleaned_entry = {}
-            for k, v in entry.items():
-                if k in schema_keys:
-                    cleaned_entry[k] = clean_value(v)
-                else:
-                    spurious_fields.add(', '.join(map(str, (num, k))))
-                    has_changes = True
+            cleaned_entry, spurious = self.clean_entry(entry)
+            for k in spurious:
+                spurious_fields.add(', '.join(map(str, (num, k))))
+                has_changes = True
             cleaned_data.append(cleaned_entry)
 
         if spurious_fields:
@@ -69,7 +203,26 @@ class JSONEvaluator:
         
         return has_changes
 
-    def validate_all(self):
+    def clean_entry(self, entry):
+        """
+        Strips the string values of an entry and drops the fields that are not
+        in the schema.
+
+        return: tuple, (cleaned entry, list of the dropped keys)
+        """
+        def clean_value(v):
+            return v.strip() if isinstance(v, str) else [clean_value(i) for i in v] if isinstance(v, list) else v
+
+        cleaned_entry = {}
+        spurious = []
+        for k, v in entry.items():
+            if k in self.schema:
+                cleaned_entry[k] = clean_value(v)
+            else:
+                spurious.append(k)
+        return cleaned_entry, spurious
+
+    def validate_all(self, report=True):
         all_errors = []
         self.seen_entries = {}  # Changed to instance variable
         for idx, entry in enumerate(self.json_data):
@@ -80,41 +233,69 @@ class JSONEvaluator:
                 self.seen_entries[entry_hash] = idx
             all_errors.extend(self.validate_entry(idx, entry))
 
-        if all_errors:
-            self.display_errors_pretty(all_errors)
+        if all_errors and report:
+            if self.report == "full":
+                self.display_errors_pretty(all_errors)
+            else:
+                for error in all_errors:
+                    entry = self.json_data[error["entry"]]
+                    self.error_report.add(self.json_file, error["entry"], error["message"], str(entry.get('question', '')))
         return len(all_errors) == 0
 
+    def index_near_duplicates(self):
+        """
+        Adds the entries to the near-duplicate index, leaving out exact
+        duplicates, which validate_all already reports.
+        """
+        seen = set()
+        for idx, entry in enumerate(self.json_data):
+            text = entry_text(entry)
+            if text in seen:
+                continue
+            seen.add(text)
+            self.near_dup_index.add((self.json_file, idx), text, str(entry.get('question', '')))
+
+    def report_near_duplicates(self, clusters):
+        print_near_duplicates(self.console, clusters)
+
     def validate_entry(self, idx, entry):
         errors = []
-        for key, expected_type in self.schema.items():
-            value = entry.get(key)
+        get = entry.get
+        for key, accepted, missing, invalid in self.schema_fields:
+            value = get(key)
             if value is None or (isinstance(value, str) and not value.strip()):
-                errors.append({"entry": idx, "message": f"Missing or empty key '{key}'."})
-            elif not isinstance(value, expected_type):
-                errors.append({"entry": idx, "message": f"Invalid type for '{key}': expected {expected_type.__name__}, got {type(value).__name__}."})
+                errors.append({"entry": idx, "message": missing})
+            elif not isinstance(value, accepted):
+                errors.append({"entry": idx, "message": invalid + type(value).__name__ + "."})
 
-        lang = entry.get('language', '').lower()
+        lang = get('language', '').lower()
         if lang != self.language_code:
             errors.append({"entry": idx, "message": f"Invalid language code: expected '{self.language_code}', got '{lang}'."})
 
-        options = entry.get("options", [])
+        options = get("options", [])
         if not isinstance(options, list) or any(not isinstance(opt, str) or not opt.strip() for opt in options):
             errors.append({"entry": idx, "message": "Invalid 'options': must be a list of non-empty strings."})
         elif len(set(options)) == 1:
             errors.append({"entry": idx, "message": "All options are identical."})
 
-        answer = entry.get("answer", "")
+        answer = get("answer", "")
         if not isinstance(answer, str):
             errors.append({"entry": idx, "message": "Invalid 'answer': must be a string."})
-        else:
-            try:
-                answer_ints = [int(a.strip()) for a in answer.split(',')]
-                valid_range = set(range(1, len(options) + 1))
-                if not set(answer_ints).issubset(valid_range):
-                    errors.append({"entry": idx, "message": f"Invalid 'answer': Answer cannot be more than number of options: {len(options)}."})
-            except ValueError:
-                errors.append({"entry": idx, "message": "Invalid 'answer': must be comma-separated integers."})
-
+            return errors
+        if isinstance(options, list):
+            n = len(options)
+            valid = self.single_answers.get(n)
+            if valid is None:
+                valid = self.single_answers[n] = frozenset(str(i) for i in range(1, n + 1))
+            if answer in valid:
+                return errors
+        try:
+            answer_ints = [int(a.strip()) for a in answer.split(',')]
+            n = len(options)
+            if not all(1 <= a <= n for a in answer_ints):
+                errors.append({"entry": idx, "message": f"Invalid 'answer': Answer cannot be more than number of options: {n}."})
+        except ValueError:
+            errors.append({"entry": idx, "message": "Invalid 'answer': must be comma-separated integers."})
         return errors
 
     def display_errors_pretty(self, errors):
@@ -150,14 +331,22 @@ class JSONEvaluator:
         if has_changes:
             self.console.print("[yellow]Spurious fields were found and removed.[/yellow]")
             self.save_cleaned_data('cleaned_no_spurious_fields')
+
+        if self.near_dup_index is not None:
+            self.index_near_duplicates()
         
         is_valid = self.validate_all()
         if not is_valid and self.purge_error_entries:
             self.remove_problematic_entries()
             self.save_cleaned_data('cleaned_all_errors_removed')
-            is_valid = self.validate_all()
+            is_valid = self.validate_all(report=self.report == "full")
         
+        if self.owns_error_report:
+            self.error_report.print_summary()
+            self.error_report.close()
         self.report_results(is_valid, has_changes)
+        if self.owns_near_dup_index:
+            self.report_near_duplicates(self.near_dup_index.clusters())
 
     def remove_problematic_entries(self):
         valid_entries = []
@@ -183,17 +372,251 @@ class JSONEvaluator:
             else:
                 self.console.print("[yellow]Invalid entries were not removed. Use --purge_error_entries to remove them.[/yellow]")
 
+def iter_input_files(patterns):
+    """
+    Expands directories (searched recursively) and glob patterns into the
+    sorted list of dataset files (.json, .jsonl, .parquet, .arrow) they
+    contain.
+    """
+    extensions = tuple(FORMATS)
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files.update(os.path.join(root, name) for name in names if name.lower().endswith(extensions))
+        else:
+            files.update(path for path in glob.glob(pattern, recursive=True) if path.lower().endswith(extensions))
+    return sorted(files)
+
+def iter_entries(path):
+    """
+    Streams the entries of a dataset file without loading the whole file
+    (see dataset_io.iter_dataset).
+    """
+    return iter_dataset(path)
+
+def iter_chunks(paths, chunk_size=1000):
+    """
+    Groups the entries of the files into chunks of at most chunk_size entries.
+
+    return: generator of (path, index of the first entry, list of entries)
+    """
+    for path in paths:
+        chunk, start = [], 0
+        try:
+            for entry in iter_entries(path):
+                chunk.append(entry)
+                if len(chunk) >= chunk_size:
+                    yield path, start, chunk
+                    start += len(chunk)
+                    chunk = []
+        except Exception as e:
+            yield path, start, e
+            continue
+        if chunk:
+            yield path, start, chunk
+
+_worker_state = {}
+
+def validate_chunk(language_code, near_dup_threshold, keep_entries, chunk):
+    """
+    Cleans and validates a chunk of entries in a worker process.
+
+    return: dict with the path and start index of the chunk, the errors as
+        (entry index, message) pairs, the spurious fields removed as (entry
+        index, field) pairs, the duplicate digests, the MinHash signatures
+        (or None) and the cleaned entries (if keep_entries)
+    """
+    path, start, entries = chunk
+    if isinstance(entries, Exception):
+        return {"path": path, "start": start, "load_error": str(entries)}
+
+    key = (language_code, near_dup_threshold)
+    if _worker_state.get("key") != key:
+        _worker_state["key"] = key
+        _worker_state["evaluator"] = JSONEvaluator(json_file=None, language_code=language_code)
+        _worker_state["index"] = NearDuplicateIndex(threshold=near_dup_threshold) if near_dup_threshold else None
+    evaluator = _worker_state["evaluator"]
+    index = _worker_state["index"]
+
+    errors, spurious_fields, digests, signatures, previews, cleaned = [], [], [], [], [], []
+    for offset, entry in enumerate(entries):
+        idx = start + offset
+        if not isinstance(entry, dict):
+            errors.append((idx, "Entry is not a JSON object."))
+            digests.append(None)
+            signatures.append(None)
+            previews.append("")
+            cleaned.append(None)
+            continue
+        # like in single-file mode, removing spurious fields is cleaning, the
+        # cleaned entry is still valid
+        entry, spurious = evaluator.clean_entry(entry)
+        spurious_fields.extend((idx, k) for k in spurious)
+        try:
+            errors.extend((idx, error["message"]) for error in evaluator.validate_entry(idx, entry))
+        except Exception as e:
+            errors.append((idx, f"Could not validate entry: {e}"))
+        digests.append(entry_digest(entry))
+        signatures.append(index.signature(entry_text(entry)) if index is not None else None)
+        previews.append(str(entry.get('question', ''))[:80])
+        cleaned.append(entry if keep_entries else None)
+
+    return {
+        "path": path,
+        "start": start,
+        "errors": errors,
+        "spurious": spurious_fields,
+        "digests": digests,
+        "signatures": signatures,
+        "previews": previews,
+        "entries": cleaned,
+    }
+
+class CorpusEvaluator:
+    """
+    Validates a whole corpus of JSON/JSONL files in one pass: entries are
+    streamed and validated in chunks on worker processes, so no file is ever
+    loaded whole and memory does not depend on the size of the entries.
+
+    The global duplicate checks still need a little memory per distinct
+    entry, which is the limit of a single pass: about 120 bytes for the
+    exact-duplicate index (a 16-byte digest and a packed file/entry number),
+    plus about 450 bytes for the near-duplicate index (a 64 x 4-byte MinHash
+    signature, its key and an 80-character preview). That is roughly 1 GB
+    for 2 million entries with near duplicates, or for 8 million without
+    (--near_dup_threshold 0).
+    """
+
+    def __init__(self, paths, language_code, workers=None, chunk_size=1000, near_dup_threshold=0.8, output_file=None, report="summary", error_report=None):
+        """
+        :param paths: list of str, directories, glob patterns or files
+        :param workers: int, number of worker processes (default: CPU count)
+        :param output_file: str, dataset file (JSONL, JSON, Parquet or Arrow,
+            by extension) receiving the cleaned entries that have no errors
+            and are not exact duplicates (None: validate only)
+        :param report: "summary" aggregates the errors, "full" also prints
+            every error as a "file:entry: message" line
+        :param error_report: ErrorReport, e.g. one exporting the errors
+        """
+        self.paths = paths
+        self.language_code = language_code.lower()
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.near_dup_threshold = near_dup_threshold
+        self.output_file = output_file
+        self.console = Console()
+        self.report = report
+        self.error_report = error_report
+        self.owns_error_report = error_report is None
+        if error_report is None:
+            self.error_report = ErrorReport(self.console)
+        self.near_dup_index = NearDuplicateIndex(threshold=near_dup_threshold) if near_dup_threshold else None
+
+    def report_error(self, path, idx, message, preview=""):
+        self.error_report.add(path, idx, message, preview)
+        if self.report == "full":
+            print(f"{path}:{idx}: {message}")
+
+    def run(self):
+        files = iter_input_files(self.paths)
+        file_numbers = {path: number for number, path in enumerate(files)}
+        self.console.print(f"[cyan]Validating {len(files)} files with {self.workers} workers[/cyan]")
+        # digest -> file number << 32 | entry index, the first occurrence
+        seen = {}
+        spurious_fields = Counter()
+        entries = written = 0
+        output = DatasetWriter(self.output_file) if self.output_file else None
+
+        results = imap_ordered(
+            partial(validate_chunk, self.language_code, self.near_dup_threshold, output is not None),
+            iter_chunks(files, self.chunk_size),
+            max_workers=self.workers,
+            processes=self.workers > 1,
+        )
+        try:
+            for result in results:
+                path, start = result["path"], result["start"]
+                if "load_error" in result:
+                    self.report_error(path, start, f"Error loading file: {result['load_error']}")
+                    continue
+                bad = set()
+                previews = result["previews"]
+                for idx, message in result["errors"]:
+                    self.report_error(path, idx, message, previews[idx - start])
+                    bad.add(idx)
+                for idx, field in result["spurious"]:
+                    spurious_fields[field] += 1
+                    if self.report == "full":
+                        print(f"{path}:{idx}: warning: spurious field '{field}' removed")
+                signatures = result["signatures"]
+                for offset, digest in enumerate(result["digests"]):
+                    idx = start + offset
+                    entries += 1
+                    if digest is None:
+                        continue
+                    if digest in seen:
+                        first = seen[digest]
+                        first_path, first_idx = files[first >> 32], first & 0xFFFFFFFF
+                        self.report_error(path, idx, f"Duplicate of entry {first_idx} of {first_path}.", previews[offset])
+                        continue
+                    seen[digest] = file_numbers[path] << 32 | idx
+                    if self.near_dup_index is not None:
+                        self.near_dup_index.add_signature((path, idx), signatures[offset], previews[offset])
+                    if output is not None and idx not in bad:
+                        output.write(result["entries"][offset])
+                        written += 1
+        finally:
+            if output is not None:
+                output.close()
+
+        error_count = len(self.error_report)
+        self.error_report.print_summary()
+        self.error_report.close()
+        self.console.print(f"[cyan]Checked {entries} entries from {len(files)} files: {error_count} errors.[/cyan]")
+        if spurious_fields:
+            fields = ", ".join(f"{field} ({count})" for field, count in spurious_fields.most_common())
+            self.console.print(f"[yellow]Spurious fields found and removed: {fields}[/yellow]")
+        if output is not None:
+            self.console.print(f"Valid entries saved to [green]{self.output_file}[/green] ({written} entries)")
+        if self.near_dup_index is not None:
+            print_near_duplicates(self.console, self.near_dup_index.clusters())
+        return error_count == 0
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='JSON Evaluator')
-    parser.add_argument('--json_file', type=str, help='Path to the JSON file to evaluate', required=True)
+    parser.add_argument('--json_file', type=str, nargs='+', help='Path to the JSON file(s) to evaluate')
+    parser.add_argument('--input', type=str, nargs='+', help='Directories or glob patterns of JSON/JSONL files, streamed and validated in one pass over the whole corpus')
     parser.add_argument('--purge_error_entries', action='store_true', help='Remove entries with errors')
     parser.add_argument('--language_code', type=str, help='Language code for the dataset', required=True)
+    parser.add_argument('--near_dup_threshold', type=float, default=0.8, help='Similarity above which questions are reported as near duplicates, across all the files (0 disables the check)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes validating entries (--input mode)')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='Entries sent to a worker at a time (--input mode)')
+    parser.add_argument('--output_file', type=str, default=None, help='File (.jsonl, .json, .parquet or .arrow) receiving the cleaned entries without errors (--input mode)')
+    parser.add_argument('--report', choices=['summary', 'full'], default='summary', help='summary: error counts by type and file with a few examples; full: render every error')
+    parser.add_argument('--top_n', type=int, default=5, help='Examples shown per error type in the summary')
+    parser.add_argument('--error_file', type=str, default=None, help='Export every error to this .jsonl or .csv file')
     args = parser.parse_args()
+    if not args.json_file and not args.input:
+        parser.error('one of --json_file or --input is required')
 
     console = Console()
+    error_report = ErrorReport(console, top_n=args.top_n, export_file=args.error_file)
+
+    if args.input:
+        evaluator = CorpusEvaluator(args.input, language_code=args.language_code, workers=args.workers, chunk_size=args.chunk_size, near_dup_threshold=args.near_dup_threshold, output_file=args.output_file, report=args.report, error_report=error_report)
+        sys.exit(0 if evaluator.run() else 1)
+
     console.print(Rule(title="Starting Evaluation!", style="bold green"))
-    console.print(f"JSON file: [cyan]{args.json_file}[/cyan]")
+    console.print(f"JSON file: [cyan]{', '.join(args.json_file)}[/cyan]")
     console.print(f"Should entries with errors simply be purged?: [cyan]{args.purge_error_entries}[/cyan]")
     console.print(f"Language code: [cyan]{args.language_code}[/cyan]")
-    evaluator = JSONEvaluator(json_file=args.json_file, purge_error_entries=args.purge_error_entries, language_code=args.language_code)
-    evaluator.run_all_checks()
+    near_dup_index = NearDuplicateIndex(threshold=args.near_dup_threshold) if args.near_dup_threshold else None
+    evaluator = None
+    for json_file in args.json_file:
+        evaluator = JSONEvaluator(json_file=json_file, purge_error_entries=args.purge_error_entries, language_code=args.language_code, near_dup_index=near_dup_index, report=args.report, error_report=error_report)
+        evaluator.run_all_checks()
+    error_report.print_summary()
+    error_report.close()
+    if near_dup_index is not None:
+        evaluator.report_near_duplicates(near_dup_index.clusters())
@@ -0,0 +1,334 @@
+"""
+Reading and writing MCQ datasets as JSON, JSONL, Parquet or Arrow IPC, the
+format being chosen by the file extension (.json, .jsonl, .parquet, .arrow or
+.feather).
+
+Parquet and Arrow files share a fixed schema with one column per key of
+JSONEvaluator.schema in dataset_checker.py. Keys that are not in the schema,
+values that do not fit their column (e.g. an int answer before
+answer_int_to_str.py) and explicit nulls are kept as JSON in an "extra"
+column and restored on reading, so converting between formats loses nothing.
+An int original_question_num is stored as a str in its column, for tools
+reading the columns directly, and as an int in "extra". Readers that only
+load COLUMNS (e.g. Dataset.from_parquet) miss what is in "extra", see
+extra_count.
+
+Writers append one row group (Parquet) or record batch (Arrow) every
+`row_group_size` entries, so a stage never holds more than that in memory.
+Arrow files are read through a memory map without copying, Parquet files are
+read column by column.
+
+Usage (convert a dataset, e.g. the merged corpus, and compare the two files):
+    python dataset_io.py merged_dataset.json merged_dataset.parquet
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+STRING_FIELDS = [
+    "language", "country", "file_name", "source", "license", "level",
+    "category_en", "category_original_lang", "original_question_num", "question",
+]
+COLUMNS = STRING_FIELDS + ["options", "answer"]
+
+SCHEMA = pa.schema(
+    [(name, pa.string()) for name in STRING_FIELDS]
+    + [("options", pa.list_(pa.string())), ("answer", pa.string()), ("extra", pa.string())]
+)
+
+FORMATS = {
+    ".json": "json",
+    ".jsonl": "jsonl",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+
+
+def dataset_format(path):
+    """
+    return: str, "json", "jsonl", "parquet" or "arrow"
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported dataset file {path}: use one of {', '.join(FORMATS)}")
+    return FORMATS[extension]
+
+
+def _fits(key, value):
+    if key == "options":
+        return isinstance(value, list) and all(isinstance(option, str) for option in value)
+    return isinstance(value, str)
+
+
+def entries_to_table(entries):
+    """
+    Converts a list of entry dicts to a pyarrow Table with SCHEMA.
+    """
+    columns = {name: [] for name in COLUMNS}
+    extras = []
+    for entry in entries:
+        extra = {}
+        for name in COLUMNS:
+            value = entry.get(name)
+            if value is None and name in entry:
+                # an explicit null, not a missing key
+                extra[name] = None
+            if name == "original_question_num" and isinstance(value, int) and not isinstance(value, bool):
+                extra[name] = value
+                value = str(value)
+            elif value is not None and not _fits(name, value):
+                extra[name] = value
+                value = None
+            columns[name].append(value)
+        for key, value in entry.items():
+            if key not in columns:
+                extra[key] = value
+        extras.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    columns["extra"] = extras
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+
+def table_to_entries(table):
+    """
+    Converts a Table (or RecordBatch) with SCHEMA back to entry dicts. Keys
+    that were missing (null columns) are left out, explicit nulls and values
+    kept in "extra" are restored.
+    """
+    entries = []
+    for row in table.to_pylist():
+        extra = row.pop("extra", None)
+        entry = {key: value for key, value in row.items() if value is not None}
+        if extra:
+            entry.update(json.loads(extra))
+        entries.append(entry)
+    return entries
+
+
+class DatasetWriter:
+    """
+    Writes entries to a dataset file as they come. The file is written under
+    a temporary name and moved into place by close(), so readers never see a
+    partial dataset.
+
+    Usage:
+        with DatasetWriter("merged.parquet") as writer:
+            for entry in entries:
+                writer.write(entry)
+    """
+
+    def __init__(self, path, row_group_size=10000, indent=2):
+        """
+        :param path: str, output file, its extension picks the format
+        :param row_group_size: int, entries per Parquet row group / Arrow batch
+        :param indent: int, indentation of JSON files
+        """
+        self.path = path
+        self.format = dataset_format(path)
+        self.row_group_size = row_group_size
+        self.indent = indent
+        self.count = 0
+        self.buffer = []
+        self.tmp_path = f"{path}.tmp"
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.file = None
+        self.writer = None
+        if self.format == "parquet":
+            self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression="zstd")
+        elif self.format == "arrow":
+            self.file = pa.OSFile(self.tmp_path, "wb")
+            self.writer = ipc.new_file(self.file, SCHEMA)
+        else:
+            self.file = open(self.tmp_path, "w", encoding="utf-8")
+
+    def write(self, entry):
+        if self.format == "json":
+            # the same layout as json.dump(entries, f, indent=indent)
+            text = json.dumps(entry, ensure_ascii=False, indent=self.indent)
+            prefix = "[\n" if self.count == 0 else ",\n"
+            padding = " " * self.indent
+            self.file.write(prefix + padding + text.replace("\n", "\n" + padding))
+        elif self.format == "jsonl":
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        else:
+            self.buffer.append(entry)
+            if len(self.buffer) >= self.row_group_size:
+                self.flush()
+        self.count += 1
+
+    def write_all(self, entries):
+        for entry in entries:
+            self.write(entry)
+
+    def flush(self):
+        if self.buffer:
+            self.writer.write_table(entries_to_table(self.buffer))
+            self.buffer = []
+
+    def close(self):
+        if self.format == "json":
+            self.file.write("\n]" if self.count else "[]")
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep the previous version of the file rather than a partial one
+            if self.writer is not None:
+                self.writer.close()
+            if self.file is not None:
+                self.file.close()
+            os.remove(self.tmp_path)
+
+
+def entry_digest(entry):
+    """
+    Compact key of the exact-duplicate check: the question and its options.
+    """
+    options = entry.get("options") or []
+    if not isinstance(options, list):
+        options = [options]
+    key = json.dumps([str(entry.get("question", "")).strip(), [str(opt).strip() for opt in options]], ensure_ascii=False)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def write_dataset(path, entries, **kwargs):
+    """
+    Writes a list of entries to `path`.
+
+    return: int, number of entries written
+    """
+    with DatasetWriter(path, **kwargs) as writer:
+        writer.write_all(entries)
+    return writer.count
+
+
+def read_table(path, columns=None):
+    """
+    Reads a dataset file as a pyarrow Table. Arrow files are memory-mapped,
+    so the columns are not copied.
+
+    :param columns: list of str, read only these columns (Parquet and Arrow)
+    """
+    file_format = dataset_format(path)
+    if file_format == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True)
+    if file_format == "arrow":
+        table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+        return table.select(columns) if columns else table
+    table = entries_to_table(read_dataset(path))
+    return table.select(columns) if columns else table
+
+
+def extra_count(path):
+    """
+    Number of the rows of a Parquet or Arrow file with something in the
+    "extra" column, i.e. rows that a reader of COLUMNS alone would not get
+    back as they were written. Parquet files are answered from the row group
+    statistics when they have them.
+
+    return: int
+    """
+    if dataset_format(path) == "parquet":
+        metadata = pq.ParquetFile(path).metadata
+        index = metadata.schema.names.index("extra")
+        count = 0
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            statistics = row_group.column(index).statistics
+            if statistics is None or not statistics.has_null_count:
+                return read_table(path, columns=["extra"]).column("extra").drop_null().length()
+            count += row_group.num_rows - statistics.null_count
+        return count
+    return read_table(path, columns=["extra"]).column("extra").drop_null().length()
+
+
+def iter_dataset(path, batch_size=10000):
+    """
+    Streams the entries of a dataset file: a row group or batch at a time
+    for Parquet and Arrow files, an entry at a time for JSON and JSONL.
+    """
+    file_format = dataset_format(path)
+    if file_format == "parquet":
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size):
+            yield from table_to_entries(batch)
+    elif file_format == "arrow":
+        reader = ipc.open_file(pa.memory_map(path, "r"))
+        for i in range(reader.num_record_batches):
+            yield from table_to_entries(reader.get_batch(i))
+    elif file_format == "jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        try:
+            import ijson
+        except ImportError:
+            # no incremental parser available, fall back to loading the file
+            yield from read_dataset(path)
+            return
+        # JSON arrays are parsed incrementally, one entry at a time
+        with open(path, "rb") as f:
+            # ijson finds no "item" in anything but an array, and would
+            # silently yield nothing
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            if first != b"[":
+                raise ValueError(f"File {path}: JSON should be a list of entries.")
+            f.seek(0)
+            yield from ijson.items(f, "item", use_float=True)
+
+
+def read_dataset(path):
+    """
+    return: list of entry dicts
+    """
+    if dataset_format(path) == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"File {path}: JSON should be a list of entries.")
+        return data
+    return list(iter_dataset(path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python dataset_io.py <input dataset> <output dataset>")
+        sys.exit(1)
+
+    input_file, output_file = sys.argv[1:]
+    count = write_dataset(output_file, iter_dataset(input_file))
+    print(f"Converted {count} entries: {input_file} -> {output_file}")
+
+    for path in (input_file, output_file):
+        start = time.perf_counter()
+        if dataset_format(path) in ("parquet", "arrow"):
+            rows = read_table(path).num_rows
+        else:
+            rows = len(read_dataset(path))
+        print(
+            f"{path}: {os.path.getsize(path) / 1e6:.1f} MB, "
+            f"{rows} entries loaded in {time.perf_counter() - start:.3f} s"
+        )
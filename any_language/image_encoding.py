@@ -0,0 +1,195 @@
+import base64
+import io
+import math
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+from PIL import Image
+
+
+def encode_bytes(data):
+    """
+    Base64-encodes raw image bytes for a data URL.
+    """
+    return base64.b64encode(data).decode("utf-8")
+
+
+def pil_to_bytes(image, format="PNG", **save_args):
+    """
+    Serialises a PIL image in memory, without going through the disk.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **save_args)
+    return buffer.getvalue()
+
+
+def encode_pil_image(image, format="PNG", **save_args):
+    """
+    Encodes a PIL image straight to base64 through an in-memory buffer.
+    """
+    return encode_bytes(pil_to_bytes(image, format, **save_args))
+
+
+class ImageWriter:
+    """
+    Persists page images on a background thread, so saving them for debugging
+    does not slow down the requests. At most `max_pending` images wait in the
+    queue; save() blocks beyond that to keep memory bounded.
+    """
+
+    def __init__(self, max_pending=16):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.slots = BoundedSemaphore(max_pending)
+
+    def save(self, image, path, format="PNG"):
+        """
+        Queues `image` (a PIL image or already encoded bytes) to be written to `path`.
+        """
+        self.slots.acquire()
+        future = self.executor.submit(self._write, image, path, format)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self.slots.release()
+        if future.exception() is not None:
+            print(f"Failed to save page image: {future.exception()}")
+
+    @staticmethod
+    def _write(image, path, format):
+        if isinstance(image, bytes):
+            with open(path, "wb") as image_file:
+                image_file.write(image)
+        else:
+            image.save(path, format)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+IMAGE_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ImageOptions(
+    namedtuple(
+        "ImageOptions",
+        ["max_edge", "grayscale", "format", "quality", "detail"],
+        defaults=[None, False, "PNG", 75, "auto"],
+    )
+):
+    """
+    How page images are prepared before they are sent to a vision model.
+
+    max_edge: int or None, downscale so the long edge is at most this many
+        pixels. gpt-4o fits high-detail images into 2048x2048 and bills them
+        by 512px tiles of a 768px-short-side copy, so larger pages only cost
+        upload time. Resampled PNGs compress worse; pair it with JPEG/WebP.
+    grayscale: bool, drop the colour channels
+    format: "PNG", "JPEG" or "WEBP"
+    quality: int, JPEG/WebP quality; 75 is the PIL default for JPEG, which
+        the pages were saved with before
+    detail: "auto", "low" or "high", the image detail level of the API
+    """
+
+
+def prepare_image(image, options=ImageOptions()):
+    """
+    Resizes, converts and encodes a PIL image according to `options`.
+
+    :param image: PIL.Image
+    :param options: ImageOptions
+    return: tuple, (encoded bytes, mime type)
+    """
+    format = options.format.upper()
+    if format == "JPG":
+        format = "JPEG"
+    if format not in IMAGE_MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {options.format}")
+
+    if options.max_edge and max(image.size) > options.max_edge:
+        scale = options.max_edge / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+
+    if options.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    save_args = {}
+    if format != "PNG":
+        save_args["quality"] = options.quality
+    return pil_to_bytes(image, format, **save_args), IMAGE_MIME_TYPES[format]
+
+
+def image_message(image, options=ImageOptions()):
+    """
+    Builds the image_url part of a chat message for a PIL image.
+    """
+    data, mime = prepare_image(image, options)
+    image_url = {"url": f"data:{mime};base64,{encode_bytes(data)}"}
+    if options.detail and options.detail != "auto":
+        image_url["detail"] = options.detail
+    return {"type": "image_url", "image_url": image_url}
+
+
+def estimate_image_tokens(width, height, detail="auto"):
+    """
+    Image tokens billed by gpt-4o for a width x height image: 85 base tokens
+    plus 170 per 512px tile after the image is fitted into 2048x2048 and its
+    short side scaled down to 768px.
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def add_image_arguments(parser, default_format="PNG"):
+    """
+    Adds the image preparation options to an argparse parser.
+    """
+    parser.add_argument(
+        "--max_edge",
+        type=int,
+        default=0,
+        help="Downscale page images so the long edge is at most this many pixels (default 0 keeps the size)",
+    )
+    parser.add_argument(
+        "--grayscale", action="store_true", help="Send page images in grayscale"
+    )
+    parser.add_argument(
+        "--image_format",
+        choices=["PNG", "JPEG", "WEBP"],
+        type=str.upper,
+        default=default_format,
+        help="Encoding of the page images sent to the API",
+    )
+    parser.add_argument(
+        "--image_quality", type=int, default=75, help="JPEG/WebP quality"
+    )
+    parser.add_argument(
+        "--detail",
+        choices=["auto", "low", "high"],
+        default="auto",
+        help="Image detail level requested from the API",
+    )
+
+
+def image_options_from_args(args):
+    return ImageOptions(
+        max_edge=args.max_edge or None,
+        grayscale=args.grayscale,
+        format=args.image_format,
+        quality=args.image_quality,
+        detail=args.detail,
+    )
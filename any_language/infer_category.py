@@ -1,10 +1,53 @@
 import os
+import sys
+import argparse
 import openai
 import json
 import re
 import time
+import tqdm
+from functools import partial
+from openai import (
+    APITimeoutError,
+    APIConnectionError,
+    RateLimitError,
+    InternalServerError,
+)
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from category_classifier import LocalClassifier, load_labelled
+from page_executor import imap_ordered
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+
+client = openai.OpenAI(api_key='<enter your key>')
+
+CATEGORIES = {
+    "Physics": "భౌతిక శాస్త్రం",
+    "Civics": "పౌరశాస్త్రం",
+    "History": "చరిత్ర",
+    "Biology": "జీవవిజ్ఞానం",
+    "Reasoning": "తార్కికత",
+    "Telugu Language and Literature": "తెలుగు భాష మరియు సాహిత్యం",
+    "Mathematics": "గణితం",
+    "Economics": "ఆర్థిక శాస్త్రం",
+    "Political Science": "రాజకీయ శాస్త్రం",
+    "Current Affairs": "ప్రస్తుత వ్యవహారాలు",
+    "Geography": "భూగోళశాస్త్రం",
+    "Chemistry": "రసాయన శాస్త్రం"
+}
+
+pre_prompt = """Please infer english category of question, as well as category in Telugu language and they should be within <category_en> </category_en> and <category_original_lang> </category_original_lang> tags respectively.
+                Category has to be from:
+                categories = """ + json.dumps(CATEGORIES, ensure_ascii=False, indent=4) + """
+                Pack the answer for every question into:
+                <question_num> </question_num>
+                <category_en> </category_en>
+                <category_original_lang> </category_original_lang>
+                """
+
+# completion tokens allowed per question of a packed request
+TOKENS_PER_ANSWER = 40
 
-client = openai.OpenAI(api_key='<enter your key'>)
 def parse_gpt_output_batch(response):
     category_en_pattern = re.compile(r"<category_en>(.*?)</category_en>", re.DOTALL)
     category_original_lang_pattern = re.compile(r"<category_original_lang>(.*?)</category_original_lang>", re.DOTALL)
@@ -14,57 +57,246 @@ def parse_gpt_output_batch(response):
 
     return list(zip(category_en_matches, category_original_lang_matches))
 
-def classify_questions_batch(questions_batch, language, max_retries=3):
-    """Classify a batch of questions using OpenAI's API."""
+def parse_numbered_output(response, num_questions):
+    """
+    Matches the categories of a packed response to the question numbers they
+    were given for, so that a missing or malformed answer only affects its
+    own question. Falls back to the order of the answers when the model left
+    out the question numbers but answered every question.
 
-    pre_prompt = """Please infer english category of question, as well as category in Telugu language and they should be within <category_en> </category_en> and <category_original_lang> </category_original_lang> tags respectively.
-                Category has to be from:
-                categories = {
-                    "Physics": "భౌతిక శాస్త్రం",
-                    "Civics": "పౌరశాస్త్రం",
-                    "History": "చరిత్ర",
-                    "Biology": "జీవవిజ్ఞానం",
-                    "Reasoning": "తార్కికత",
-                    "Telugu Language and Literature": "తెలుగు భాష మరియు సాహిత్యం",
-                    "Mathematics": "గణితం",
-                    "Economics": "ఆర్థిక శాస్త్రం",
-                    "Political Science": "రాజకీయ శాస్త్రం",
-                    "Current Affairs": "ప్రస్తుత వ్యవహారాలు",
-                    "Geography": "భూగోళశాస్త్రం",
-                    "Chemistry": "రసాయన శాస్త్రం"
-                }
-                Pack the answer into:
-                <category_en> </category_en>
-                <category_original_lang> </category_original_lang>
-                <question_num> </question_num>
-                """
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            batch_prompt = pre_prompt
-            for idx, item in enumerate(questions_batch):
-                question = item["question"]
-                options = item["options"]
-                batch_prompt += f"Question {idx+1}: {question}\nOptions: {', '.join(options)}\n"        
-        
-            messages = [{"role": "system", "content": batch_prompt}]
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.1
-            )
-            response_text = response.choices[0].message.content.strip()
-            return parse_gpt_output_batch(response_text)
+    return: dict, 0-based position in the request -> (category_en, category_original_lang)
+    """
+    tag_pattern = re.compile(
+        r"<(question_num|category_en|category_original_lang)>(.*?)</\1>", re.DOTALL
+    )
+    answers = []
+    current = {}
+    for tag, value in tag_pattern.findall(response):
+        # a tag seen twice means the next answer has started
+        if tag in current:
+            answers.append(current)
+            current = {}
+        current[tag] = value.strip()
+    if current:
+        answers.append(current)
+
+    results = {}
+    for answer in answers:
+        num = re.sub(r"\D", "", answer.get("question_num", ""))
+        category_en = answer.get("category_en")
+        category_original_lang = answer.get("category_original_lang")
+        if num and category_en and category_original_lang and 1 <= int(num) <= num_questions:
+            results[int(num) - 1] = (category_en, category_original_lang)
+
+    if not results:
+        pairs = parse_gpt_output_batch(response)
+        if len(pairs) == num_questions:
+            results = {
+                i: (en.strip(), orig.strip())
+                for i, (en, orig) in enumerate(pairs)
+                if en.strip() and orig.strip()
+            }
+    return results
+
+def question_tokens(item):
+    """Rough prompt tokens taken by one question of a packed request."""
+    text = f"Question 000: {item['question']}\nOptions: {', '.join(item['options'])}\n"
+    return len(text) // 4 + 1
+
+def pack_questions(ids, json_list, token_budget=3000, max_questions=40):
+    """
+    Groups question indices into requests holding as many questions as fit in
+    `token_budget` prompt tokens (and at most `max_questions`), instead of a
+    fixed number of questions per request.
+
+    :param ids: list of int, indices into json_list
+    return: list of lists of indices
+    """
+    budget = token_budget - len(pre_prompt) // 4
+    packs, pack, used = [], [], 0
+    for idx in ids:
+        tokens = question_tokens(json_list[idx])
+        if pack and (used + tokens > budget or len(pack) >= max_questions):
+            packs.append(pack)
+            pack, used = [], 0
+        pack.append(idx)
+        used += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+def classify_questions_batch(questions_batch, language):
+    """
+    Classify a batch of questions with a single call to OpenAI's API.
+
+    return: dict, 0-based position in the batch -> (category_en, category_original_lang)
+    """
+    batch_prompt = pre_prompt
+    for idx, item in enumerate(questions_batch):
+        question = item["question"]
+        options = item["options"]
+        batch_prompt += f"Question {idx+1}: {question}\nOptions: {', '.join(options)}\n"
 
+    messages = [{"role": "system", "content": batch_prompt}]
+    model_args = {
+        "max_tokens": max(1000, TOKENS_PER_ANSWER * len(questions_batch)),
+        "temperature": 0.1,
+    }
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args["max_tokens"])
+
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model="gpt-4o-mini", messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
+            APITimeoutError,
+            APIConnectionError,
+            RateLimitError,
+            InternalServerError,
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    response_text = response.choices[0].message.content.strip()
+    return parse_numbered_output(response_text, len(questions_batch))
+
+def classify_pack(json_list, language, max_retries, pack):
+    """
+    Classifies the questions of a packed request. When some answers are
+    missing or cannot be parsed, only those questions are sent again.
+
+    :param pack: list of int, indices into json_list
+    return: tuple, (pack, dict index -> (category_en, category_original_lang))
+    """
+    results = {}
+    pending = list(pack)
+    for retry in range(max_retries):
+        try:
+            classified = classify_questions_batch([json_list[idx] for idx in pending], language)
         except (openai.OpenAIError, KeyError, ValueError, IndexError) as e:
-            retry_count += 1
-            print(f"Error: {str(e)}. Retrying... ({retry_count}/{max_retries})")
+            print(f"Error: {str(e)}. Retrying... ({retry+1}/{max_retries})")
             time.sleep(1)
-        return []
-        
+            continue
+        for position, categories in classified.items():
+            results[pending[position]] = categories
+        pending = [idx for idx in pending if idx not in results]
+        if not pending:
+            break
+        print(f"{len(pending)} questions unparsed, retrying them ({retry+1}/{max_retries})")
+    return pack, results
+
+class CheckpointLog:
+    """
+    Append-only JSONL log of the classified questions, one line per question
+    with its index in the input file and its categories. Appending a batch
+    costs a few hundred bytes, where rewriting the whole output file after
+    every batch made the run quadratic in the number of questions.
+
+    fsync_every sets the durability policy: the log is fsynced after that many
+    appended batches (1 after every batch, 0 leaves it to the OS). A line cut short by
+    a crash is ignored on resume, so at worst that batch is classified again.
+    """
+
+    def __init__(self, path, fsync_every=1):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.pending_batches = 0
+        self.file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def read(path):
+        """
+        Returns the records of an existing log, keyed by question index.
+        """
+        records = {}
+        if not os.path.exists(path):
+            return records
+        with open(path, "r", encoding="utf-8") as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["idx"]] = record
+        return records
+
+    def append(self, records):
+        self.file.write(
+            "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        )
+        self.file.flush()
+        self.pending_batches += 1
+        if self.fsync_every and self.pending_batches >= self.fsync_every:
+            os.fsync(self.file.fileno())
+            self.pending_batches = 0
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
 
-def process_json_file(input_file, output_file, language, batch_size=5, max_retries=3):
+def compact(json_list, output_file):
+    """
+    Writes the final output in the target format (an indented JSON list),
+    through a temporary file so an interrupted write never loses the output.
+    """
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as outfile:
+        json.dump(json_list, outfile, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, output_file)
+
+
+def process_json_file(
+    input_file,
+    output_file,
+    language,
+    batch_size=40,
+    max_retries=3,
+    checkpoint_file=None,
+    fsync_every=1,
+    token_budget=3000,
+    workers=8,
+    local=False,
+    labelled_files=None,
+    local_threshold=0.5,
+):
+    """
+    Classifies the questions of input_file and writes them, with their
+    categories, to output_file.
+
+    Questions are packed into requests up to `token_budget` prompt tokens (at
+    most `batch_size` questions each) and `workers` requests run at the same
+    time, within the shared OpenAI rate limits.
+
+    Progress goes to an append-only checkpoint log (output_file +
+    ".checkpoint.jsonl" by default). A restarted run skips the questions
+    found in the log, and the output file is written once, at the end. The
+    log is removed when every question has been classified.
+
+    :param batch_size: int, maximum number of questions per request
+    :param checkpoint_file: str, path of the checkpoint log
+    :param fsync_every: int, fsync the log after this many requests (0: never)
+    :param token_budget: int, prompt tokens per packed request
+    :param workers: int, number of requests in flight
+    :param local: bool, label the questions the local classifier is confident
+        about without calling the API. Off by default: its keywords only
+        cover four subjects in English and Hindi, so check its precision on
+        labelled questions first (category_classifier.py --labelled)
+    :param labelled_files: list of str, JSON files of already labelled
+        questions to train the local classifier on, in addition to the API
+        answers recorded in the checkpoint log
+    :param local_threshold: float, minimum confidence of the n-gram classifier
+    """
     with open(input_file, "r", encoding="utf-8") as file:
         try:
             json_list = json.load(file)
@@ -72,62 +304,116 @@ def process_json_file(input_file, output_file, language, batch_size=5, max_retri
             print("Failed to decode JSON")
             return
 
-    if os.path.exists(output_file):
-        with open(output_file, "r", encoding="utf-8") as outfile:
-            try:
-                updated_json_list = json.load(outfile)
-                processed_items = len(updated_json_list)
-                print(f"Resuming from item {processed_items}...")
-            except json.JSONDecodeError:
-                print("Failed to decode JSON from output file. Starting from scratch.")
-                updated_json_list = []
-                processed_items = 0
+    checkpoint_file = checkpoint_file or output_file + ".checkpoint.jsonl"
+    processed = CheckpointLog.read(checkpoint_file)
+    for idx, record in processed.items():
+        if idx < len(json_list):
+            json_list[idx]["category_en"] = record["category_en"]
+            json_list[idx]["category_original_lang"] = record["category_original_lang"]
+    if processed:
+        print(f"Resuming: {len(processed)} questions already classified...")
+
+    remaining = [idx for idx in range(len(json_list)) if idx not in processed]
+
+    log = CheckpointLog(checkpoint_file, fsync_every)
+    if local and remaining:
+        # Fast path: questions the local classifier is sure about skip the API
+        classifier = LocalClassifier(CATEGORIES, threshold=local_threshold)
+        training = load_labelled(labelled_files or [])
+        training.extend(
+            json_list[idx]
+            for idx, record in processed.items()
+            if record.get("classifier") != "local" and idx < len(json_list)
+        )
+        classifier.fit(training)
+
+        records = []
+        for idx in remaining:
+            category_en = classifier.predict(json_list[idx])
+            if category_en is None:
+                continue
+            json_list[idx]["category_en"] = category_en
+            json_list[idx]["category_original_lang"] = CATEGORIES[category_en]
+            records.append(
+                {
+                    "idx": idx,
+                    "category_en": category_en,
+                    "category_original_lang": CATEGORIES[category_en],
+                    "classifier": "local",
+                }
+            )
+        if records:
+            log.append(records)
+            processed.update(dict.fromkeys(record["idx"] for record in records))
+            remaining = [idx for idx in remaining if idx not in processed]
+        print(f"Classified {len(records)} questions locally, {len(remaining)} left for the API")
+
+    packs = pack_questions(remaining, json_list, token_budget, batch_size)
+    results = imap_ordered(
+        partial(classify_pack, json_list, language, max_retries),
+        packs,
+        max_workers=workers,
+    )
+    with tqdm.tqdm(total=len(remaining)) as progress:
+        for pack, classified in results:
+            records = []
+            for idx in pack:
+                if idx not in classified:
+                    continue
+                category_en, category_original_lang = classified[idx]
+                json_list[idx]["category_en"] = category_en
+                json_list[idx]["category_original_lang"] = category_original_lang
+                records.append(
+                    {
+                        "idx": idx,
+                        "category_en": category_en,
+                        "category_original_lang": category_original_lang,
+                        "classifier": "llm",
+                    }
+                )
+            if records:
+                log.append(records)
+            processed.update(dict.fromkeys(classified))
+            progress.update(len(pack))
+    log.close()
+
+    # Compact the log into the target format
+    compact(json_list, output_file)
+    missing = len(json_list) - len(processed)
+    if missing:
+        print(f"{missing} questions could not be classified; re-run to retry them.")
     else:
-        updated_json_list = []
-        processed_items = 0
-
-    total_batches = len(json_list) // batch_size + (1 if len(json_list) % batch_size != 0 else 0)
-
-    for batch_idx in tqdm.tqdm(range(processed_items // batch_size, total_batches)):
-        start_idx = batch_idx * batch_size
-        end_idx = min(start_idx + batch_size, len(json_list))
-        batch = json_list[start_idx:end_idx]
-        
-        for retry in range(max_retries):
-            try:
-                classifications = classify_questions_batch(batch, language)
-
-                if classifications and len(classifications) == len(batch):
-                    for i, (category_en, category_original_lang) in enumerate(classifications):
-                        if not category_en or not category_original_lang:
-                            raise ValueError(f"Empty category found in question {batch[i]['question']}")
-
-                        batch[i]["category_en"] = category_en
-                        batch[i]["category_original_lang"] = category_original_lang
-                    break
-                else:
-                    raise ValueError("Mismatch between batch size and classifications.")
-            except Exception as e:
-                print(f"Error on batch {batch_idx+1}, retry {retry+1}/{max_retries}: {e}")
-                if retry == max_retries - 1:
-                    print("Max retries reached. Moving to the next batch.")
-                    return
-
-        updated_json_list.extend(batch)
-        #print(f"Batch {batch_idx+1} processed. Total processed so far: {len(updated_json_list)}")
-
-        # Dump the current state to the output file after each successful batch
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            json.dump(updated_json_list, outfile, ensure_ascii=False, indent=4)
-        #print(f"Progress saved. Updated JSON saved to {output_file} after batch {batch_idx+1}.")
-
-    print("Finished processing all batches.")
+        os.remove(checkpoint_file)
+    print(f"Finished processing all batches. Output saved to {output_file}")
     
 if __name__ == "__main__":
-    exam_name = 'exam-name'
-    input_file = f"{exam_name}.json"
-    output_file = f"{exam_name}.json"
-    language = "Telugu"
-    batch_size = 15 
-    process_json_file(input_file, output_file, language, batch_size=1)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exam_name", default="exam-name", help="Classifies <exam_name>.json in place")
+    parser.add_argument("--language", default="Telugu")
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Label the questions the local classifier is sure about without the API",
+    )
+    parser.add_argument(
+        "--labelled", nargs="*", default=None, help="Labelled JSON files to train the local classifier on"
+    )
+    parser.add_argument(
+        "--local_threshold", type=float, default=0.5, help="Minimum n-gram confidence of the local classifier"
+    )
+    args = parser.parse_args()
 
+    input_file = f"{args.exam_name}.json"
+    output_file = f"{args.exam_name}.json"
+    batch_size = 40
+    process_json_file(
+        input_file,
+        output_file,
+        args.language,
+        batch_size=batch_size,
+        token_budget=3000,
+        workers=8,
+        local=args.local,
+        labelled_files=args.labelled,
+        local_threshold=args.local_threshold,
+    )
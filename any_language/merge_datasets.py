@@ -0,0 +1,225 @@
+"""
+Streaming merge of many dataset files (JSON, JSONL, Parquet or Arrow, see
+dataset_io.py) into one, without loading them into memory.
+
+Entries flow one at a time from the inputs to the output:
+- without an ordering key, the files are concatenated in the given order;
+- with a key (e.g. original_question_num), every file is expected to be
+  sorted by it and the files are k-way merged with a heap, so the output is
+  sorted as well. Numeric values sort as numbers, before text values.
+
+With workers > 1, up to `workers` files at a time are parsed in worker
+processes that send batches of `batch_size` entries through bounded queues, so
+parsing runs in parallel with the merge while each source holds at most two
+batches. The k-way merge reads every file at once: the `workers` largest are
+parsed in worker processes and the others in the merging process. Exact duplicates (same
+question and options, see dataset_io.entry_digest) can be dropped on the fly;
+this keeps a 16-byte digest per distinct entry, not the entries.
+
+Usage:
+    python merge_datasets.py checked/*.json -o merged_dataset.parquet --dedup --workers 4
+"""
+
+import os
+import sys
+import glob
+import heapq
+import argparse
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from dataset_io import FORMATS, DatasetWriter, entry_digest, iter_dataset
+
+_DONE = "__done__"
+
+
+def expand_inputs(patterns):
+    """
+    Expands directories (not recursively) and glob patterns into the dataset
+    files they contain, keeping the order of the patterns.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        files.extend(path for path in matches if path.lower().endswith(tuple(FORMATS)) and path not in files)
+    return files
+
+
+def ordering_key(field):
+    """
+    return: function entry -> sortable key of entry[field]; numbers (also
+        as strings, e.g. "12") sort numerically before any other text, and
+        missing values sort last
+    """
+
+    def key(entry):
+        value = entry.get(field)
+        if value is None:
+            return (2, 0, "")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return (0, value, "")
+        text = str(value).strip()
+        try:
+            return (0, float(text), "")
+        except ValueError:
+            return (1, 0, text)
+
+    return key
+
+
+def _read_source(path, batch_size, queue):
+    # worker process: parses a file and sends its entries in batches
+    try:
+        entries = iter_dataset(path)
+        while True:
+            batch = list(islice(entries, batch_size))
+            if not batch:
+                break
+            queue.put(batch)
+        queue.put(_DONE)
+    except Exception as e:
+        queue.put(ValueError(f"Could not read {path}: {e}"))
+
+
+class Source:
+    """
+    The entries of one input file, parsed in the calling process or, when
+    started with parallel=True, in a worker process.
+    """
+
+    def __init__(self, path, batch_size=1000, parallel=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.process = None
+        if parallel:
+            # two batches in flight: one being merged, one being parsed
+            self.queue = multiprocessing.Queue(maxsize=2)
+            self.process = multiprocessing.Process(
+                target=_read_source, args=(path, batch_size, self.queue), daemon=True
+            )
+            self.process.start()
+
+    def __iter__(self):
+        if self.process is None:
+            yield from iter_dataset(self.path)
+            return
+        try:
+            while True:
+                batch = self.queue.get()
+                if isinstance(batch, Exception):
+                    raise batch
+                if batch == _DONE:
+                    break
+                yield from batch
+        finally:
+            self.close()
+
+    def close(self):
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+def iter_concatenated_entries(paths, batch_size=1000, workers=1):
+    """
+    Yields the entries of the files in order. With workers > 1, up to
+    `workers` files are parsed in worker processes ahead of the one being
+    read.
+    """
+    parallel = workers > 1
+    pending = deque()
+    paths = iter(paths)
+    try:
+        while True:
+            while len(pending) < max(1, workers):
+                path = next(paths, None)
+                if path is None:
+                    break
+                pending.append(Source(path, batch_size, parallel))
+            if not pending:
+                return
+            source = pending.popleft()
+            yield from source
+    finally:
+        for source in pending:
+            source.close()
+
+
+def merge_datasets(inputs, output_file, key=None, dedup=False, workers=1, batch_size=1000, transform=None):
+    """
+    Merges dataset files into `output_file`, streaming the entries.
+
+    :param inputs: list of str, files, directories or glob patterns
+    :param output_file: str, .json, .jsonl, .parquet or .arrow
+    :param key: str, field every input is sorted by (None concatenates)
+    :param dedup: bool, drop entries with the question and options of an
+        earlier one
+    :param workers: int, maximum number of worker processes parsing files
+        (1 parses every file in the calling process)
+    :param batch_size: int, entries per batch sent by a worker
+    :param transform: function entry -> entry, or None to drop the entry
+    return: dict with the number of files, entries read, duplicates,
+        dropped and written entries
+    """
+    paths = expand_inputs(inputs)
+    stats = {"files": len(paths), "read": 0, "duplicates": 0, "dropped": 0, "written": 0}
+
+    if key is None:
+        entries = iter_concatenated_entries(paths, batch_size, workers)
+    else:
+        # every file is open at once for the k-way merge: the `workers`
+        # largest get a worker process, the others are parsed inline
+        by_size = sorted(range(len(paths)), key=lambda i: os.path.getsize(paths[i]), reverse=True)
+        parallel = set(by_size[:workers]) if workers > 1 else set()
+        sources = [Source(path, batch_size, parallel=i in parallel) for i, path in enumerate(paths)]
+        entries = heapq.merge(*sources, key=ordering_key(key))
+
+    seen = set()
+    try:
+        with DatasetWriter(output_file) as writer:
+            for entry in entries:
+                stats["read"] += 1
+                if transform is not None:
+                    entry = transform(entry)
+                    if entry is None:
+                        stats["dropped"] += 1
+                        continue
+                if dedup:
+                    digest = entry_digest(entry)
+                    if digest in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(digest)
+                writer.write(entry)
+    finally:
+        if key is None:
+            entries.close()
+        else:
+            for source in sources:
+                source.close()
+    stats["written"] = writer.count
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge dataset files into one, streaming the entries.")
+    parser.add_argument("inputs", nargs="+", help="Files, directories or glob patterns (.json, .jsonl, .parquet, .arrow)")
+    parser.add_argument("-o", "--output_file", required=True, help="Merged dataset, .json, .jsonl, .parquet or .arrow")
+    parser.add_argument("--key", default=None, help="Field the inputs are sorted by, to merge them in order (default: concatenate)")
+    parser.add_argument("--dedup", action="store_true", help="Drop entries with the same question and options as an earlier one")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Maximum number of worker processes parsing files (1: none)")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Entries per batch sent by a worker")
+
+    args = parser.parse_args()
+    stats = merge_datasets(args.inputs, args.output_file, key=args.key, dedup=args.dedup, workers=args.workers, batch_size=args.batch_size)
+    print(
+        f"Merged {stats['read']} entries from {stats['files']} files into {args.output_file}: "
+        f"{stats['written']} written, {stats['duplicates']} duplicates dropped"
+    )
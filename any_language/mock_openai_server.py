@@ -0,0 +1,286 @@
+"""
+Minimal OpenAI-compatible server for testing the extraction scripts offline.
+
+It implements the endpoints the scripts use:
+- POST /v1/chat/completions
+- POST /v1/files, GET /v1/files/{id}, GET /v1/files/{id}/content
+- POST /v1/batches, GET /v1/batches/{id}
+
+Every chat completion returns the same canned reply (see --reply_file), or
+with --echo_after the part of the last user message after a marker, which
+shows whether responses are matched to the right requests. Completions can
+take --latency seconds, plus up to --jitter random seconds so that concurrent
+requests finish out of order. Batches are processed in the background and
+complete after --batch_delay seconds. GET /stats returns the number of
+completions served and the most that were in flight at once.
+
+Usage:
+    python mock_openai_server.py --port 8001
+    OPENAI_BASE_URL=http://localhost:8001/v1 python pdf2mcq.py -k test --mode batch
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = """<question_num>1</question_num>
+<question>Which of the following is a noble gas?</question>
+<choices>
+(1) Oxygen
+(2) Neon
+(3) Nitrogen
+(4) Hydrogen
+</choices>
+<answer>2</answer>
+<image>no</image>
+<context>no</context>
+<category>chemistry</category>"""
+
+
+class MockState:
+    def __init__(self, reply, latency=0.0, batch_delay=1.0, jitter=0.0, echo_after=None):
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.echo_after = echo_after
+        self.batch_delay = batch_delay
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def make_reply(self, messages):
+        if self.echo_after is None:
+            return self.reply
+        content = next(
+            (m.get("content") for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        if isinstance(content, list):
+            content = "\n".join(p.get("text", "") for p in content if isinstance(p, dict))
+        return content.split(self.echo_after)[-1].strip()
+
+    def completion(self, body):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.latency + random.uniform(0, self.jitter)
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        reply = self.make_reply(body.get("messages", []))
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(reply) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def add_file(self, filename, content, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+                "content": content,
+            }
+        return self.file_object(file_id)
+
+    def file_object(self, file_id):
+        return {k: v for k, v in self.files[file_id].items() if k != "content"}
+
+    def add_batch(self, body):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self.run_batch, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def run_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch["request_counts"]["total"] = len(requests)
+        batch["status"] = "in_progress"
+        time.sleep(self.batch_delay)
+
+        output = []
+        for request in requests:
+            output.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "request_id": uuid.uuid4().hex,
+                            "body": self.completion(request["body"]),
+                        },
+                        "error": None,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+            batch["request_counts"]["completed"] += 1
+        output_file = self.add_file(
+            f"{batch_id}_output.jsonl", "\n".join(output).encode("utf-8"), "batch_output"
+        )
+        batch["output_file_id"] = output_file["id"]
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-ratelimit-limit-requests", "10000")
+        self.send_header("x-ratelimit-remaining-requests", "9999")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        body = self.read_body()
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self.send_json(self.state.completion(json.loads(body)))
+        elif path.endswith("/files"):
+            # multipart/form-data with the `file` and `purpose` fields
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            message = BytesParser(policy=HTTP).parsebytes(header + body)
+            fields = {}
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                fields[name] = (part.get_filename(), part.get_payload(decode=True))
+            filename, content = fields["file"]
+            purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+            self.send_json(self.state.add_file(filename, content, purpose))
+        elif path.endswith("/batches"):
+            self.send_json(self.state.add_batch(json.loads(body)))
+        else:
+            self.send_json({"error": {"message": f"Unknown endpoint {path}"}}, 404)
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[-1] == "stats":
+            with self.state.lock:
+                stats = {"requests": self.state.requests, "max_in_flight": self.state.max_in_flight}
+            self.send_json(stats)
+        elif len(parts) >= 3 and parts[-2] == "batches" and parts[-1] in self.state.batches:
+            self.send_json(self.state.batches[parts[-1]])
+        elif len(parts) >= 3 and parts[-2] == "files" and parts[-1] in self.state.files:
+            self.send_json(self.state.file_object(parts[-1]))
+        elif parts[-1] == "content" and parts[-2] in self.state.files:
+            data = self.state.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json({"error": {"message": f"Unknown resource {self.path}"}}, 404)
+
+
+class MockServer(ThreadingHTTPServer):
+    # the default backlog of 5 refuses connections from concurrent clients
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_server(
+    host="127.0.0.1", port=8001, reply=DEFAULT_REPLY, latency=0.0, batch_delay=1.0, jitter=0.0, echo_after=None
+):
+    """
+    Creates the mock server; call serve_forever() on it (e.g. from a thread in tests).
+    """
+    state = MockState(reply, latency, batch_delay, jitter, echo_after)
+    handler = type("Handler", (MockHandler,), {"state": state})
+    return MockServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--reply_file", default=None, help="Text file with the reply returned by every completion"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds each completion takes"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Up to this many random seconds added to the latency"
+    )
+    parser.add_argument(
+        "--echo_after",
+        default=None,
+        help="Reply with the last user message after this marker instead of the canned reply",
+    )
+    parser.add_argument(
+        "--batch_delay", type=float, default=1.0, help="Seconds before a batch completes"
+    )
+
+    args = parser.parse_args()
+    reply = DEFAULT_REPLY
+    if args.reply_file:
+        with open(args.reply_file, "r", encoding="utf-8") as f:
+            reply = f.read()
+    server = make_server(
+        args.host, args.port, reply, args.latency, args.batch_delay, args.jitter, args.echo_after
+    )
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
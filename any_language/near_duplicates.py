@@ -0,0 +1,183 @@
+"""
+Near-duplicate detection for MCQ datasets with MinHash signatures and
+locality-sensitive hashing (LSH).
+
+Each question (with its options) is reduced to the set of its character
+n-grams, which survives the one- or two-character differences left by OCR or
+an LLM, in any script. A MinHash signature of `num_perm` values estimates the
+Jaccard similarity of two such sets. Signatures are cut into bands; questions
+sharing a band are candidates, and candidates whose estimated similarity
+reaches the threshold are merged into clusters.
+
+Finding candidates sorts the band hashes instead of comparing every pair, so
+the cost grows as n log n. The index only keeps the signatures (4 bytes per
+permutation and entry), so it can hold millions of entries from many files.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def entry_text(entry):
+    """
+    The text two entries are compared on: the question and its options.
+    """
+    options = entry.get("options") or []
+    if not isinstance(options, list):
+        options = [options]
+    return " | ".join([str(entry.get("question") or "")] + [str(o) for o in options])
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    Picks the number of bands and rows per band whose LSH threshold,
+    (1 / bands) ** (1 / rows), is closest to `threshold`.
+
+    return: tuple, (bands, rows)
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """
+    Collects MinHash signatures of entries, keyed by anything hashable (e.g.
+    (file, entry index)), and groups them into near-duplicate clusters.
+
+    Signatures only depend on the text and on `num_perm`, `ngram` and `seed`,
+    so they can be computed in worker processes with signature() and added
+    with add_signature().
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, ngram=5, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.keys = []
+        self.texts = []
+        self.chunks = []
+        self.pending = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def shingles(self, text):
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def signature(self, text):
+        """
+        return: np.array of num_perm uint32, the MinHash signature of `text`
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)),
+            dtype=np.uint64,
+        )
+        # universal hashing (a * x + b) mod p; a, b and x are below 2**32, so
+        # the product cannot overflow 64 bits
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def add(self, key, text, preview=None):
+        self.add_signature(key, self.signature(text), preview if preview is not None else text)
+
+    def add_signature(self, key, signature, preview=""):
+        """
+        :param key: hashable, identifies the entry in the clusters
+        :param signature: np.array, as returned by signature()
+        :param preview: str, short text shown with the cluster
+        """
+        self.keys.append(key)
+        self.texts.append(preview[:80])
+        self.pending.append(signature)
+        if len(self.pending) >= 10000:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.chunks.append(np.vstack(self.pending))
+            self.pending = []
+
+    def _signatures(self):
+        self._flush()
+        if len(self.chunks) > 1:
+            self.chunks = [np.vstack(self.chunks)]
+        if not self.chunks:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return self.chunks[0]
+
+    def clusters(self):
+        """
+        Groups the entries into clusters of near duplicates.
+
+        return: list of dicts with the "keys" of the entries, a "preview" of
+            the first one and the lowest estimated "similarity" with it,
+            largest clusters first
+        """
+        signatures = self._signatures()
+        n = len(signatures)
+        parent = np.arange(n)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            rows = signatures[:, band * self.rows:(band + 1) * self.rows]
+            # one 64-bit FNV-style hash per band (uint64 arithmetic wraps),
+            # sorted so equal bands are adjacent
+            band_hashes = np.full(n, 14695981039346656037, dtype=np.uint64)
+            for column in range(rows.shape[1]):
+                band_hashes = (band_hashes ^ rows[:, column].astype(np.uint64)) * np.uint64(
+                    1099511628211
+                )
+            order = np.argsort(band_hashes, kind="stable")
+            sorted_hashes = band_hashes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]])
+            ends = np.r_[starts[1:], n]
+            shared = ends - starts >= 2
+            for start, end in zip(starts[shared], ends[shared]):
+                members = order[start:end]
+                head = members[0]
+                similar = (signatures[members[1:]] == signatures[head]).mean(axis=1)
+                for member in members[1:][similar >= self.threshold]:
+                    root_a, root_b = find(head), find(member)
+                    if root_a != root_b:
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(i)
+
+        clusters = []
+        for root, members in groups.items():
+            if len(members) < 2:
+                continue
+            similarity = (signatures[members[1:]] == signatures[members[0]]).mean(axis=1)
+            clusters.append(
+                {
+                    "keys": [self.keys[i] for i in members],
+                    "preview": self.texts[members[0]],
+                    "similarity": float(similarity.min()),
+                }
+            )
+        clusters.sort(key=lambda c: len(c["keys"]), reverse=True)
+        return clusters
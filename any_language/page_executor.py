@@ -0,0 +1,43 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def imap_ordered(func, items, max_workers=4, processes=False):
+    """
+    Applies `func` to every element of `items` on a thread pool and yields the
+    results in input order. At most `max_workers` calls run at the same time and
+    `items` is consumed lazily, so a streaming page source is never read more
+    than a couple of pages ahead of the requests in flight.
+
+    Threads suit calls that wait on the network. CPU-bound work such as OCR
+    should pass processes=True; `func` and the items must then be picklable
+    (a module-level function or a functools.partial of one), so send page
+    numbers rather than images and let the workers rasterize.
+
+    :param func: callable, called with a single element of `items`
+    :param items: iterable, e.g. pages coming out of iter_pdf_pages
+    :param max_workers: int, number of concurrent calls (1 runs serially)
+    :param processes: bool, use a process pool instead of threads
+    return: generator
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    # queue a few more items than workers so a slow page at the head of the
+    # queue does not leave the other workers idle
+    max_pending = 2 * max_workers
+    pending = deque()
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=max_workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
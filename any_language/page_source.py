@@ -0,0 +1,72 @@
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+
+def count_pdf_pages(pdf_path):
+    """
+    Returns the number of pages of a pdf file without rasterizing it.
+
+    :param pdf_path: str
+    return: int
+    """
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def render_pdf_page(pdf_path, page_num, dpi=200):
+    """
+    Rasterizes a single page, e.g. inside an OCR worker process.
+
+    :param pdf_path: str
+    :param page_num: int, 1-based page number
+    :param dpi: int
+    return: PIL.Image
+    """
+    return convert_from_path(pdf_path, dpi=dpi, first_page=page_num, last_page=page_num)[0]
+
+
+def iter_pdf_pages(
+    pdf_path, first_page=1, last_page=None, window=1, dpi=200, pages=None
+):
+    """
+    Rasterizes a pdf file lazily, a few pages at a time, so that only `window`
+    PIL images are held in memory however long the document is.
+
+    :param pdf_path: str
+    :param first_page: int, 1-based index of the first page to render
+    :param last_page: int, 1-based index of the last page to render (inclusive)
+    :param window: int, number of pages rendered per pdftoppm call
+    :param dpi: int
+    :param pages: iterable of 1-based page numbers, renders only these pages of
+        the range (e.g. the ones a resumed run still has to process)
+    return: generator of (page_num, PIL.Image) with 1-based page numbers
+    """
+    total_pages = count_pdf_pages(pdf_path)
+    if last_page is None or last_page > total_pages:
+        last_page = total_pages
+    if pages is None:
+        pages = range(first_page, last_page + 1)
+    pages = sorted(p for p in set(pages) if first_page <= p <= last_page)
+
+    for start, end in _page_runs(pages, window):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=start, last_page=end)
+        page_num = start
+        # hand the pages over one by one and drop our reference straight away
+        while images:
+            yield page_num, images.pop(0)
+            page_num += 1
+
+
+def _page_runs(pages, window):
+    """
+    Splits sorted page numbers into (first, last) runs of consecutive pages
+    holding at most `window` pages each.
+    """
+    start = end = None
+    for page in pages:
+        if start is not None and page == end + 1 and page - start < window:
+            end = page
+            continue
+        if start is not None:
+            yield start, end
+        start = end = page
+    if start is not None:
+        yield start, end
@@ -1,10 +1,11 @@
 from os import listdir
 from os.path import isfile, join
 import os
+import re
 import time
-import base64
 import pandas as pd
 import argparse
+from functools import partial
 import openai
 from openai import (
     OpenAI,
@@ -13,9 +14,21 @@ from openai import (
     RateLimitError,
     InternalServerError,
 )
-from pdf2image import convert_from_path
 
+from batch_api import BatchWriter, run_batches
+from image_encoding import (
+    ImageOptions,
+    ImageWriter,
+    add_image_arguments,
+    image_message,
+    image_options_from_args,
+)
+from page_executor import imap_ordered
+from page_source import iter_pdf_pages
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+from text_layer import classify_pdf, script_of
 from utils import parse_gpt_output
+import text2mcq
 
 
 pre_prompt = """Please extract the multiple-choice questions in the attached image in the {} language in which they appear. The question should be inside the tags  <question> </question> and the choices inside the tags <choices> </choices>. Additionally, the correct answer might be present in the image either explicitly provided or by a mark next to the correct answer of the multiple choices. Provide the number or letter of the correct answer between the tags <answer> </answer>. If no answer is present, leave empty.
@@ -44,131 +57,407 @@ def chat_completion(
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            if return_text:
-                return text
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
-            if return_usage:
-                return usage
-
-            return response
-        except (
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
+
+
+model_args = {
+    "temperature": 0.0,
+    "max_tokens": 4096,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+}
+
+
+def page_messages(page, language, image_options):
+    """
+    It builds the gpt-4o request for a single pdf page.
+
+    :param page: PIL image
+    :param language: str
+    :param image_options: ImageOptions, how the page is resized and encoded
+    return: list, array of messages
+    """
+    message = [
+        {"type": "text", "text": pre_prompt.format(language)},
+        image_message(page, image_options),
+    ]
+    return [{"role": "user", "content": message}]
+
+
+# the output format of the text2mcq.py prompt, with the answer of each question
+text_pre_prompt = text2mcq.pre_prompt.replace(
+    "4. <Choice 4>\n",
+    "4. <Choice 4>\n<answer> </answer>\n\n"
+    "Leave one empty line between two questions. The correct answer might be "
+    "present in the text, either explicitly provided or in an answer key. Provide "
+    "the number of the correct choice between the tags <answer> </answer>. If no "
+    "answer is present, leave empty.\n",
+)
+
+# "1. ", "1) ", "(1) ", "a) ", "(A) " at the start of a choice line
+choice_number_pattern = re.compile(r"^\s*(?:\(\s*(?:\d+|[a-zA-Z])\s*\)|(?:\d+|[a-zA-Z])[.)])\s+")
+answer_pattern = re.compile(r"<answer>(.*?)</answer>", re.DOTALL)
+
+
+def text_page_messages(text):
+    """
+    It builds the text-only request of a born-digital page, with the prompt
+    of text2mcq.py asking for the answers too.
+
+    :param text: str, embedded text of the page
+    return: list, array of messages
+    """
+    prompt = "{}\n\n{}".format(text_pre_prompt, text)
+    return [{"role": "user", "content": prompt.strip()}]
+
+
+def page_rows(response, f, i, language):
+    """
+    It turns the gpt-4o output for a page into dataset rows.
+
+    :param response: str
+    :param f: str, pdf file name
+    :param i: int, 0-based page index
+    :param language: str
+    return: list of dict
+    """
+    results = list()
+    questions, choices = parse_gpt_output(response)
+    if len(questions) > 0 and len(choices) > 0:
+        for question, options in zip(questions, choices):
+            new_row = {
+                "language": language,
+                "category_en": None,
+                "category_original_lang": None,
+                "level": None,
+                "region_related": None,
+                "source": f,
+                "page_num": i,
+                "response": response,
+                "question": question,
+                "options": options,
+                "answer": None,
+            }
+
+            results.append(new_row)
+    return results
+
+
+def parse_text_output(q):
+    """
+    It parses one question of the text prompt output: the question (which
+    may span several lines), its numbered choices without their numbers, and
+    the answer.
+
+    :param q: str, one block of the output
+    return: tuple, (question, list of options, answer or None)
+    """
+    answer = None
+    match = answer_pattern.search(q)
+    if match:
+        answer = match.group(1).strip() or None
+        q = answer_pattern.sub("", q)
+
+    question_lines, options = list(), list()
+    for line in q.split("\n"):
+        if not line.strip():
             continue
+        if choice_number_pattern.match(line) and (question_lines or options):
+            option = choice_number_pattern.sub("", line).strip()
+            if option:
+                options.append(option)
+        elif not options:
+            question_lines.append(line.strip())
+        # text after the choices (e.g. a stray explanation) is dropped
+
+    question = " ".join(question_lines)
+    question = choice_number_pattern.sub("", question).strip()
+    return question, options, answer
+
+
+def text_page_rows(response, f, i, language):
+    """
+    It turns the output of the text prompt for a page into the same dataset
+    rows as page_rows.
+
+    :param response: str
+    :param f: str, pdf file name
+    :param i: int, 0-based page index
+    :param language: str
+    return: list of dict
+    """
+    results = list()
+    for q in response.split("\n\n"):
+        if not q.strip():
+            continue
+        question, options, answer = parse_text_output(q)
+        if question and len(options) >= 2:
+            results.append(
+                {
+                    "language": language,
+                    "category_en": None,
+                    "category_original_lang": None,
+                    "level": None,
+                    "region_related": None,
+                    "source": f,
+                    "page_num": i,
+                    "response": response,
+                    "question": question,
+                    "options": options,
+                    "answer": answer,
+                }
+            )
+    return results
+
+
+def iter_page_items(pdf_file, layers):
+    """
+    Yields the pages of a pdf in order: the text of born-digital pages and
+    the image of scanned ones, only the latter being rasterized.
+
+    :param pdf_file: str
+    :param layers: list of PageLayer, see text_layer.classify_pdf
+    return: generator of (page_num, str or PIL image)
+    """
+    scan_pages = [layer.page_num for layer in layers if layer.kind == "scan"]
+    images = iter_pdf_pages(pdf_file, pages=scan_pages) if scan_pages else iter(())
+    for layer in layers:
+        if layer.kind == "text":
+            yield layer.page_num, layer.text
+        else:
+            yield next(images)
+
+
+def classify_pages(pdf_file, language, vision_all=False):
+    """
+    :param language: str, e.g. "Hindi", to check that the text layer is in
+        its script
+    return: list of PageLayer, every page being a scan with vision_all
+    """
+    layers = classify_pdf(pdf_file, script_of(language))
+    if vision_all:
+        layers = [layer._replace(kind="scan", reason="vision_all") for layer in layers]
+    scans = sum(layer.kind == "scan" for layer in layers)
+    print("{} pages with a text layer, {} pages sent as images".format(len(layers) - scans, scans))
+    return layers
 
 
-def encode_image(image_path):
+def extract_page(
+    client, dir_path, f, language, image_writer, image_options, page_item
+):
     """
-    Function to encode the image
+    It sends a single pdf page to gpt-4o and returns the extracted questions.
+    Born-digital pages are sent as text, scanned pages as images.
+
+    :param client: OpenAI client
+    :param dir_path: str
+    :param f: str, pdf file name
+    :param language: str
+    :param image_writer: ImageWriter or None, persists the page images for debugging
+    :param image_options: ImageOptions, how the page is resized and encoded
+    :param page_item: tuple, (page_num, text or PIL image) as yielded by
+        iter_page_items
+    return: list of dict
     """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    page_num, page = page_item
+    i = page_num - 1
+    if isinstance(page, str):
+        messages, rows = text_page_messages(page), text_page_rows
+    else:
+        messages, rows = page_messages(page, language, image_options), page_rows
+    if image_writer is not None and rows is page_rows:
+        img_name = "{}/imgs/{}_{}.jpg".format(dir_path, f, i)
+        image_writer.save(page, img_name, "JPEG")
+
+    # Step 3: Pass img to gpt-4 for mcq extraction
+    try:
+        response, _ = chat_completion(
+            client,
+            messages,
+            model="gpt-4o",
+            return_text=True,
+            return_usage=True,
+            model_args=model_args,
+        )
+
+        # Step 4: Process gpt-4 output
+        return rows(response, f, i, language)
 
+    except openai.BadRequestError:
+        return list()
 
-def main(dir_path, openai_key, language):
+
+def list_pdf_files(dir_path):
+    # get files to be processed
+    onlyfiles = [f for f in listdir(dir_path) if isfile(join(dir_path, f))]
+    return [f for f in onlyfiles if f.endswith(".pdf")]
+
+
+def save_results(dir_path, f, results):
+    # store extracted questions
+    output_file = os.path.join(dir_path, "mcq", "{}.json".format(f.split(".")[0]))
+    output_data = pd.DataFrame(results)
+    output_data.to_json(output_file, orient="records")
+    print("Data saved: {}".format(output_file))
+
+
+def main(
+    dir_path,
+    openai_key,
+    language,
+    workers=4,
+    save_imgs=False,
+    image_options=ImageOptions(format="JPEG"),
+    vision_all=False,
+):
     """
-    It performs the main text extraction pipeline of the script.
+    It performs the main text extraction pipeline of the script. Pages with
+    a usable embedded text layer (see text_layer.py) are sent as text with
+    the prompt of text2mcq.py, only scanned pages are rendered and sent as
+    images.
 
     :param dir_path: str
     :param openai_key: str
+    :param language: str
+    :param workers: int, number of pages sent to the API concurrently
+    :param save_imgs: bool, also write the page images to dir_path/imgs
+    :param image_options: ImageOptions, how pages are resized and encoded
+    :param vision_all: bool, send every page as an image
     """
     # create client with openai credentials
     client = OpenAI(api_key=openai_key)
+    image_writer = None
+    if save_imgs:
+        os.makedirs(os.path.join(dir_path, "imgs"), exist_ok=True)
+        image_writer = ImageWriter()
 
-    # get files to be processed
-    onlyfiles = [f for f in listdir(dir_path) if isfile(join(dir_path, f))]
-    if ".DS_Store" in onlyfiles:
-        onlyfiles.remove(".DS_Store")
-
-    for f in onlyfiles:
-        # check the file has the .pdf extension
-        if f.endswith(".pdf"):
-            # Step 1: Reads the pdf file
-            print("Parsing file: {}".format(f))
+    for f in list_pdf_files(dir_path):
+        # Step 1: Reads the pdf file
+        print("Parsing file: {}".format(f))
+        pdf_file = "{}/{}".format(dir_path, f)
+        layers = classify_pages(pdf_file, language, vision_all)
+        num_pages = len(layers)
+
+        # Step 2: Extract the questions of each page, keeping `workers`
+        # requests in flight; results come back in page order
+        results = list()
+        pages = imap_ordered(
+            partial(
+                extract_page,
+                client,
+                dir_path,
+                f,
+                language,
+                image_writer,
+                image_options,
+            ),
+            iter_page_items(pdf_file, layers),
+            max_workers=workers,
+        )
+        for i, page_results in enumerate(pages):
+            print("Page: {} / {}".format(i, num_pages))
+            results.extend(page_results)
+            print("Questions extracted: {}".format(len(results)))
+
+        save_results(dir_path, f, results)
+
+    if image_writer is not None:
+        image_writer.close()
+
+
+def main_batch(
+    dir_path,
+    openai_key,
+    language,
+    batch_file=None,
+    image_options=ImageOptions(format="JPEG"),
+    poll_interval=60,
+    vision_all=False,
+):
+    """
+    It runs the extraction pipeline through the OpenAI Batch API: every page of
+    every pdf is written to JSONL batch files, which are submitted and polled
+    until done. The results go through the same parsing as the online mode.
+
+    :param dir_path: str
+    :param openai_key: str
+    :param language: str
+    :param batch_file: str, path of the JSONL batch file (dir_path/batch/requests.jsonl)
+    :param image_options: ImageOptions, how pages are resized and encoded
+    :param poll_interval: int, seconds between two status checks
+    :param vision_all: bool, send every page as an image
+    """
+    client = OpenAI(api_key=openai_key)
+    if batch_file is None:
+        batch_file = os.path.join(dir_path, "batch", "requests.jsonl")
+
+    # Step 1: Write one request per page
+    text_pages = dict()
+    with BatchWriter(batch_file) as writer:
+        for f in list_pdf_files(dir_path):
+            print("Preparing file: {}".format(f))
             pdf_file = "{}/{}".format(dir_path, f)
-            pages = convert_from_path(pdf_file)
-
-            # Step 2: Preprocess the image (deskew)
-            results = list()
-            for i, page in enumerate(pages):
-                print("Page: {} / {}".format(i, len(pages)))
-                img_name = "{}/imgs/{}_{}.jpg".format(dir_path, f, i)
-                page.save(img_name)
-                base64_image = encode_image(img_name)
-
-                # Step 3: Pass img to gpt-4 for mcq extraction
-                try:
-                    message = [
-                        {"type": "text", "text": pre_prompt.format(language)},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
-                        },
-                    ]
-                    response, _ = chat_completion(
-                        client,
-                        [{"role": "user", "content": message}],
-                        model="gpt-4o",
-                        return_text=True,
-                        return_usage=True,
-                        model_args={
-                            "temperature": 0.0,
-                            "max_tokens": 4096,
-                            "top_p": 1,
-                            "frequency_penalty": 0,
-                            "presence_penalty": 0,
-                        },
-                    )
-
-                    # Step 4: Process gpt-4 output
-                    questions, choices = parse_gpt_output(response)
-                    if len(questions) > 0 and len(choices) > 0:
-                        for question, options in zip(questions, choices):
-                            new_row = {
-                                "language": language,
-                                "category_en": None,
-                                "category_original_lang": None,
-                                "level": None,
-                                "region_related": None,
-                                "source": f,
-                                "page_num": i,
-                                "response": response,
-                                "question": question,
-                                "options": options,
-                                "answer": None,
-                            }
-
-                            results.append(new_row)
-                    print("Questions extracted: {}".format(len(results)))
-
-                except openai.BadRequestError:
-                    pass
-
-            # store extracted questions
-            output_file = os.path.join(
-                dir_path, "mcq", "{}.json".format(f.split(".")[0])
-            )
-            output_data = pd.DataFrame(results)
-            output_data.to_json(output_file, orient="records")
-            print("Data saved: {}".format(output_file))
+            layers = classify_pages(pdf_file, language, vision_all)
+            text_pages[f] = [layer.kind == "text" for layer in layers]
+            for page_num, page in iter_page_items(pdf_file, layers):
+                if isinstance(page, str):
+                    messages = text_page_messages(page)
+                else:
+                    messages = page_messages(page, language, image_options)
+                writer.add("{}::{}".format(f, page_num), "gpt-4o", messages, model_args)
+
+    # Step 2: Submit the batches and wait for them
+    responses = run_batches(client, writer.paths, poll_interval)
+
+    # Step 3: Process gpt-4 output in page order
+    for f, is_text in text_pages.items():
+        results = list()
+        for page_num in range(1, len(is_text) + 1):
+            response = responses.get("{}::{}".format(f, page_num))
+            if response is None:
+                print("No response for {} page {}".format(f, page_num))
+                continue
+            rows = text_page_rows if is_text[page_num - 1] else page_rows
+            results.extend(rows(response, f, page_num - 1, language))
+        print("Questions extracted from {}: {}".format(f, len(results)))
+        save_results(dir_path, f, results)
 
 
 if __name__ == "__main__":
@@ -180,5 +469,82 @@ if __name__ == "__main__":
 
     parser.add_argument("-l", "--lang", help="", default="")
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of pages sent to the API concurrently",
+        default=4,
+    )
+
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        help="Requests per minute allowed (learned from the API headers if not set)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        help="Tokens per minute allowed (learned from the API headers if not set)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--save_imgs",
+        action="store_true",
+        help="Also write the page images to <dir>/imgs for debugging",
+    )
+
+    add_image_arguments(parser, default_format="JPEG")
+
+    parser.add_argument(
+        "--mode",
+        choices=["online", "batch"],
+        help="online sends the pages as they are rendered, batch submits them "
+        "to the OpenAI Batch API (slower to finish, half the cost)",
+        default="online",
+    )
+
+    parser.add_argument(
+        "--batch_file",
+        help="JSONL file the batch requests are written to (default <dir>/batch/requests.jsonl)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--poll_interval",
+        type=int,
+        help="Seconds between two status checks of a batch",
+        default=60,
+    )
+
+    parser.add_argument(
+        "--vision_all",
+        action="store_true",
+        help="Send every page as an image, also the ones with an embedded text layer",
+    )
+
     args = parser.parse_args()
-    main(dir_path=args.dir, openai_key=args.key, language=args.lang)
+    get_limiter("openai", requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    if args.mode == "batch":
+        main_batch(
+            dir_path=args.dir,
+            openai_key=args.key,
+            language=args.lang,
+            batch_file=args.batch_file,
+            image_options=image_options_from_args(args),
+            poll_interval=args.poll_interval,
+            vision_all=args.vision_all,
+        )
+    else:
+        main(
+            dir_path=args.dir,
+            openai_key=args.key,
+            language=args.lang,
+            workers=args.workers,
+            save_imgs=args.save_imgs,
+            image_options=image_options_from_args(args),
+            vision_all=args.vision_all,
+        )
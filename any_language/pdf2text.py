@@ -1,5 +1,4 @@
 import pandas as pd
-from pdf2image import convert_from_path
 import cv2
 import numpy as np
 import pytesseract
@@ -9,21 +8,64 @@ from os import listdir
 import os
 from os.path import isfile, join
 import argparse
+import math
+from functools import partial
 
+from page_executor import imap_ordered
+from page_source import render_pdf_page
+from text_layer import classify_pdf
 
-def deskew(image):
+
+def estimate_skew(image, fast=False, max_edge=1000):
     """
-    It corrects the orientation of the image. It takes the input image and returns the deskewed image.
+    Estimates the skew angle of a page, in degrees, from the minimum-area
+    rectangle around its ink.
+
+    The exact mode uses every non-white pixel of the full-resolution page,
+    which can be millions of points. The fast mode first shrinks the page by
+    an integer factor so its long edge is at most `max_edge` pixels and keeps only the ink found by
+    an Otsu threshold, which ignores scanner noise and anti-aliasing.
+
+    :param image: np.array, RGB page
+    :param fast: bool
+    :param max_edge: int, long edge of the downsampled page in fast mode
+    return: float, rotation that straightens the page
     """
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bitwise_not(gray)
-    coords = np.column_stack(np.where(gray > 0))
+    if fast:
+        # an integer factor keeps INTER_AREA on its fast path
+        factor = math.ceil(max(gray.shape) / max_edge)
+        if factor > 1:
+            gray = cv2.resize(
+                gray, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA
+            )
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    else:
+        mask = cv2.bitwise_not(gray)
+    coords = cv2.findNonZero(mask)
+    if coords is None:
+        return 0.0
+    # findNonZero returns (x, y) points, the original np.where version (row, col)
+    coords = coords.reshape(-1, 2)[:, ::-1]
     angle = cv2.minAreaRect(coords)[-1]
 
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
+    # minAreaRect reports angles in [-90, 0) or (0, 90] depending on the
+    # OpenCV version; fold them into [-45, 45)
+    return -((angle + 45) % 90 - 45)
+
+
+def deskew(image, fast=False, min_angle=0.0):
+    """
+    It corrects the orientation of the image. It takes the input image and returns the deskewed image.
+
+    :param image: np.array, RGB page
+    :param fast: bool, estimate the angle on a downsampled, binarized page
+    :param min_angle: float, pages skewed by less than this many degrees are
+        returned as they are, without the (costly) rotation
+    """
+    angle = estimate_skew(image, fast=fast)
+    if abs(angle) < min_angle or angle == 0:
+        return image
 
     (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
@@ -43,29 +85,72 @@ def extract_text_from_image(image):
     return text
 
 
-def main(dir_path):
+def ocr_page(pdf_file, fast_deskew, min_angle, page_num):
     """
-    It performs the main text extraction pipeline of the script.
+    Rasterizes, deskews and OCRs a single page. It runs in a worker process,
+    so only the pdf path and the page number cross the process boundary.
+
+    :param pdf_file: str
+    :param fast_deskew: bool, estimate the skew on a downsampled page
+    :param min_angle: float, skew (degrees) below which the page is not rotated
+    :param page_num: int, 1-based page number
+    return: str
+    """
+    page = render_pdf_page(pdf_file, page_num)
+    # Step 2: Preprocess the image (deskew)
+    preprocessed_image = deskew(np.array(page), fast=fast_deskew, min_angle=min_angle)
+    # Step 3: Extract text using OCR
+    return extract_text_from_image(preprocessed_image)
+
+
+def main(dir_path, workers=1, fast_deskew=False, min_angle=0.0, ocr_all=False):
+    """
+    It performs the main text extraction pipeline of the script. Pages with a
+    usable embedded text layer (see text_layer.py) are read directly, only
+    the scanned ones are rasterized and OCRed.
 
     :param dir_path: str
+    :param workers: int, number of pages OCRed in parallel worker processes
+    :param fast_deskew: bool, estimate the skew on a downsampled, binarized page
+    :param min_angle: float, skew (degrees) below which pages are not rotated
+    :param ocr_all: bool, OCR every page, ignoring the text layer
     """
+    if workers > 1:
+        # one tesseract thread per worker, the pool already uses every core
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
     onlyfiles = [f for f in listdir(dir_path) if isfile(join(dir_path, f))]
     for f in onlyfiles:
-        # Step 1: Reads the pdf file
+        # Step 1: Reads the pdf file and finds the pages without a text layer
         print("Parsing file: {}".format(f))
         pdf_file = "{}/{}".format(dir_path, f)
-        pages = convert_from_path(pdf_file)
+        layers = classify_pdf(pdf_file)
+        if ocr_all:
+            layers = [layer._replace(kind="scan", reason="ocr_all") for layer in layers]
+        scan_pages = [layer.page_num for layer in layers if layer.kind == "scan"]
+        print(
+            "{} pages with a text layer, {} pages to OCR".format(
+                len(layers) - len(scan_pages), len(scan_pages)
+            )
+        )
 
         # Create a list to store extracted text from all pages
         extracted_text = list()
 
-        for i, page in tqdm(enumerate(pages)):
-            # Step 2: Preprocess the image (deskew)
-            preprocessed_image = deskew(np.array(page))
-
-            # Step 3: Extract text using OCR
-            text = extract_text_from_image(preprocessed_image)
-            extracted_text.append({"page_num": i, "parsed_text": text})
+        texts = imap_ordered(
+            partial(ocr_page, pdf_file, fast_deskew, min_angle),
+            scan_pages,
+            max_workers=workers,
+            processes=True,
+        )
+        for layer in tqdm(layers):
+            if layer.kind == "scan":
+                text, method = next(texts), "ocr"
+            else:
+                text, method = layer.text, "text_layer"
+            extracted_text.append(
+                {"page_num": layer.page_num - 1, "parsed_text": text, "method": method}
+            )
 
         # save file
         data = pd.DataFrame(extracted_text)
@@ -82,5 +167,39 @@ if __name__ == "__main__":
 
     parser.add_argument("-d", "--dir", help="", default="pfds")
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of pages OCRed in parallel (default: number of CPUs)",
+    )
+
+    parser.add_argument(
+        "--deskew",
+        choices=["fast", "exact"],
+        default="fast",
+        help="Estimate the skew on a downsampled, binarized page (fast) or on every pixel (exact)",
+    )
+
+    parser.add_argument(
+        "--min_angle",
+        type=float,
+        default=0.5,
+        help="Pages skewed by less than this many degrees are not rotated",
+    )
+
+    parser.add_argument(
+        "--ocr_all",
+        action="store_true",
+        help="OCR every page, also the ones with an embedded text layer",
+    )
+
     args = parser.parse_args()
-    main(dir_path=args.dir)
+    main(
+        dir_path=args.dir,
+        workers=args.workers,
+        fast_deskew=args.deskew == "fast",
+        min_angle=args.min_angle,
+        ocr_all=args.ocr_all,
+    )
@@ -0,0 +1,290 @@
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding `capacity` tokens that refill continuously
+    over `period` seconds. A bucket without capacity never blocks.
+
+    Callers reserve tokens up front and may drive the bucket into debt; the
+    returned wait time tells them how long to sleep before the reservation is
+    honoured. This keeps the order of concurrent callers fair without holding
+    the lock while sleeping.
+    """
+
+    def __init__(self, capacity=None, period=60.0):
+        self.lock = threading.Lock()
+        self.period = period
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.capacity is not None:
+            rate = self.capacity / self.period
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def set_capacity(self, capacity):
+        with self.lock:
+            self._refill()
+            if capacity is None or self.capacity is None:
+                self.tokens = capacity
+            else:
+                self.tokens = min(self.tokens, capacity)
+            self.capacity = capacity
+
+    def set_remaining(self, remaining):
+        """
+        Aligns the local bucket with the remaining quota reported by the server.
+        """
+        with self.lock:
+            if self.capacity is None:
+                return
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+
+    def reserve(self, amount=1):
+        """
+        Takes `amount` tokens and returns the number of seconds to wait before using them.
+        """
+        with self.lock:
+            if self.capacity is None:
+                return 0.0
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens * self.period / self.capacity
+
+    def refund(self, amount):
+        with self.lock:
+            if self.capacity is None:
+                return
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by all the threads
+    talking to one provider. Limits that are not configured explicitly are
+    learned from the x-ratelimit-* response headers.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.fixed_requests = requests_per_minute is not None
+        self.fixed_tokens = tokens_per_minute is not None
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+
+    def configure(self, requests_per_minute=None, tokens_per_minute=None):
+        if requests_per_minute is not None:
+            self.requests.set_capacity(requests_per_minute)
+            self.fixed_requests = True
+        if tokens_per_minute is not None:
+            self.tokens.set_capacity(tokens_per_minute)
+            self.fixed_tokens = True
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request using `tokens` tokens fits in the quota.
+        """
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self.lock:
+            wait = max(wait, self.paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_usage(self, estimated, used):
+        """
+        Corrects the token reservation made in acquire() with the real usage.
+        """
+        if used < estimated:
+            self.tokens.refund(estimated - used)
+        elif used > estimated:
+            self.tokens.reserve(used - estimated)
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for `seconds`, e.g. after a 429 from the server.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+        for bucket, fixed, kind in (
+            (self.requests, self.fixed_requests, "requests"),
+            (self.tokens, self.fixed_tokens, "tokens"),
+        ):
+            limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+            if limit and not fixed and limit != bucket.capacity:
+                bucket.set_capacity(limit)
+            if remaining is not None:
+                bucket.set_remaining(remaining)
+                if remaining <= 0:
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    if reset:
+                        self.pause(reset)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, requests_per_minute=None, tokens_per_minute=None):
+    """
+    Returns the process-wide limiter of `provider` ("openai", "cohere", ...),
+    creating it on first use. Limits passed here override the learned ones.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = RateLimiter()
+    limiter.configure(requests_per_minute, tokens_per_minute)
+    return limiter
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """
+    Rough upper bound of the tokens a chat request counts against the quota:
+    ~4 characters per text token, a high-detail tile budget per image and the
+    completion budget, which providers reserve up front.
+
+    :param messages: str, or list of chat messages with str or multi-part content
+    :param max_tokens: int
+    return: int
+    """
+    if isinstance(messages, str):
+        messages = [{"content": messages}]
+    chars, images = 0, 0
+    for message in messages:
+        content = message.get("content", "") if isinstance(message, dict) else message
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, dict):
+                if part.get("type") == "image_url":
+                    images += 1
+                else:
+                    chars += len(part.get("text", ""))
+            else:
+                chars += len(str(part))
+    return chars // 4 + 765 * images + (max_tokens or 0)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Exponential backoff with jitter: half of the delay is fixed, half random,
+    so concurrent workers do not retry in lockstep.
+    """
+    delay = min(cap, base * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def parse_duration(value):
+    """
+    Parses durations such as "20ms", "1.5s" or "6m0s" (x-ratelimit-reset-*) into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    matches = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not matches:
+        return None
+    return sum(float(number) * units[unit] for number, unit in matches)
+
+
+def retry_after(error):
+    """
+    Returns the delay requested by the server in the Retry-After (or
+    retry-after-ms) header of a failed response, or None.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+
+    retry_ms = _header_number(headers, "retry-after-ms")
+    if retry_ms is not None:
+        return retry_ms / 1000
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    if is_rate_limit_error(error):
+        resets = [
+            parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            for kind in ("requests", "tokens")
+        ]
+        resets = [reset for reset in resets if reset]
+        if resets:
+            return max(resets)
+    return None
+
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def call_with_rate_limit(
+    func, limiter, retry_on, tokens=0, max_attempts=None, name="API"
+):
+    """
+    Calls `func` once the limiter lets a request through, retrying the
+    exceptions in `retry_on` with the server's Retry-After delay or exponential
+    backoff with jitter. Rate-limit errors pause every thread sharing the limiter.
+
+    :param func: callable without arguments performing the request
+    :param limiter: RateLimiter
+    :param retry_on: tuple of exception classes
+    :param tokens: int, estimated tokens of the request
+    :param max_attempts: int or None to retry forever
+    :param name: str, used in log messages
+    """
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        try:
+            return func()
+        except retry_on as e:
+            # the failed request did not consume the token budget
+            limiter.tokens.refund(tokens)
+            attempt += 1
+            if max_attempts is not None and attempt >= max_attempts:
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if is_rate_limit_error(e):
+                limiter.pause(delay)
+            print(f"{name} error: {str(e)}. Waiting for {delay:.1f} seconds.")
+            time.sleep(delay)
+
+
+def _header_number(headers, key):
+    value = headers.get(key)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
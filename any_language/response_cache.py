@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_SIZE = 2 * 1024**3  # 2 GB
+
+
+class ResponseCache:
+    """
+    On-disk cache of chat completion responses, content-addressed by the model,
+    the messages and the model arguments. Responses are stored as JSON blobs
+    sharded over 256 sub-folders and indexed in a SQLite table that keeps their
+    size and last access time for least-recently-used eviction.
+
+    The cache is safe to share between the threads of one process.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"), check_same_thread=False
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def make_key(model, messages, model_args=None):
+        """
+        Hashes a request. Images sent as base64 data URLs are replaced by the
+        hash of their decoded bytes, so the key does not depend on how the
+        payload was serialised.
+
+        :param model: str
+        :param messages: list, array of messages
+        :param model_args: dict
+        return: str, hex digest
+        """
+        payload = {
+            "model": model,
+            "messages": _hash_images(messages),
+            "model_args": model_args or {},
+        }
+        dump = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Returns the cached response stored under `key`, or None.
+        """
+        try:
+            with open(self._blob_path(key), "r", encoding="utf-8") as blob:
+                value = json.load(blob)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            self.db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self.db.commit()
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a JSON-serialisable response under `key` and evicts the least
+        recently used entries if the cache grew beyond its maximum size.
+        """
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False, default=_to_json).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as blob:
+            blob.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, len(data), now, now),
+            )
+            self.db.commit()
+            self._evict()
+
+    def _evict(self):
+        (total,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_size:
+            return
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append(key)
+            total -= size
+        for key in evicted:
+            try:
+                os.remove(self._blob_path(key))
+            except OSError:
+                pass
+        self.db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in evicted])
+        self.db.commit()
+
+
+def _to_json(value):
+    # usage objects of the openai client are pydantic models
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def _hash_images(value):
+    if isinstance(value, dict):
+        return {k: _hash_images(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_hash_images(v) for v in value]
+    if isinstance(value, str) and value.startswith("data:") and ";base64," in value:
+        header, data = value.split(";base64,", 1)
+        digest = hashlib.sha256(base64.b64decode(data)).hexdigest()
+        return f"{header};sha256,{digest}"
+    return value
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class RunManifest:
+    """
+    Records the state of every (pdf, page) work item of an extraction run in a
+    SQLite database, so an interrupted run can be restarted without redoing
+    the pages that already succeeded. Each state change is committed straight
+    away (the database runs in write-ahead-log mode), so the manifest is up to
+    date however the process dies.
+
+    Items are pending until they are marked done, with the path of the file
+    their results were written to, or failed, with the error.
+
+    The manifest is safe to share between the threads of one process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "pdf TEXT, page INTEGER, status TEXT, attempts INTEGER DEFAULT 0, "
+            "output TEXT, error TEXT, updated REAL, PRIMARY KEY (pdf, page))"
+        )
+        self.db.commit()
+
+    def _set(self, pdf, page, status, output=None, error=None, attempt=True):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO pages (pdf, page, status, attempts, output, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (pdf, page) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + excluded.attempts, output = excluded.output, "
+                "error = excluded.error, updated = excluded.updated",
+                (pdf, page, status, int(attempt), output, error, time.time()),
+            )
+            self.db.commit()
+
+    def add_pages(self, pdf, pages):
+        """
+        Registers the pages of a run as pending, leaving known pages untouched.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO pages (pdf, page, status, updated) VALUES (?, ?, ?, ?)",
+                [(pdf, page, PENDING, now) for page in pages],
+            )
+            self.db.commit()
+
+    def mark_done(self, pdf, page, output=None):
+        self._set(pdf, page, DONE, output=output)
+
+    def mark_failed(self, pdf, page, error):
+        self._set(pdf, page, FAILED, error=str(error))
+
+    def reset(self, pdf):
+        """
+        Forgets every page of `pdf`, so the next run starts it from scratch.
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM pages WHERE pdf = ?", (pdf,))
+            self.db.commit()
+
+    def completed(self, pdf):
+        """
+        Returns the pages of `pdf` that are done whose output file still exists.
+
+        return: dict, page -> output path (None if the page had no output file)
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT page, output FROM pages WHERE pdf = ? AND status = ?", (pdf, DONE)
+            ).fetchall()
+        return {
+            page: output
+            for page, output in rows
+            if output is None or os.path.exists(output)
+        }
+
+    def remaining(self, pdf, pages):
+        """
+        Filters `pages` down to the ones still to process: pending, failed or
+        done but with their output file gone.
+
+        :param pdf: str
+        :param pages: iterable of page numbers
+        return: list
+        """
+        completed = self.completed(pdf)
+        return [page for page in pages if page not in completed]
+
+    def failures(self, pdf):
+        """
+        return: dict, page -> error of the failed pages of `pdf`
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT page, error FROM pages WHERE pdf = ? AND status = ? ORDER BY page",
+                (pdf, FAILED),
+            ).fetchall()
+        return dict(rows)
+
+    def summary(self, pdf=None):
+        """
+        return: dict, status -> number of pages (of `pdf`, or of the whole run)
+        """
+        query = "SELECT status, COUNT(*) FROM pages"
+        params = ()
+        if pdf is not None:
+            query += " WHERE pdf = ?"
+            params = (pdf,)
+        with self.lock:
+            rows = self.db.execute(query + " GROUP BY status", params).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
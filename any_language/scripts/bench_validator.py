@@ -0,0 +1,171 @@
+"""
+Benchmark of the schema checks of dataset_checker.py: JSONEvaluator.validate_entry,
+whose per-key types and messages are computed once in __init__, against
+validate_entry_reference below, the original checks that walk the schema and
+format the messages for every entry.
+
+Synthetic entries are generated with a share of them broken in every way the
+checks know about (missing and empty keys, wrong types, other languages, bad
+options and answers). Both implementations validate the same entries; the
+report gives their time and throughput and fails if any error differs.
+
+Usage: python bench_validator.py [--entries 1000000] [--invalid 0.2]
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+from functools import partial
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataset_checker import JSONEvaluator
+
+LANGUAGE = "sv"
+
+
+def validate_entry_reference(schema, language_code, idx, entry):
+    """
+    The checks of JSONEvaluator.validate_entry as originally written; both
+    must return the same errors, in the same order.
+    """
+    errors = []
+    for key, expected_type in schema.items():
+        value = entry.get(key)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            errors.append({"entry": idx, "message": f"Missing or empty key '{key}'."})
+        elif not isinstance(value, expected_type):
+            errors.append({"entry": idx, "message": f"Invalid type for '{key}': expected {expected_type.__name__}, got {type(value).__name__}."})
+
+    lang = entry.get('language', '').lower()
+    if lang != language_code:
+        errors.append({"entry": idx, "message": f"Invalid language code: expected '{language_code}', got '{lang}'."})
+
+    options = entry.get("options", [])
+    if not isinstance(options, list) or any(not isinstance(opt, str) or not opt.strip() for opt in options):
+        errors.append({"entry": idx, "message": "Invalid 'options': must be a list of non-empty strings."})
+    elif len(set(options)) == 1:
+        errors.append({"entry": idx, "message": "All options are identical."})
+
+    answer = entry.get("answer", "")
+    if not isinstance(answer, str):
+        errors.append({"entry": idx, "message": "Invalid 'answer': must be a string."})
+    else:
+        try:
+            answer_ints = [int(a.strip()) for a in answer.split(',')]
+            valid_range = set(range(1, len(options) + 1))
+            if not set(answer_ints).issubset(valid_range):
+                errors.append({"entry": idx, "message": f"Invalid 'answer': Answer cannot be more than number of options: {len(options)}."})
+        except ValueError:
+            errors.append({"entry": idx, "message": "Invalid 'answer': must be comma-separated integers."})
+
+    return errors
+
+
+def valid_entry(rng, num):
+    n = rng.choice([3, 4, 4, 5])
+    return {
+        "language": LANGUAGE, "country": "Sweden", "file_name": f"exam_{num % 50}.pdf",
+        "source": "https://example.org", "license": "open", "level": "University Entrance",
+        "category_en": "Physics", "category_original_lang": "Fysik",
+        "original_question_num": rng.choice([num, str(num)]),
+        "question": f"Question {num}: what is the value of x in problem {rng.random():.6f}?",
+        "options": [f"Option {i} of {num}" for i in range(1, n + 1)],
+        "answer": rng.choice([str(rng.randint(1, n)), f"{rng.randint(1, n)},{rng.randint(1, n)}"]),
+    }
+
+
+MUTATIONS = [
+    lambda e, rng: e.pop(rng.choice(list(e))),
+    lambda e, rng: e.update(question="  "),
+    lambda e, rng: e.update(level=None),
+    lambda e, rng: e.update(question=42),
+    lambda e, rng: e.update(original_question_num=3.0),
+    lambda e, rng: e.update(original_question_num=True),
+    lambda e, rng: e.update(options="a, b, c"),
+    lambda e, rng: e.update(options=["a", "", "c"]),
+    lambda e, rng: e.update(options=["a", 2, "c"]),
+    lambda e, rng: e.update(options=["same"] * 4),
+    lambda e, rng: e.update(options=[]),
+    lambda e, rng: e.update(language="EN"),
+    lambda e, rng: e.update(language=7),
+    lambda e, rng: e.update(answer=2),
+    lambda e, rng: e.update(answer="9"),
+    lambda e, rng: e.update(answer="0"),
+    lambda e, rng: e.update(answer=" 2 , 1"),
+    lambda e, rng: e.update(answer="B"),
+    lambda e, rng: e.update(answer=""),
+]
+
+
+def make_entries(count, invalid, seed=0):
+    rng = random.Random(seed)
+    entries = []
+    for num in range(count):
+        entry = valid_entry(rng, num)
+        if rng.random() < invalid:
+            for mutation in rng.sample(MUTATIONS, rng.randint(1, 2)):
+                mutation(entry, rng)
+        entries.append(entry)
+    return entries
+
+
+def run(validate, entries):
+    """
+    return: tuple, (seconds, list of the errors or raised exception per entry)
+    """
+    results = []
+    start = time.perf_counter()
+    for idx, entry in enumerate(entries):
+        try:
+            results.append(validate(idx, entry))
+        except Exception as e:
+            results.append(repr(e))
+    return time.perf_counter() - start, results
+
+
+def main(count, invalid):
+    print(f"Generating {count} entries ({invalid:.0%} with errors)")
+    entries = make_entries(count, invalid)
+    # the entries live until the end, keep the collector from rescanning them
+    gc.freeze()
+    evaluator = JSONEvaluator(json_file=None, language_code=LANGUAGE)
+
+    timings = {}
+    reference_time, reference = run(partial(validate_entry_reference, evaluator.schema, LANGUAGE), entries)
+    timings["reference"] = reference_time
+    checker_time, checker = run(evaluator.validate_entry, entries)
+    timings["checker"] = checker_time
+
+    header = f"{'validator':<10} {'seconds':>8} {'entries/s':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, seconds in timings.items():
+        print(f"{name:<10} {seconds:>8.2f} {count / seconds:>11,.0f}")
+    print(f"\nSpeed-up: {reference_time / checker_time:.1f}x")
+
+    mismatches = [idx for idx, (a, b) in enumerate(zip(reference, checker)) if a != b]
+    errors = sum(len(r) if isinstance(r, list) else 1 for r in reference)
+    if mismatches:
+        idx = mismatches[0]
+        print(f"{len(mismatches)} entries differ, e.g. entry {idx}:")
+        print(f"  entry:     {entries[idx]}")
+        print(f"  reference: {reference[idx]}")
+        print(f"  checker:   {checker[idx]}")
+        sys.exit(1)
+    print(f"Identical results on every entry ({errors} errors).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--entries", type=int, default=1000000, help="Number of entries to validate."
+    )
+    parser.add_argument(
+        "--invalid", type=float, default=0.2, help="Share of entries with errors."
+    )
+
+    args = parser.parse_args()
+    main(count=args.entries, invalid=args.invalid)
@@ -14,6 +14,9 @@ from os import listdir
 from os.path import isfile, join
 import os
 
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+from response_cache import ResponseCache
+
 
 pre_prompt = """Please extract the multiple-choice questions that are present in the following text. The out format should be the following:
 <Question>
@@ -26,38 +29,71 @@ The text is the following:"""
 
 
 def chat_completion(
-    client, messages, model, return_text=True, return_usage=True, model_args=None
+    client,
+    messages,
+    model,
+    return_text=True,
+    return_usage=True,
+    model_args=None,
+    cache=None,
 ):
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
-
-            if return_text:
-                return text
-
-            if return_usage:
-                return usage
-
-            return response
-        except (
+    # serve repeated requests from the on-disk cache (text and usage only)
+    if cache is not None and (return_text or return_usage):
+        key = cache.make_key(model, messages, model_args)
+        cached = cache.get(key)
+        if cached is None:
+            text, usage = chat_completion(client, messages, model, model_args=model_args)
+            cached = {"text": text, "usage": usage}
+            cache.put(key, cached)
+
+        if return_text and return_usage:
+            return cached["text"], cached["usage"]
+
+        if return_text:
+            return cached["text"]
+
+        return cached["usage"]
+
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
+
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
 
 
 def parse_gpt_output(q):
@@ -95,8 +131,9 @@ def parse_gpt_output(q):
     return question, choice_1, choice_2, choice_3, choice_4, choice_5
 
 
-def main(dir_path, openai_key):
+def main(dir_path, openai_key, cache_dir=None):
     client = OpenAI(api_key=openai_key)
+    cache = ResponseCache(cache_dir) if cache_dir else None
 
     dir_path_parsed = dir_path + "/parsed"
     onlyfiles = [
@@ -126,6 +163,7 @@ def main(dir_path, openai_key):
                     "frequency_penalty": 0,
                     "presence_penalty": 0,
                 },
+                cache=cache,
             )
             row["output"] = response
 
@@ -175,5 +213,12 @@ if __name__ == "__main__":
 
     parser.add_argument("-k", "--key", help="", default="")
 
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        help="Folder of the on-disk API response cache (disabled by default)",
+        default=None,
+    )
+
     args = parser.parse_args()
-    main(dir_path=args.dir, client=args.key)
+    main(dir_path=args.dir, openai_key=args.key, cache_dir=args.cache_dir)
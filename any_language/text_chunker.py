@@ -0,0 +1,216 @@
+"""
+Token-aware chunking of exam text for the text-to-MCQ scripts.
+
+The text is cut into question blocks (a block starts at a line beginning with
+a question number, "12. "), and whole blocks are packed greedily into chunks
+of at most `max_tokens` tokens, so every request is as full as the budget
+allows without splitting a question. Only a block that does not fit on its
+own is split, at line boundaries (or, for a single overlong line, at the
+token budget).
+
+Tokens are counted with a local tokenizer (see load_token_counter): the
+tokenizer of the served model through the `tokenizers` library, a tiktoken
+encoding, or, when neither is available, an estimate from the UTF-8 length,
+which unlike a character count grows with the number of bytes a script needs
+(three per Devanagari character, two per Urdu one).
+
+Blocks and chunks are generators, so a large text file is read a line at a
+time and never held in memory as a whole.
+
+Usage (chunk statistics of the text files of a folder):
+    python text_chunker.py processed --max_tokens 1500 --tokenizer meta-llama/Meta-Llama-3.1-70B-Instruct
+"""
+
+import os
+import re
+import argparse
+
+QUESTION_START = re.compile(r"^\d+\.\s")
+SEPARATOR = "\n\n"
+DEFAULT_TOKENIZER = "meta-llama/Meta-Llama-3.1-70B-Instruct"
+
+
+def approx_token_count(text):
+    """
+    Estimate of the tokens of a byte-level BPE tokenizer: ~4 bytes of UTF-8
+    per token, so ~4 Latin characters but ~1.3 Devanagari ones.
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def load_token_counter(name=DEFAULT_TOKENIZER):
+    """
+    Loads a local token counter.
+
+    :param name: str, one of
+        - "chars": counts characters, like the old fixed-size chunks;
+        - "approx": approx_token_count;
+        - a tiktoken encoding name, e.g. "cl100k_base" or "o200k_base";
+        - a tokenizer.json file or a Hugging Face model name, loaded with the
+          `tokenizers` library (from the local cache once downloaded).
+        A tokenizer that cannot be loaded falls back to "approx".
+    return: tuple, (function str -> int, description of the counter)
+    """
+    if name == "chars":
+        return len, "characters"
+    if name == "approx":
+        return approx_token_count, "approximate tokens (UTF-8 bytes / 4)"
+
+    error = None
+    if name.endswith("_base"):
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(name)
+            return (lambda text: len(encoding.encode(text, disallowed_special=()))), name
+        except Exception as e:
+            error = e
+    else:
+        try:
+            from tokenizers import Tokenizer
+
+            if os.path.isfile(name):
+                tokenizer = Tokenizer.from_file(name)
+            else:
+                tokenizer = Tokenizer.from_pretrained(name)
+            return (lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)), name
+        except Exception as e:
+            error = e
+    print(f"Could not load the tokenizer {name} ({error}), estimating tokens from the UTF-8 length")
+    return approx_token_count, "approximate tokens (UTF-8 bytes / 4)"
+
+
+def iter_question_blocks(lines):
+    """
+    Groups lines into question blocks: text before the first question is a
+    block of its own, then every block starts at a line matching
+    QUESTION_START.
+
+    :param lines: iterable of str, e.g. an open text file
+    return: generator of str, stripped blocks (empty ones are skipped)
+    """
+    block = []
+    for line in lines:
+        if QUESTION_START.match(line) and block:
+            text = "".join(block).strip()
+            if text:
+                yield text
+            block = []
+        block.append(line)
+    text = "".join(block).strip()
+    if text:
+        yield text
+
+
+def _split_block(block, count_tokens, max_tokens):
+    # pieces of an oversized block, at line boundaries where possible
+    piece, piece_tokens = [], 0
+    newline_tokens = count_tokens("\n")
+    for line in block.split("\n"):
+        line_tokens = count_tokens(line)
+        if line_tokens > max_tokens:
+            if piece:
+                yield "\n".join(piece)
+                piece, piece_tokens = [], 0
+            yield from _split_line(line, count_tokens, max_tokens)
+            continue
+        if piece and piece_tokens + newline_tokens + line_tokens > max_tokens:
+            yield "\n".join(piece)
+            piece, piece_tokens = [], 0
+        piece_tokens += (newline_tokens if piece else 0) + line_tokens
+        piece.append(line)
+    if piece:
+        yield "\n".join(piece)
+
+
+def _split_line(line, count_tokens, max_tokens):
+    # a single line over the budget: cut it at the last word boundary that
+    # fits, found by bisection on the length
+    while line:
+        if count_tokens(line) <= max_tokens:
+            yield line
+            return
+        low, high = 1, len(line)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(line[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        cut = line.rfind(" ", 0, low + 1)
+        if cut <= 0:
+            cut = low
+        yield line[:cut].strip()
+        line = line[cut:].strip()
+
+
+def pack_blocks(blocks, count_tokens, max_tokens=1500):
+    """
+    Packs question blocks greedily into chunks of at most `max_tokens` tokens,
+    joined by blank lines. The tokens of a chunk are the sum of the tokens of
+    its blocks and separators, each counted once.
+
+    :param blocks: iterable of str, see iter_question_blocks
+    :param count_tokens: function str -> int, see load_token_counter
+    :param max_tokens: int, token budget of a chunk
+    return: generator of (chunk text, tokens)
+    """
+    separator_tokens = count_tokens(SEPARATOR)
+    chunk, chunk_tokens = [], 0
+    for block in blocks:
+        block_tokens = count_tokens(block)
+        if block_tokens > max_tokens:
+            pieces = [(piece, count_tokens(piece)) for piece in _split_block(block, count_tokens, max_tokens)]
+        else:
+            pieces = [(block, block_tokens)]
+        for piece, piece_tokens in pieces:
+            if chunk and chunk_tokens + separator_tokens + piece_tokens > max_tokens:
+                yield SEPARATOR.join(chunk), chunk_tokens
+                chunk, chunk_tokens = [], 0
+            chunk_tokens += (separator_tokens if chunk else 0) + piece_tokens
+            chunk.append(piece)
+    if chunk:
+        yield SEPARATOR.join(chunk), chunk_tokens
+
+
+def iter_file_chunks(path, count_tokens, max_tokens=1500, encoding="utf-8"):
+    """
+    Streams the chunks of a text file, reading it a line at a time.
+
+    return: generator of (chunk text, tokens)
+    """
+    with open(path, "r", encoding=encoding) as f:
+        yield from pack_blocks(iter_question_blocks(f), count_tokens, max_tokens)
+
+
+def chunk_text(text, count_tokens, max_tokens=1500):
+    """
+    return: list of str, the chunks of an in-memory text
+    """
+    lines = text.splitlines(keepends=True)
+    return [chunk for chunk, _ in pack_blocks(iter_question_blocks(lines), count_tokens, max_tokens)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print how the text files of a folder are chunked.")
+    parser.add_argument("inputs", nargs="+", help="Text files or folders of text files")
+    parser.add_argument("--max_tokens", type=int, default=1500, help="Token budget of a chunk")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="chars, approx, a tiktoken encoding, a tokenizer.json or a Hugging Face model")
+    args = parser.parse_args()
+
+    count_tokens, counter_name = load_token_counter(args.tokenizer)
+    print(f"Counting {counter_name}, at most {args.max_tokens} per chunk")
+    for path in args.inputs:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".txt"))
+        else:
+            files = [path]
+        for text_file in files:
+            sizes = [tokens for _, tokens in iter_file_chunks(text_file, count_tokens, args.max_tokens)]
+            if sizes:
+                print(
+                    f"{text_file}: {len(sizes)} chunks, {sum(sizes)} tokens, "
+                    f"mean fill {sum(sizes) / len(sizes) / args.max_tokens:.0%}, largest {max(sizes)}"
+                )
+            else:
+                print(f"{text_file}: empty")
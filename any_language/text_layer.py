@@ -0,0 +1,269 @@
+"""
+Per-page detection of born-digital pages, whose embedded text layer can be
+used as it is, and scanned pages, which have to be OCRed or sent to a vision
+model.
+
+A page is classified from PyMuPDF's text trace (every glyph drawn, with its
+font and Unicode value), without rendering it:
+- text density: printable characters per square inch. A page with no text,
+  or little text over a large image, is a scan;
+- glyph coverage: share of the glyphs that map to a real character, not to
+  U+FFFD, a private-use code point or a control character. Fonts without a
+  usable ToUnicode map extract as garbage;
+- fonts: text drawn invisibly (render mode 3) or in the GlyphLessFont of
+  OCR tools is an OCR layer over a scan, and legacy non-Unicode fonts (e.g.
+  Kruti Dev or Shree Dev for Hindi) put Latin letters in place of the
+  script's characters;
+- script: for languages that are not written in Latin letters, the share of
+  the letters in the expected script, which catches legacy fonts not in the
+  list above.
+
+Usage (per-page report of the pdfs of a folder):
+    python text_layer.py pdfs --lang hin
+"""
+
+import os
+import re
+import sys
+import argparse
+import unicodedata
+from collections import Counter, namedtuple
+
+import fitz  # PyMuPDF
+
+# non-Unicode fonts, mostly Devanagari, that map the script onto Latin code points
+LEGACY_FONTS = re.compile(
+    r"kruti|shree[-_ ]?(dev|sym)|chanakya|devlys|walkman|shusha|aps[-_ ]?dv|akruti|agra",
+    re.IGNORECASE,
+)
+# fonts of the invisible text layer that OCR tools (Tesseract, OCRmyPDF) add
+OCR_FONTS = re.compile(r"glyphless", re.IGNORECASE)
+
+# first and last code point of the script of a Tesseract language code
+SCRIPTS = {
+    "hin": ("\u0900", "\u097f"),
+    "mar": ("\u0900", "\u097f"),
+    "nep": ("\u0900", "\u097f"),
+    "san": ("\u0900", "\u097f"),
+    "ben": ("\u0980", "\u09ff"),
+    "pan": ("\u0a00", "\u0a7f"),
+    "guj": ("\u0a80", "\u0aff"),
+    "ori": ("\u0b00", "\u0b7f"),
+    "tam": ("\u0b80", "\u0bff"),
+    "tel": ("\u0c00", "\u0c7f"),
+    "kan": ("\u0c80", "\u0cff"),
+    "mal": ("\u0d00", "\u0d7f"),
+    "ara": ("\u0600", "\u06ff"),
+    "fas": ("\u0600", "\u06ff"),
+    "urd": ("\u0600", "\u06ff"),
+    "heb": ("\u0590", "\u05ff"),
+    "rus": ("\u0400", "\u04ff"),
+    "ukr": ("\u0400", "\u04ff"),
+    "bul": ("\u0400", "\u04ff"),
+    "ell": ("\u0370", "\u03ff"),
+}
+
+# language names and ISO 639-1 codes of the scripts above
+LANGUAGE_CODES = {
+    "hindi": "hin", "hi": "hin",
+    "marathi": "mar", "mr": "mar",
+    "nepali": "nep", "ne": "nep",
+    "sanskrit": "san", "sa": "san",
+    "bengali": "ben", "bn": "ben",
+    "punjabi": "pan", "pa": "pan",
+    "gujarati": "guj", "gu": "guj",
+    "odia": "ori", "oriya": "ori", "or": "ori",
+    "tamil": "tam", "ta": "tam",
+    "telugu": "tel", "te": "tel",
+    "kannada": "kan", "kn": "kan",
+    "malayalam": "mal", "ml": "mal",
+    "arabic": "ara", "ar": "ara",
+    "persian": "fas", "farsi": "fas", "fa": "fas",
+    "urdu": "urd", "ur": "urd",
+    "hebrew": "heb", "he": "heb",
+    "russian": "rus", "ru": "rus",
+    "ukrainian": "ukr", "uk": "ukr",
+    "bulgarian": "bul", "bg": "bul",
+    "greek": "ell", "el": "ell",
+}
+
+POINTS_PER_INCH = 72
+
+PageLayer = namedtuple(
+    "PageLayer",
+    ["page_num", "kind", "reason", "chars", "density", "glyph_coverage", "image_coverage", "text"],
+)
+PageLayer.__doc__ = """
+The text layer of a page.
+
+page_num: int, 1-based page number
+kind: "text" (born-digital, use `text`) or "scan" (OCR or vision needed)
+reason: str, why the page is a scan ("" for text pages)
+chars: int, printable characters of the text layer
+density: float, printable characters per square inch
+glyph_coverage: float, share of the glyphs mapped to a real character
+image_coverage: float, share of the page covered by images
+text: str, the text of the page ("" for scans)
+"""
+
+
+def script_of(lang):
+    """
+    return: tuple (first, last) code point of the script of a Tesseract
+        language string such as "hin+eng", a language name ("Hindi") or an
+        ISO 639-1 code ("hi"), or None for Latin scripts
+    """
+    if not lang:
+        return None
+    for code in re.split(r"[+,]", lang):
+        code = code.strip().lower()
+        code = LANGUAGE_CODES.get(code, code)
+        if code in SCRIPTS:
+            return SCRIPTS[code]
+    return None
+
+
+def _is_unmapped(char):
+    if char == "\ufffd":
+        return True
+    category = unicodedata.category(char)
+    # private use (legacy symbol fonts) and control characters
+    return category in ("Co", "Cc") and not char.isspace()
+
+
+def _image_coverage(page):
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = 0.0
+    for image in page.get_image_info():
+        covered += abs(fitz.Rect(image["bbox"]) & page.rect)
+    return min(1.0, covered / area)
+
+
+def classify_page(
+    page,
+    script=None,
+    min_density=2.0,
+    min_glyph_coverage=0.95,
+    max_legacy_share=0.05,
+    max_invisible_share=0.5,
+    min_script_share=0.2,
+    scan_image_coverage=0.5,
+):
+    """
+    Classifies a page as born-digital ("text") or scanned ("scan").
+
+    :param page: fitz.Page
+    :param script: tuple (first, last) code point of the expected script (see
+        script_of), None for Latin scripts
+    :param min_density: float, printable characters per square inch below
+        which a page mostly covered by images is a scan
+    :param min_glyph_coverage: float, share of mapped glyphs below which the
+        text layer is unusable
+    :param max_legacy_share: float, share of the glyphs in a legacy font
+        above which the text layer is unusable
+    :param max_invisible_share: float, share of invisible glyphs above which
+        the text layer is an OCR layer
+    :param min_script_share: float, share of the letters in `script` below
+        which the text layer is unusable
+    :param scan_image_coverage: float, share of the page covered by images
+        above which a page with sparse text is a scan
+    return: PageLayer (with page_num 0)
+    """
+    glyphs = printable = unmapped = invisible = legacy = letters = in_script = 0
+    for span in page.get_texttrace():
+        font = span["font"]
+        span_invisible = span["type"] == 3 or span["opacity"] == 0 or OCR_FONTS.search(font)
+        span_legacy = LEGACY_FONTS.search(font)
+        for unicode, *_ in span["chars"]:
+            glyphs += 1
+            invisible += bool(span_invisible)
+            legacy += bool(span_legacy)
+            char = chr(unicode)
+            if char.isspace():
+                continue
+            printable += 1
+            if _is_unmapped(char):
+                unmapped += 1
+            elif char.isalpha():
+                letters += 1
+                if script is not None and script[0] <= char <= script[1]:
+                    in_script += 1
+
+    area_inches = abs(page.rect) / POINTS_PER_INCH**2
+    density = printable / area_inches if area_inches else 0.0
+    glyph_coverage = 1 - unmapped / printable if printable else 0.0
+    image_coverage = _image_coverage(page)
+
+    if printable == 0:
+        reason = "no text"
+    elif invisible > max_invisible_share * glyphs:
+        reason = "ocr layer"
+    elif legacy > max_legacy_share * glyphs:
+        reason = "legacy font"
+    elif glyph_coverage < min_glyph_coverage:
+        reason = "unmapped glyphs"
+    elif script is not None and letters and in_script < min_script_share * letters:
+        reason = "wrong script"
+    elif density < min_density and image_coverage >= scan_image_coverage:
+        reason = "sparse text over image"
+    else:
+        reason = ""
+
+    kind = "scan" if reason else "text"
+    text = page.get_text() if kind == "text" else ""
+    return PageLayer(0, kind, reason, printable, density, glyph_coverage, image_coverage, text)
+
+
+def classify_pdf(pdf_path, script=None, pages=None, **thresholds):
+    """
+    Classifies the pages of a pdf file.
+
+    :param pdf_path: str
+    :param script: tuple, see classify_page
+    :param pages: iterable of 1-based page numbers, or None for every page
+    :param thresholds: see classify_page
+    return: list of PageLayer, in page order
+    """
+    with fitz.open(pdf_path) as document:
+        if pages is None:
+            pages = range(1, document.page_count + 1)
+        return [
+            classify_page(document[page_num - 1], script, **thresholds)._replace(page_num=page_num)
+            for page_num in pages
+            if 1 <= page_num <= document.page_count
+        ]
+
+
+def print_report(pdf_path, layers, pages=True):
+    kinds = Counter(layer.kind for layer in layers)
+    print(f"{pdf_path}: {kinds['text']} born-digital pages, {kinds['scan']} scanned pages")
+    for layer in layers if pages else []:
+        print(
+            f"  page {layer.page_num:>4}  {layer.kind:<4}  {layer.chars:>6} chars  "
+            f"{layer.density:7.1f}/in2  glyphs {layer.glyph_coverage:6.1%}  "
+            f"images {layer.image_coverage:6.1%}  {layer.reason}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report which pdf pages have a usable text layer.")
+    parser.add_argument("inputs", nargs="+", help="Pdf files or folders of pdf files")
+    parser.add_argument("-l", "--lang", default=None, help="Tesseract language(s) of the documents, e.g. hin+eng, to check the script")
+    parser.add_argument("--summary", action="store_true", help="Only print the page counts of each file")
+    args = parser.parse_args()
+
+    script = script_of(args.lang)
+    for path in args.inputs:
+        if os.path.isdir(path):
+            pdf_files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(".pdf"))
+        else:
+            pdf_files = [path]
+        for pdf_file in pdf_files:
+            try:
+                layers = classify_pdf(pdf_file, script)
+            except (RuntimeError, ValueError) as e:
+                print(f"{pdf_file}: could not be opened ({e})", file=sys.stderr)
+                continue
+            print_report(pdf_file, layers, pages=not args.summary)
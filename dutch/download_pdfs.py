@@ -2,29 +2,134 @@
 
 """
 Description: Download selected exam files from alleexamens.nl
-Usage: download_pdfs.py
+Usage: download_pdfs.py [--workers 16] [--base_url https://static.alleexamens.nl]
+
+Most of the hypothetical URLs do not exist, so every URL is first probed
+with a HEAD request on a pooled keep-alive connection, `workers` at a time.
+Files that exist are streamed to a temporary file and renamed into place,
+and their size and ETag are recorded in download_index.json; a file that is
+already on disk with the size (and ETag, if the server sends one) of the
+remote file is not downloaded again, so an interrupted run can be resumed.
+
+To try it without the real server, serve a folder with the same layout:
+    python mock_exam_server.py --port 8000 --mirror mirror
+    python download_pdfs.py --base_url http://localhost:8000
+or let mock_exam_server.py --check build a mirror and check the download,
+skip, re-download and failed-download paths.
 """
 
-import requests
 import os
+import sys
+import json
+import argparse
+from functools import partial
+
+import requests
 import tqdm
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from page_executor import imap_ordered
 
+BASE_URL = "https://static.alleexamens.nl"
+INDEX_FILE = "download_index.json"
+CHUNK_SIZE = 1 << 20
 
-def download_file(url, folder):
-    """Given an exam pdf URL, try to download the pdf file."""
+def make_session(pool_size):
+    """
+    A session shared by the worker threads, keeping up to `pool_size`
+    connections to the server alive and retrying transient errors.
+    """
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["HEAD", "GET"])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
+
+def exam_file(url, folder):
     exam_id = "_".join(url.split("/")[3:7]).replace("%20", "-")
-    save_file = f"{folder}/{exam_id}.pdf"
+    return f"{folder}/{exam_id}.pdf"
+
 
-    r = requests.get(url, allow_redirects=True)
-    if r.status_code == requests.codes.ok:
-        with open(save_file, "wb") as f:
-            f.write(r.content)
-    else:
-        pass  # not all exams exist for all years
+def download_file(url, folder, session, index, timeout=30):
+    """
+    Given an exam pdf URL, try to download the pdf file.
 
+    :param session: requests.Session, see make_session
+    :param index: dict, save file -> {"size", "etag"} of the files downloaded
+        by earlier runs (updated in place)
+    return: tuple, (save file, status), status being "downloaded", "skipped"
+        (already on disk), "missing" (not all exams exist for all years) or
+        "failed: <reason>"
+    """
+    save_file = exam_file(url, folder)
+    try:
+        head = session.head(url, allow_redirects=True, timeout=timeout)
+        if head.status_code == 404:
+            return save_file, "missing"
+        if head.status_code == requests.codes.ok:
+            size = head.headers.get("Content-Length")
+            etag = head.headers.get("ETag")
+            known = index.get(save_file, {})
+            if (
+                size is not None
+                and os.path.exists(save_file)
+                and os.path.getsize(save_file) == int(size)
+                and (etag is None or known.get("etag") in (None, etag))
+            ):
+                return save_file, "skipped"
+        # servers that do not answer HEAD (e.g. 405) are asked with GET
 
-def main():
+        with session.get(url, allow_redirects=True, stream=True, timeout=timeout) as r:
+            if r.status_code == 404:
+                return save_file, "missing"
+            if r.status_code != requests.codes.ok:
+                return save_file, f"failed: HTTP {r.status_code}"
+            tmp_file = f"{save_file}.part"
+            written = 0
+            try:
+                with open(tmp_file, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+            except requests.RequestException:
+                # e.g. the connection dropped mid-file: no partial file is left
+                os.remove(tmp_file)
+                raise
+            expected = r.headers.get("Content-Length")
+            if expected is not None and "Content-Encoding" not in r.headers and written != int(expected):
+                os.remove(tmp_file)
+                return save_file, f"failed: got {written} of {expected} bytes"
+            os.replace(tmp_file, save_file)
+            index[save_file] = {"size": written, "etag": r.headers.get("ETag")}
+            return save_file, "downloaded"
+    except requests.RequestException as e:
+        return save_file, f"failed: {e}"
+
+
+def load_index(path):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_index(path, index):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def main(base_url=BASE_URL, workers=16, timeout=30):
+    """
+    return: dict, status -> number of files, and "failures", the save files
+        that failed with their status
+    """
 
     # pre-defined: selected subjects per university sub-level
     lvl_subj = {
@@ -41,24 +146,47 @@ def main():
     }
 
     # retrieve all hypothetical urls
+    base_url = base_url.rstrip("/")
     h_que_urls, h_ans_urls = [], []
     for level in lvl_subj.keys():
         for subject in lvl_subj[level]:
             for year in range(1999, 2025):
                 for period in ["I", "II"]:
-                    h_que_urls.append(f"https://static.alleexamens.nl/{level}/{subject}/{year}/{period}/{subject}/"
+                    h_que_urls.append(f"{base_url}/{level}/{subject}/{year}/{period}/{subject}/"
                                       f"{subject}%20{year}%20{period}_opgaven.pdf")
-                    h_ans_urls.append(f"https://static.alleexamens.nl/{level}/{subject}/{year}/{period}/{subject}/"
+                    h_ans_urls.append(f"{base_url}/{level}/{subject}/{year}/{period}/{subject}/"
                                       f"{subject}%20{year}%20{period}_correctievoorschrift.pdf")
 
-    # download files
-    os.mkdir("answers")
-    for url in tqdm.tqdm(h_ans_urls):
-        download_file(url, "answers")
-    os.mkdir("exams")
-    for url in tqdm.tqdm(h_que_urls):
-        download_file(url, "exams")
+    # download files, `workers` requests in flight
+    index = load_index(INDEX_FILE)
+    session = make_session(workers)
+    counts, failures = {}, {}
+    try:
+        for folder, urls in [("answers", h_ans_urls), ("exams", h_que_urls)]:
+            os.makedirs(folder, exist_ok=True)
+            results = imap_ordered(
+                partial(download_file, folder=folder, session=session, index=index, timeout=timeout),
+                urls,
+                max_workers=workers,
+            )
+            for save_file, status in tqdm.tqdm(results, total=len(urls), desc=folder):
+                kind = status.split(":")[0]
+                counts[kind] = counts.get(kind, 0) + 1
+                if kind == "failed":
+                    failures[save_file] = status
+                    tqdm.tqdm.write(f"{save_file}: {status}")
+    finally:
+        session.close()
+        save_index(INDEX_FILE, index)
+
+    print(", ".join(f"{count} {kind}" for kind, count in sorted(counts.items())))
+    return dict(counts, failures=failures)
 
 
 if __name__ == '__main__':
-    main()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--base_url", default=BASE_URL, help="Server to download from, e.g. a local mirror")
+    arg_parser.add_argument("-w", "--workers", type=int, default=16, help="Number of concurrent requests")
+    arg_parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the server")
+    args = arg_parser.parse_args()
+    main(base_url=args.base_url, workers=args.workers, timeout=args.timeout)
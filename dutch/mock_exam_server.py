@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""
+Description: Local stand-in for static.alleexamens.nl, to test download_pdfs.py offline.
+Usage: mock_exam_server.py [--port 8000] [--mirror mirror] [--truncate FILE ...]
+       mock_exam_server.py --check
+
+Serves the files of a mirror folder laid out like the server (paths are URL
+decoded, so "Biologie%202020%20I_opgaven.pdf" is "Biologie 2020 I_opgaven.pdf")
+over HTTP/1.1 keep-alive connections. HEAD and GET answers carry the size
+and an ETag derived from the size and modification time, like a static file
+server. Files given with --truncate announce their full size but the
+connection is closed after half of it, to reproduce a dropped download.
+
+With --check, a mirror with a few exams is built in a temporary folder and
+download_pdfs.main is run against it several times, checking that:
+- existing files are downloaded and the others reported missing;
+- a second run skips every file without downloading it again;
+- a file changed on the server (same size, new ETag) or deleted locally is
+  downloaded again, and a stale .part file does not matter;
+- a dropped download fails without leaving a partial file and keeps the
+  previous version of the file.
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_SIZE = 1 << 16
+
+
+class MockState:
+    def __init__(self, mirror, truncate=()):
+        self.mirror = os.path.abspath(mirror)
+        self.truncate = set(truncate)
+        self.lock = threading.Lock()
+        self.gets = 0
+        self.heads = 0
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def resolve(self):
+        relative = unquote(self.path.split("?")[0]).lstrip("/")
+        path = os.path.abspath(os.path.join(self.state.mirror, relative))
+        if not path.startswith(self.state.mirror + os.sep) or not os.path.isfile(path):
+            return None, relative
+        return path, relative
+
+    def send_file_headers(self, path):
+        stat = os.stat(path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"')
+        self.end_headers()
+        return stat.st_size
+
+    def send_not_found(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        with self.state.lock:
+            self.state.heads += 1
+        path, _ = self.resolve()
+        if path is None:
+            self.send_not_found()
+            return
+        self.send_file_headers(path)
+
+    def do_GET(self):
+        with self.state.lock:
+            self.state.gets += 1
+        path, relative = self.resolve()
+        if path is None:
+            self.send_not_found()
+            return
+        size = self.send_file_headers(path)
+        limit = size // 2 if relative in self.state.truncate else size
+        with open(path, "rb") as f:
+            sent = 0
+            while sent < limit:
+                chunk = f.read(min(CHUNK_SIZE, limit - sent))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+        if limit < size:
+            self.close_connection = True
+
+
+class MockServer(ThreadingHTTPServer):
+    # the default backlog of 5 refuses connections from concurrent clients
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_server(mirror, host="127.0.0.1", port=8000, truncate=()):
+    """
+    Creates the mock server; call serve_forever() on it (e.g. from a thread).
+
+    :param truncate: iterable of str, mirror-relative paths of the files
+        whose downloads are cut after half of the file
+    """
+    handler = type("Handler", (MirrorHandler,), {"state": MockState(mirror, truncate)})
+    return MockServer((host, port), handler)
+
+
+def exam_path(level, subject, year, period, kind="opgaven"):
+    # mirror-relative path of an exam, see the URLs in download_pdfs.main
+    return f"{level}/{subject}/{year}/{period}/{subject}/{subject} {year} {period}_{kind}.pdf"
+
+
+def write_pdf(path, size, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = bytes((seed + i * 7) % 251 for i in range(size - 5))
+    with open(path, "wb") as f:
+        f.write(b"%PDF-" + body)
+
+
+def check():
+    """
+    Runs download_pdfs.main against a temporary mirror, see the module
+    docstring.
+
+    return: bool, whether every check passed
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import download_pdfs
+
+    files = [
+        exam_path("VWO", "Biologie", 2020, "I"),
+        exam_path("VWO", "Biologie", 2020, "I", "correctievoorschrift"),
+        exam_path("HAVO", "Economie", 2015, "II"),
+        exam_path("VMBO-GL", "Aardrijkskunde", 2003, "I"),
+    ]
+    # where download_pdfs.exam_file saves them
+    local = [
+        "{}/{}.pdf".format(
+            "answers" if path.endswith("_correctievoorschrift.pdf") else "exams",
+            "_".join(path.split("/")[:4]),
+        )
+        for path in files
+    ]
+
+    root = tempfile.mkdtemp(prefix="mock_exams_")
+    mirror = os.path.join(root, "mirror")
+    work = os.path.join(root, "work")
+    os.makedirs(work)
+    for i, path in enumerate(files):
+        write_pdf(os.path.join(mirror, path), 150_000 + 10_000 * i, i)
+
+    server = make_server(mirror, port=0)
+    state = server.RequestHandlerClass.state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+
+    def expect(name, condition):
+        results.append(condition)
+        print(f"{'ok  ' if condition else 'FAIL'} {name}")
+
+    def same(i):
+        with open(os.path.join(mirror, files[i]), "rb") as a, open(os.path.join(work, local[i]), "rb") as b:
+            return a.read() == b.read()
+
+    def run():
+        state.gets = 0
+        with open(os.devnull, "w") as devnull:
+            stderr, sys.stderr = sys.stderr, devnull
+            try:
+                return download_pdfs.main(base_url=base_url, workers=16, timeout=10)
+            finally:
+                sys.stderr = stderr
+
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        counts = run()
+        expect("first run downloads the existing files", counts.get("downloaded") == len(files))
+        expect("first run reports the other files missing", counts.get("missing", 0) > 0 and not counts["failures"])
+        expect("downloaded files match the mirror", all(same(i) for i in range(len(files))))
+
+        counts = run()
+        expect("second run skips every file", counts.get("skipped") == len(files) and "downloaded" not in counts)
+        expect("second run sends no GET for the files", state.gets == 0)
+
+        # same size, new content and modification time: only the ETag changes
+        write_pdf(os.path.join(mirror, files[0]), 150_000, 99)
+        os.utime(os.path.join(mirror, files[0]), ns=(1, 1))
+        os.remove(os.path.join(work, local[1]))
+        with open(os.path.join(work, local[1]) + ".part", "wb") as f:
+            f.write(b"stale")
+        counts = run()
+        expect("changed and deleted files are downloaded again", counts.get("downloaded") == 2)
+        expect("unchanged files are still skipped", counts.get("skipped") == len(files) - 2)
+        expect("re-downloaded files match the mirror", same(0) and same(1))
+        expect("the stale .part file is replaced", not os.path.exists(os.path.join(work, local[1]) + ".part"))
+
+        with open(os.path.join(work, local[2]), "rb") as f:
+            previous = f.read()
+        write_pdf(os.path.join(mirror, files[2]), 300_000, 42)
+        state.truncate.add(files[2])
+        counts = run()
+        status = counts["failures"].get(local[2], "")
+        expect("a dropped download fails", status.startswith("failed"))
+        expect("a dropped download leaves no partial file", not os.path.exists(os.path.join(work, local[2]) + ".part"))
+        with open(os.path.join(work, local[2]), "rb") as f:
+            expect("a dropped download keeps the previous file", f.read() == previous)
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(root)
+
+    print(f"{sum(results)} of {len(results)} checks passed")
+    return all(results)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--mirror", default="mirror", help="Folder laid out like the server")
+    arg_parser.add_argument("--truncate", nargs="+", default=[], help="Mirror-relative files whose downloads are cut in half")
+    arg_parser.add_argument("--check", action="store_true", help="Check download_pdfs.py against a temporary mirror and exit")
+    args = arg_parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check() else 1)
+    server = make_server(args.mirror, args.host, args.port, args.truncate)
+    print(f"Serving {args.mirror} on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
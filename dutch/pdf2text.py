@@ -2,32 +2,205 @@
 
 """
 Description: Extract plain text from exam PDFs.
-Usage: pdf2text.py
+Usage: pdf2text.py [--workers 8] [--servers 2] [--endpoints http://host:9998 ...] [--force]
+
+The PDFs are sent to Apache Tika servers over HTTP, `workers` at a time,
+on pooled keep-alive connections. The servers are started once at the
+beginning (`servers` JVMs from the Tika server jar, on consecutive ports)
+and stopped at the end, unless already running servers are given with
+--endpoints. PDFs whose text file is newer than the PDF are skipped, so an
+interrupted run can be restarted. The time taken by every file is written
+to pdf2text_timings.csv and summarized at the end.
+
+The jar is the one tika-python downloads on its first use (tika-server.jar
+in $TIKA_PATH, by default the temporary folder); to fetch it, run once
+    python -c "from tika import parser; parser.from_buffer('')"
+or give another jar with --tika_jar.
 """
 
 import os
-from tika import parser
+import csv
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from functools import partial
+
+import requests
 import tqdm
+from requests.adapters import HTTPAdapter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from page_executor import imap_ordered
 
-import time
 start = time.time()
 
+TIKA_JAR = os.path.join(os.getenv("TIKA_PATH", tempfile.gettempdir()), "tika-server.jar")
+TIMINGS_FILE = "pdf2text_timings.csv"
+
+
+def start_servers(tika_jar, count, port=9998, ready_timeout=120):
+    """
+    Starts `count` Tika servers on consecutive ports and waits until they
+    answer.
+
+    return: tuple, (list of endpoints, list of server processes)
+    """
+    if not os.path.exists(tika_jar):
+        raise FileNotFoundError(
+            f"Tika server jar not found at {tika_jar}: pass --tika_jar, or download it with "
+            "python -c \"from tika import parser; parser.from_buffer('')\""
+        )
+    endpoints, processes = [], []
+    for i in range(count):
+        processes.append(
+            subprocess.Popen(
+                ["java", "-jar", tika_jar, "--port", str(port + i)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+        endpoints.append(f"http://localhost:{port + i}")
+
+    deadline = time.time() + ready_timeout
+    for endpoint, process in zip(endpoints, processes):
+        while True:
+            try:
+                if requests.get(f"{endpoint}/version", timeout=5).ok:
+                    break
+            except requests.RequestException:
+                # not listening yet, or listening but not answering yet
+                pass
+            if process.poll() is not None or time.time() > deadline:
+                stop_servers(processes)
+                raise RuntimeError(f"Tika server {endpoint} did not start")
+            time.sleep(1)
+    return endpoints, processes
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
 
-def main():
+def text_file_of(pdf_file, folder):
+    return pdf_file.replace(folder, f"{folder}-text").replace(".pdf", ".txt")
+
+
+def is_up_to_date(pdf_file, text_file):
+    return os.path.exists(text_file) and os.path.getmtime(text_file) >= os.path.getmtime(pdf_file)
+
+
+def extract_text(session, endpoints, timeout, job):
+    """
+    Sends a PDF to one of the Tika servers (by round robin on the job
+    number) and writes its text.
+
+    :param job: tuple, (job number, pdf file, text file)
+    return: tuple, (pdf file, seconds, characters, status)
+    """
+    num, pdf_file, text_file = job
+    endpoint = endpoints[num % len(endpoints)]
+    started = time.perf_counter()
+    try:
+        with open(pdf_file, "rb") as f:
+            r = session.put(
+                f"{endpoint}/tika",
+                data=f,
+                headers={"Accept": "text/plain", "Content-Type": "application/pdf"},
+                timeout=timeout,
+            )
+        r.raise_for_status()
+        text = r.content.decode("utf-8", errors="replace").strip()
+    except requests.RequestException as e:
+        return pdf_file, time.perf_counter() - started, 0, f"failed: {e}"
+
+    if not text:
+        return pdf_file, time.perf_counter() - started, 0, "empty"
+    tmp_file = f"{text_file}.tmp"
+    with open(tmp_file, "w") as text_out:
+        text_out.write(text)
+    os.replace(tmp_file, text_file)
+    return pdf_file, time.perf_counter() - started, len(text), "ok"
+
+
+def print_timings(timings):
+    done = sorted((t for t in timings if t[3] == "ok"), key=lambda t: t[1])
+    if not done:
+        return
+    seconds = [t[1] for t in done]
+    total = sum(seconds)
+    print(
+        f"Extracted {len(done)} files: {total:.1f} s of extraction, "
+        f"mean {total / len(done):.2f} s, median {seconds[len(done) // 2]:.2f} s, "
+        f"p95 {seconds[min(len(done) - 1, int(len(done) * 0.95))]:.2f} s"
+    )
+    print("Slowest files:")
+    for pdf_file, elapsed, chars, _ in done[::-1][:5]:
+        print(f"  {elapsed:7.2f} s  {chars:>8} chars  {pdf_file}")
+
+
+def main(workers=8, servers=1, endpoints=None, tika_jar=TIKA_JAR, port=9998, timeout=300, force=False):
+    """
+    :param workers: int, PDFs sent to the servers at the same time
+    :param servers: int, Tika servers to start (ignored with endpoints)
+    :param endpoints: list of str, URLs of already running Tika servers
+    :param force: bool, extract PDFs whose text file is up to date too
+    """
+    jobs, skipped = [], 0
     for folder in ["exams", "answers"]:
         for subdir, dirs, files in os.walk(folder):
-            os.makedirs(f"./{folder}-text/{subdir.replace(folder, '')}")
-            for file in tqdm.tqdm(files):
-                parsed = parser.from_file(os.path.join(subdir, file))
-                text = parsed["content"]
-                if text:
-                    with open(os.path.join(subdir, file).replace(folder, f"{folder}-text").replace(".pdf", ".txt"), "w") as text_file:
-                        text_file.write(text)
-                else:
-                    print(f"Something is wrong with {file}")
+            os.makedirs(f"./{folder}-text/{subdir.replace(folder, '')}", exist_ok=True)
+            for file in files:
+                pdf_file = os.path.join(subdir, file)
+                text_file = text_file_of(pdf_file, folder)
+                if not force and is_up_to_date(pdf_file, text_file):
+                    skipped += 1
+                    continue
+                jobs.append((len(jobs), pdf_file, text_file))
+    print(f"{len(jobs)} files to extract, {skipped} up to date")
+    if not jobs:
+        return
+
+    processes = []
+    if not endpoints:
+        endpoints, processes = start_servers(tika_jar, servers, port)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    timings = []
+    try:
+        results = imap_ordered(partial(extract_text, session, endpoints, timeout), jobs, max_workers=workers)
+        with open(TIMINGS_FILE, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "seconds", "characters", "status"])
+            for pdf_file, elapsed, chars, status in tqdm.tqdm(results, total=len(jobs)):
+                writer.writerow([pdf_file, f"{elapsed:.3f}", chars, status])
+                timings.append((pdf_file, elapsed, chars, status))
+                if status != "ok":
+                    tqdm.tqdm.write(f"Something is wrong with {pdf_file}: {status}")
+    finally:
+        session.close()
+        stop_servers(processes)
 
-        print(f"Processing time: {time.time()-start} seconds.")
+    print_timings(timings)
+    print(f"Timings saved to {TIMINGS_FILE}")
+    print(f"Processing time: {time.time()-start} seconds.")
 
 
 if __name__ == '__main__':
-    main()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-w", "--workers", type=int, default=8, help="PDFs sent to the Tika servers at the same time")
+    arg_parser.add_argument("--servers", type=int, default=1, help="Number of local Tika servers to start")
+    arg_parser.add_argument("--endpoints", nargs="+", default=None, help="Use these running Tika servers instead, e.g. http://localhost:9998")
+    arg_parser.add_argument("--tika_jar", default=TIKA_JAR, help="Tika server jar used to start the servers")
+    arg_parser.add_argument("--port", type=int, default=9998, help="Port of the first started server")
+    arg_parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the text of one PDF")
+    arg_parser.add_argument("--force", action="store_true", help="Also extract PDFs whose text file is up to date")
+    args = arg_parser.parse_args()
+    main(args.workers, args.servers, args.endpoints, args.tika_jar, args.port, args.timeout, args.force)
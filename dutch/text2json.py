@@ -2,7 +2,8 @@
 
 """
 Description: Extract MCQ from text files and write to json format
-Usage: text2json.py
+Usage: text2json.py [--output_file mcq-nl.json]
+  (the extension of the output picks the format: .json, .jsonl, .parquet or .arrow)
 
 TODO:
 - some issues in outputs; make filtering stricter! for example: length?
@@ -11,9 +12,13 @@ TODO:
 
 import os
 import re
-import json
+import sys
+import argparse
 import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from dataset_io import DatasetWriter
+
 import time
 start = time.time()
 
@@ -49,8 +54,9 @@ def clean_line(line):
     return True
 
 
-def main():
+def main(output_file="mcq-nl.json"):
 
+    writer = DatasetWriter(output_file, indent=4)
     for subdir, dirs, files in os.walk("exams-text"):
         data = []
         for file in tqdm.tqdm(files):
@@ -112,11 +118,14 @@ def main():
                 data.append(output)
 
         d = [x for xs in data for x in xs]
-        with open("mcq-nl.json", "a") as f:
-            json.dump(d, f, indent=4)
+        writer.write_all(d)
 
         print(f"Processing time: {time.time()-start} seconds.")
+    writer.close()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_file", default="mcq-nl.json", help="Output dataset: .json, .jsonl, .parquet or .arrow")
+    args = parser.parse_args()
+    main(args.output_file)
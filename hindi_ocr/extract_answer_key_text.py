@@ -2,9 +2,9 @@ from os import listdir
 from os.path import isfile, join
 import os
 import re
+import sys
 import json
 import time
-import base64
 import pandas as pd
 import argparse
 import openai
@@ -19,6 +19,18 @@ from openai import (
 )
 from pdf2image import convert_from_path
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from image_encoding import (
+    ImageOptions,
+    ImageWriter,
+    add_image_arguments,
+    image_message,
+    image_options_from_args,
+)
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+
 
 pre_prompt = """Please extract the answer key from the attached image below. Extract the answer option of each of the questions and provide the response as a json with the key representing the question and its value the multiple choice option. Do not provide anything else.
 """
@@ -31,32 +43,28 @@ def chat_completion_cohere(
     max_tokens=4096,
 ) -> str:
     output = None
-    for _ in range(10):
-        try:
-            response = client.chat(
+    try:
+        response = call_with_rate_limit(
+            lambda: client.chat(
                 message=messages,
                 # preamble="",
                 model="command-r-plus",
                 temperature=temperature,
                 max_tokens=max_tokens,
-            )
-            output = response.dict().get("text")
-            break
-        # except any exception
-        except Exception as e:
-            print(f"Failed to connect to Cohere API: {e}")
-            time.sleep(20)
+            ),
+            get_limiter("cohere"),
+            # retry any exception
+            (Exception,),
+            tokens=estimate_tokens(messages, max_tokens),
+            max_attempts=10,
+            name="Cohere",
+        )
+        output = response.dict().get("text")
+    except Exception as e:
+        print(f"Failed to connect to Cohere API: {e}")
     return output
 
 
-def encode_image(image_path):
-    """
-    Function to encode the image
-    """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
-
 def chat_completion_openai(
     client,
     messages,
@@ -79,41 +87,53 @@ def chat_completion_openai(
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
-
-            if return_text:
-                return text
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            if return_usage:
-                return usage
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
-            return response
-        except (
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
 
+    return response
 
-def main(pdf_path, api_key):
+
+def main(pdf_path, api_key, save_imgs=False, image_options=ImageOptions()):
     """
     It performs the main text extraction pipeline of the script.
 
     :param dir_path: str
     :param openai_key: str
+    :param save_imgs: bool, also write the page images to the imgs folder
+    :param image_options: ImageOptions, how pages are resized and encoded
     """
     client = OpenAI(api_key=api_key)
 
@@ -124,24 +144,24 @@ def main(pdf_path, api_key):
     imgs_folder = os.path.join(parent_directory, "imgs", pdf_name)
     result_path = os.path.join(parent_directory, "answer_key")
     # Create directories if they don't exist
-    os.makedirs(imgs_folder, exist_ok=True)
     os.makedirs(result_path, exist_ok=True)
+    image_writer = None
+    if save_imgs:
+        os.makedirs(imgs_folder, exist_ok=True)
+        image_writer = ImageWriter()
     images = convert_from_path(pdf_path, first_page=1)
 
     # Step 2: Preprocess the image (deskew)
     for page_num, image in enumerate(images):
         print("Page: {} / {}".format(page_num + 1, len(images)))
-        image_path = os.path.join(imgs_folder, f"page_{page_num+1}.png")
-        image.save(image_path, "PNG")
-        base64_image = encode_image(image_path)
+        if image_writer is not None:
+            image_path = os.path.join(imgs_folder, f"page_{page_num+1}.png")
+            image_writer.save(image, image_path, "PNG")
 
         try:
             message = [
                 {"type": "text", "text": pre_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                },
+                image_message(image, image_options),
             ]
             response, _ = chat_completion_openai(
                 client,
@@ -176,6 +196,9 @@ def main(pdf_path, api_key):
             json.dump(response, json_file, indent=4, ensure_ascii=False)
         print("Data saved: {}".format(output_file))
 
+    if image_writer is not None:
+        image_writer.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -188,6 +211,17 @@ if __name__ == "__main__":
         "--key",
         help="OpenAI API Key or Cohere Key",
     )
+    parser.add_argument(
+        "--save_imgs",
+        action="store_true",
+        help="Also write the page images to the imgs folder for debugging.",
+    )
+    add_image_arguments(parser)
 
     args = parser.parse_args()
-    main(pdf_path=args.pdf_path, api_key=args.key)
+    main(
+        pdf_path=args.pdf_path,
+        api_key=args.key,
+        save_imgs=args.save_imgs,
+        image_options=image_options_from_args(args),
+    )
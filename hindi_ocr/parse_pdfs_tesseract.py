@@ -1,10 +1,56 @@
 import os
+import sys
 import argparse
 import subprocess
-from pdf2image import convert_from_path
+from functools import partial
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from page_executor import imap_ordered
+from page_source import render_pdf_page
+from text_layer import classify_pdf, script_of
 
-def pdf_to_images_and_ocr(pdf_path, lang="eng", pages=1000):
+
+def ocr_page(pdf_path, imgs_folder, parsed_folder, lang, page_num):
+    """
+    Rasterizes a single page, saves it and runs Tesseract on it. It runs in a
+    worker process, so only the paths and the page number are sent to it.
+
+    :param pdf_path: str
+    :param imgs_folder: str
+    :param parsed_folder: str
+    :param lang: str
+    :param page_num: int, 1-based page number
+    return: int, return code of tesseract
+    """
+    image = render_pdf_page(pdf_path, page_num)
+    image_path = os.path.join(imgs_folder, f"page_{page_num}.png")
+    image.save(image_path, "PNG")
+    ocr_output_path = os.path.join(parsed_folder, f"page_{page_num}")
+
+    # one tesseract thread per worker, the pool already uses every core
+    env = dict(os.environ, OMP_THREAD_LIMIT=os.environ.get("OMP_THREAD_LIMIT", "1"))
+    result = subprocess.run(
+        ["tesseract", image_path, ocr_output_path, "-l", lang], env=env
+    )
+    return result.returncode
+
+
+def write_text_layer(parsed_folder, layer):
+    """
+    Writes the embedded text of a born-digital page where Tesseract would
+    have written its output.
+    """
+    with open(os.path.join(parsed_folder, f"page_{layer.page_num}.txt"), "w") as f:
+        f.write(layer.text)
+
+
+def pdf_to_images_and_ocr(pdf_path, lang="eng", pages=1000, workers=1, ocr_all=False):
+    """
+    Pages with a usable text layer in the script of `lang` (see
+    text_layer.py) are written as they are, the others are OCRed.
+    """
     pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
 
     imgs_folder = os.path.join("imgs", pdf_name)
@@ -13,15 +59,25 @@ def pdf_to_images_and_ocr(pdf_path, lang="eng", pages=1000):
     os.makedirs(imgs_folder, exist_ok=True)
     os.makedirs(parsed_folder, exist_ok=True)
 
-    images = convert_from_path(pdf_path, first_page=1, last_page=pages)
+    layers = classify_pdf(pdf_path, script_of(lang), pages=range(1, pages + 1))
+    scan_pages = []
+    for layer in layers:
+        if layer.kind == "text" and not ocr_all:
+            write_text_layer(parsed_folder, layer)
+        else:
+            scan_pages.append(layer.page_num)
+    print(f"{len(layers) - len(scan_pages)} pages with a text layer, {len(scan_pages)} pages to OCR")
 
-    # Process each image with Tesseract OCR
-    for i, image in enumerate(images):
-        image_path = os.path.join(imgs_folder, f"page_{i+1}.png")
-        image.save(image_path, "PNG")
-        ocr_output_path = os.path.join(parsed_folder, f"page_{i+1}")
-
-        subprocess.run(["tesseract", image_path, ocr_output_path, "-l", lang])
+    # Process the scanned pages with Tesseract OCR, `workers` at a time
+    return_codes = imap_ordered(
+        partial(ocr_page, pdf_path, imgs_folder, parsed_folder, lang),
+        scan_pages,
+        max_workers=workers,
+        processes=True,
+    )
+    for page_num, return_code in zip(scan_pages, return_codes):
+        if return_code != 0:
+            print(f"Tesseract failed on page {page_num} (exit code {return_code})")
 
     print(
         f"Images are saved in {imgs_folder} and OCR results are saved in {parsed_folder}"
@@ -47,7 +103,19 @@ if __name__ == "__main__":
         default=1000,
         help="Maximum number of pages to process (default: 1000).",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of pages rasterized and OCRed in parallel (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--ocr_all",
+        action="store_true",
+        help="OCR every page, also the ones with an embedded text layer.",
+    )
 
     args = parser.parse_args()
 
-    pdf_to_images_and_ocr(args.pdf_path, args.lang, args.pages)
+    pdf_to_images_and_ocr(args.pdf_path, args.lang, args.pages, args.workers, args.ocr_all)
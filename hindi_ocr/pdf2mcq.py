@@ -2,11 +2,12 @@ from os import listdir
 from os.path import isfile, join
 import os
 import re
+import sys
 import json
 import time
-import base64
 import pandas as pd
 import argparse
+from functools import partial
 import openai
 from openai import (
     OpenAI,
@@ -15,7 +16,22 @@ from openai import (
     RateLimitError,
     InternalServerError,
 )
-from pdf2image import convert_from_path
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from image_encoding import (
+    ImageOptions,
+    ImageWriter,
+    add_image_arguments,
+    image_message,
+    image_options_from_args,
+)
+from page_executor import imap_ordered
+from page_source import count_pdf_pages, iter_pdf_pages
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+from response_cache import ResponseCache
+from run_manifest import RunManifest
 
 # from utils import parse_gpt_output
 
@@ -80,6 +96,7 @@ def chat_completion(
     return_text=True,
     return_usage=True,
     model_args=None,
+    cache=None,
 ):
     """
     Calls openai API with the image and the prompt
@@ -90,57 +107,208 @@ def chat_completion(
     :param return_text: bool
     :param return_usage: bool
     :param model_args:
+    :param cache: ResponseCache or None
     return: dict
     """
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
+    # serve repeated requests from the on-disk cache (text and usage only)
+    if cache is not None and (return_text or return_usage):
+        key = cache.make_key(model, messages, model_args)
+        cached = cache.get(key)
+        if cached is None:
+            text, usage = chat_completion(client, messages, model, model_args=model_args)
+            cached = {"text": text, "usage": usage}
+            cache.put(key, cached)
+
+        if return_text and return_usage:
+            return cached["text"], cached["usage"]
 
-            if return_text and return_usage:
-                return text, dict(usage)
+        if return_text:
+            return cached["text"]
 
-            if return_text:
-                return text
+        return cached["usage"]
 
-            if return_usage:
-                return usage
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            return response
-        except (
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
 
+    if return_text and return_usage:
+        return text, dict(usage)
 
-def encode_image(image_path):
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
+
+
+def extract_page(
+    client,
+    pdf_path,
+    pdf_name,
+    imgs_folder,
+    language,
+    source,
+    cache,
+    image_writer,
+    image_options,
+    page_item,
+):
     """
-    Function to encode the image
+    It sends a single pdf page to gpt-4o and returns the extracted questions,
+    or None if the request was rejected.
+
+    :param client: OpenAI client
+    :param pdf_path: str
+    :param pdf_name: str
+    :param imgs_folder: str
+    :param language: str
+    :param source: str
+    :param cache: ResponseCache or None
+    :param image_writer: ImageWriter or None, persists the page images for debugging
+    :param image_options: ImageOptions, how the page is resized and encoded
+    :param page_item: tuple, (page_num, PIL image) as yielded by iter_pdf_pages
+    return: list of dict
     """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    page_num, image = page_item
+    if image_writer is not None:
+        image_path = os.path.join(imgs_folder, f"page_{page_num+1}.png")
+        image_writer.save(image, image_path, "PNG")
 
+    # Step 3: Pass img to gpt-4 for mcq extraction
+    try:
+        message = [
+            {"type": "text", "text": pre_prompt.format(language)},
+            image_message(image, image_options),
+        ]
+        response, _ = chat_completion(
+            client,
+            [{"role": "user", "content": message}],
+            model="gpt-4o",
+            return_text=True,
+            return_usage=True,
+            model_args={
+                "temperature": 0.0,
+                "max_tokens": 4096,
+                "top_p": 1,
+                "frequency_penalty": 0,
+                "presence_penalty": 0,
+            },
+            cache=cache,
+        )
+    except openai.BadRequestError:
+        return None
 
-def main(pdf_path, openai_key, language, page_start=0, page_end=9999, source=""):
+    # Step 4: Process gpt-4 output
+    (
+        questions,
+        choices,
+        requires_image,
+        categories,
+        contexts,
+        q_nums,
+    ) = parse_gpt_output(response, pdf_path)
+    page_results = []
+    if not all(
+        len(lst) == len(questions)
+        for lst in [
+            choices,
+            requires_image,
+            categories,
+            contexts,
+            q_nums,
+        ]
+    ):
+        print("Skipped page", page_num)
+    else:
+        for question, options, has_image, category, cntx, q_num in zip(
+            questions,
+            choices,
+            requires_image,
+            categories,
+            contexts,
+            q_nums,
+        ):
+            new_row = {
+                "language": language,
+                "country": "India",
+                "file_name": pdf_name,
+                "source": source,
+                "license": "",  # check
+                "level": "high school",
+                "category_en": category,
+                "category_original_lang": None,
+                "region_related": False,
+                "original_question_idx": q_num,
+                "page_num": page_num,
+                "response": response,
+                "question": question,
+                "options": options,
+                "answer": "",
+                "requires_image": has_image,
+                "context": cntx,
+            }
+            page_results.append(new_row)
+    return page_results
+
+
+def main(
+    pdf_path,
+    openai_key,
+    language,
+    page_start=0,
+    page_end=9999,
+    source="",
+    workers=4,
+    cache_dir=None,
+    save_imgs=False,
+    image_options=ImageOptions(),
+    manifest_path=None,
+    restart=False,
+):
     """
     It performs the main text extraction pipeline of the script.
 
     :param dir_path: str
     :param openai_key: str
+    :param workers: int, number of pages sent to the API concurrently
+    :param cache_dir: str, folder of the response cache (disabled if None)
+    :param save_imgs: bool, also write the page images to the imgs folder
+    :param image_options: ImageOptions, how pages are resized and encoded
+    :param manifest_path: str, run manifest (defaults to results/manifest.sqlite);
+        pages it records as done are skipped, failed ones are retried
+    :param restart: bool, forget the progress recorded for this pdf
     """
     # create client with openai credentials
     client = OpenAI(api_key=openai_key)
+    cache = ResponseCache(cache_dir) if cache_dir else None
 
     pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
 
@@ -149,105 +317,66 @@ def main(pdf_path, openai_key, language, page_start=0, page_end=9999, source="")
     imgs_folder = os.path.join(parent_directory, "imgs", pdf_name)
     result_path = os.path.join(parent_directory, "results")
     # Create directories if they don't exist
-    os.makedirs(imgs_folder, exist_ok=True)
     os.makedirs(result_path, exist_ok=True)
-    images = convert_from_path(pdf_path, first_page=1)
-    images = images[page_start:page_end]
-    page_num = page_start + 1
-
-    # Step 2: Preprocess the image (deskew)
-    results = list()
-    q_idx = 0
-    for _, image in enumerate(images):
-        print("Page: {} / {}".format(page_num, len(images)))
-        image_path = os.path.join(imgs_folder, f"page_{page_num+1}.png")
-        image.save(image_path, "PNG")
-        base64_image = encode_image(image_path)
-
-        # Step 3: Pass img to gpt-4 for mcq extraction
-        try:
-            message = [
-                {"type": "text", "text": pre_prompt.format(language)},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                },
-            ]
-            response, _ = chat_completion(
-                client,
-                [{"role": "user", "content": message}],
-                model="gpt-4o",
-                return_text=True,
-                return_usage=True,
-                model_args={
-                    "temperature": 0.0,
-                    "max_tokens": 4096,
-                    "top_p": 1,
-                    "frequency_penalty": 0,
-                    "presence_penalty": 0,
-                },
-            )
-            # Step 4: Process gpt-4 output
-            (
-                questions,
-                choices,
-                requires_image,
-                categories,
-                contexts,
-                q_nums,
-            ) = parse_gpt_output(response, pdf_path)
-            page_results = []
-            if not all(
-                len(lst) == len(questions)
-                for lst in [
-                    choices,
-                    requires_image,
-                    categories,
-                    contexts,
-                    q_nums,
-                ]
-            ):
-                print("Skipped page", page_num)
-            else:
-                for question, options, has_image, category, cntx, q_num in zip(
-                    questions,
-                    choices,
-                    requires_image,
-                    categories,
-                    contexts,
-                    q_nums,
-                ):
-                    new_row = {
-                        "language": language,
-                        "country": "India",
-                        "file_name": pdf_name,
-                        "source": source,
-                        "license": "",  # check
-                        "level": "high school",
-                        "category_en": category,
-                        "category_original_lang": None,
-                        "region_related": False,
-                        "original_question_idx": q_num,
-                        "page_num": page_num,
-                        "response": response,
-                        "question": question,
-                        "options": options,
-                        "answer": "",
-                        "requires_image": has_image,
-                        "context": cntx,
-                    }
-                    page_results.append(new_row)
-                    q_idx += 1
-            output_file = os.path.join(result_path, pdf_name + f"_page_{page_num}.json")
-            page_num += 1
-            # Save the results to a JSON file
-            with open(output_file, "w", encoding="utf-8") as json_file:
-                json.dump(page_results, json_file, indent=4, ensure_ascii=False)
-            print("Data saved: {}".format(output_file))
-
-        except openai.BadRequestError:
-            pass
-    # store extracted questions
+    image_writer = None
+    if save_imgs:
+        os.makedirs(imgs_folder, exist_ok=True)
+        image_writer = ImageWriter()
+
+    manifest = RunManifest(manifest_path or os.path.join(result_path, "manifest.sqlite"))
+    if restart:
+        manifest.reset(pdf_name)
+    last_page = min(count_pdf_pages(pdf_path), page_end)
+    num_pages = last_page - page_start
+    page_nums = range(page_start + 1, last_page + 1)
+    manifest.add_pages(pdf_name, page_nums)
+    todo = manifest.remaining(pdf_name, page_nums)
+    if len(todo) < len(page_nums):
+        print(f"Resuming: {len(page_nums) - len(todo)} pages already done, {len(todo)} left")
+    images = iter_pdf_pages(
+        pdf_path, first_page=page_start + 1, last_page=page_end, pages=todo
+    )
+
+    # Step 2: Send the pages to gpt-4o, keeping `workers` requests in flight;
+    # results come back (and are saved) in page order
+    pages = imap_ordered(
+        partial(
+            extract_page,
+            client,
+            pdf_path,
+            pdf_name,
+            imgs_folder,
+            language,
+            source,
+            cache,
+            image_writer,
+            image_options,
+        ),
+        images,
+        max_workers=workers,
+    )
+    for page_num, page_results in zip(todo, pages):
+        print("Page: {} / {}".format(page_num, num_pages))
+        if page_results is None:
+            manifest.mark_failed(pdf_name, page_num, "request rejected by the API")
+            continue
+        output_file = os.path.join(result_path, pdf_name + f"_page_{page_num}.json")
+        # Save the results to a JSON file
+        with open(output_file, "w", encoding="utf-8") as json_file:
+            json.dump(page_results, json_file, indent=4, ensure_ascii=False)
+        manifest.mark_done(pdf_name, page_num, output_file)
+        print("Data saved: {}".format(output_file))
+
+    if image_writer is not None:
+        image_writer.close()
+
+    failures = manifest.failures(pdf_name)
+    if failures:
+        print(
+            f"{len(failures)} pages failed and will be retried on the next run: "
+            + ", ".join(str(page) for page in failures)
+        )
+    manifest.close()
 
 
 if __name__ == "__main__":
@@ -280,8 +409,52 @@ if __name__ == "__main__":
         help="OpenAI API Key",
         default="",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of pages sent to the API concurrently.",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=None,
+        help="Requests per minute allowed (learned from the API headers if not set).",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=None,
+        help="Tokens per minute allowed (learned from the API headers if not set).",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Folder of the on-disk API response cache (disabled by default).",
+    )
+    parser.add_argument(
+        "--save_imgs",
+        action="store_true",
+        help="Also write the page images to the imgs folder for debugging.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Run manifest recording the state of each page (default: results/manifest.sqlite).",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the progress recorded in the manifest and process every page again.",
+    )
+    add_image_arguments(parser)
 
     args = parser.parse_args()
+    get_limiter("openai", requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
     main(
         pdf_path=args.pdf_path,
         openai_key=args.key,
@@ -290,4 +463,10 @@ if __name__ == "__main__":
         page_start=args.page_start,
         page_end=args.page_end,
         source=args.source,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        save_imgs=args.save_imgs,
+        image_options=image_options_from_args(args),
+        manifest_path=args.manifest,
+        restart=args.restart,
     )
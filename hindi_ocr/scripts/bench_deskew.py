@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the deskew modes of any_language/pdf2text.py on the sample
+pages in hindi_ocr/imgs.
+
+Every page is rotated by a few known angles and straightened again with the
+exact (full-resolution) and the fast (downsampled, binarized) estimator. The
+report gives, per mode, the time to estimate the angle, the time of the whole
+deskew step, the mean error of the estimate and, for the fast mode, how far
+it is from the exact one. Scanned pages are already a little skewed, so the
+error is measured against the page's own skew (its estimate at 0°) minus the
+added rotation.
+
+Usage: python bench_deskew.py [--pages 5] [--min_angle 0.5]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "..", "any_language"))
+from pdf2text import deskew, estimate_skew
+
+ANGLES = [0.0, 0.3, -1.0, 2.5, -5.0]
+MODES = {"exact": False, "fast": True}
+
+
+def rotate(image, angle):
+    (h, w) = image.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), borderValue=(255, 255, 255))
+
+
+def main(imgs_dir, pages, min_angle):
+    page_files = []
+    for folder in sorted(glob.glob(os.path.join(imgs_dir, "*"))):
+        files = sorted(glob.glob(os.path.join(folder, "page_*.png")))
+        page_files.extend(files[:pages])
+    print(
+        f"Benchmarking {len(page_files)} pages x {len(ANGLES)} angles from {imgs_dir}\n"
+    )
+
+    stats = {
+        name: {"estimate": 0.0, "deskew": 0.0, "error": 0.0, "vs_exact": 0.0, "skipped": 0}
+        for name in MODES
+    }
+    samples = 0
+    for page_file in page_files:
+        page = np.array(Image.open(page_file).convert("RGB"))
+        own_skew = {name: estimate_skew(page, fast=fast) for name, fast in MODES.items()}
+        for angle in ANGLES:
+            image = rotate(page, angle)
+            samples += 1
+            estimates = {}
+            for name, fast in MODES.items():
+                start = time.perf_counter()
+                estimate = estimates[name] = estimate_skew(image, fast=fast)
+                stats[name]["estimate"] += time.perf_counter() - start
+                # the estimate undoes the rotation, so it should move by -angle
+                stats[name]["error"] += abs(estimate - (own_skew[name] - angle))
+                stats[name]["vs_exact"] += abs(estimate - estimates["exact"])
+
+                threshold = min_angle if fast else 0.0
+                start = time.perf_counter()
+                result = deskew(image, fast=fast, min_angle=threshold)
+                stats[name]["deskew"] += time.perf_counter() - start
+                if result is image:
+                    stats[name]["skipped"] += 1
+
+    n = max(1, samples)
+    header = (
+        f"{'mode':<8} {'estimate ms':>12} {'deskew ms':>10} "
+        f"{'mean error':>11} {'vs exact':>9} {'warps skipped':>14}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name in MODES:
+        print(
+            f"{name:<8} {stats[name]['estimate'] / n * 1000:>12.1f} "
+            f"{stats[name]['deskew'] / n * 1000:>10.1f} "
+            f"{stats[name]['error'] / n:>10.2f}° "
+            f"{stats[name]['vs_exact'] / n:>8.2f}° "
+            f"{stats[name]['skipped']:>8} / {samples}"
+        )
+    print(f"\nThe fast mode skips the rotation below {min_angle}°.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--imgs_dir",
+        type=str,
+        default=os.path.join(HERE, "..", "imgs"),
+        help="Folder with one sub-folder of page_N.png images per paper.",
+    )
+    parser.add_argument(
+        "--pages", type=int, default=5, help="Pages per paper to benchmark."
+    )
+    parser.add_argument(
+        "--min_angle",
+        type=float,
+        default=0.5,
+        help="Skew (degrees) below which the fast mode does not rotate the page.",
+    )
+
+    args = parser.parse_args()
+    main(imgs_dir=args.imgs_dir, pages=args.pages, min_angle=args.min_angle)
@@ -0,0 +1,173 @@
+"""
+Benchmark of the page image preparation options (any_language/image_encoding.py)
+on the sample pages in hindi_ocr/imgs.
+
+Without an API key it reports, per configuration, the payload size, the time
+to prepare the image and the image tokens gpt-4o bills for it. With --key each
+page is also sent with the hindi_ocr/pdf2mcq.py prompt, and the extracted
+questions are compared with the ones extracted from the full-size PNG.
+
+Usage: python bench_image_prep.py [-k OPENAI_KEY] [--pages 3]
+"""
+
+import os
+import sys
+import time
+import glob
+import argparse
+import importlib.util
+from difflib import SequenceMatcher
+
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "..", "any_language"))
+sys.path.append(os.path.join(HERE, ".."))
+from image_encoding import (
+    ImageOptions,
+    estimate_image_tokens,
+    image_message,
+    prepare_image,
+)
+
+CONFIGS = {
+    "png-full": ImageOptions(),
+    "png-2048": ImageOptions(max_edge=2048),
+    "jpeg-2048-q85": ImageOptions(max_edge=2048, format="JPEG", quality=85),
+    "webp-2048-q80": ImageOptions(max_edge=2048, format="WEBP", quality=80),
+    "jpeg-1536-gray-q75": ImageOptions(
+        max_edge=1536, grayscale=True, format="JPEG", quality=75
+    ),
+    "jpeg-1024-q75": ImageOptions(max_edge=1024, format="JPEG", quality=75),
+    "jpeg-512-low": ImageOptions(max_edge=512, format="JPEG", detail="low"),
+}
+BASELINE = "png-full"
+
+
+def question_similarity(reference, candidate):
+    """
+    Mean, over the reference questions, of the best character-level similarity
+    with any candidate question (1.0 means every question was recovered verbatim).
+    """
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    scores = []
+    for question in reference:
+        scores.append(
+            max(
+                (SequenceMatcher(None, question, other).ratio() for other in candidate),
+                default=0.0,
+            )
+        )
+    return sum(scores) / len(scores)
+
+
+def load_hindi_pdf2mcq():
+    """
+    Loads hindi_ocr/pdf2mcq.py by path: a plain import could pick up
+    any_language/pdf2mcq.py, which is also on sys.path.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "hindi_pdf2mcq", os.path.join(HERE, "..", "pdf2mcq.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def extract_questions(client, image, options, pdf_name, pdf2mcq):
+    """
+    :param pdf2mcq: module, hindi_ocr/pdf2mcq.py (see load_hindi_pdf2mcq)
+    """
+    message = [
+        {"type": "text", "text": pdf2mcq.pre_prompt.format("hindi")},
+        image_message(image, options),
+    ]
+    response, usage = pdf2mcq.chat_completion(
+        client,
+        [{"role": "user", "content": message}],
+        model="gpt-4o",
+        model_args={"temperature": 0.0, "max_tokens": 4096},
+    )
+    questions = pdf2mcq.parse_gpt_output(response, pdf_name)[0]
+    return [q.strip() for q in questions], usage["prompt_tokens"]
+
+
+def main(imgs_dir, pages, key):
+    page_files = []
+    for folder in sorted(glob.glob(os.path.join(imgs_dir, "*"))):
+        files = sorted(glob.glob(os.path.join(folder, "page_*.png")))
+        page_files.extend(files[:pages])
+    print(f"Benchmarking {len(page_files)} pages from {imgs_dir}\n")
+
+    client = None
+    if key:
+        from openai import OpenAI
+
+        client = OpenAI(api_key=key)
+        pdf2mcq = load_hindi_pdf2mcq()
+
+    stats = {name: {"bytes": 0, "seconds": 0.0, "tokens": 0} for name in CONFIGS}
+    accuracy = {name: [] for name in CONFIGS}
+    prompt_tokens = {name: 0 for name in CONFIGS}
+    for page_file in page_files:
+        image = Image.open(page_file)
+        image.load()
+        pdf_name = os.path.basename(os.path.dirname(page_file))
+        baseline_questions = None
+        for name, options in CONFIGS.items():
+            start = time.perf_counter()
+            data, _ = prepare_image(image, options)
+            stats[name]["seconds"] += time.perf_counter() - start
+            stats[name]["bytes"] += len(data)
+            if options.max_edge and max(image.size) > options.max_edge:
+                scale = options.max_edge / max(image.size)
+            else:
+                scale = 1.0
+            stats[name]["tokens"] += estimate_image_tokens(
+                image.width * scale, image.height * scale, options.detail
+            )
+
+            if client is not None:
+                questions, used = extract_questions(client, image, options, pdf_name, pdf2mcq)
+                prompt_tokens[name] += used
+                if name == BASELINE:
+                    baseline_questions = questions
+                accuracy[name].append(
+                    question_similarity(baseline_questions, questions)
+                )
+
+    n = max(1, len(page_files))
+    header = f"{'config':<20} {'KB/page':>9} {'ms/page':>9} {'img tokens':>11}"
+    if client is not None:
+        header += f" {'prompt tokens':>14} {'similarity':>11}"
+    print(header)
+    print("-" * len(header))
+    for name in CONFIGS:
+        row = (
+            f"{name:<20} {stats[name]['bytes'] / n / 1024:>9.1f} "
+            f"{stats[name]['seconds'] / n * 1000:>9.1f} {stats[name]['tokens'] / n:>11.0f}"
+        )
+        if client is not None:
+            mean = sum(accuracy[name]) / len(accuracy[name])
+            row += f" {prompt_tokens[name] / n:>14.0f} {mean:>11.3f}"
+        print(row)
+    if client is None:
+        print("\nPass -k/--key to also compare extraction quality against the full-size PNG.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--imgs_dir",
+        type=str,
+        default=os.path.join(HERE, "..", "imgs"),
+        help="Folder with one sub-folder of page_N.png images per paper.",
+    )
+    parser.add_argument(
+        "--pages", type=int, default=5, help="Pages per paper to benchmark."
+    )
+    parser.add_argument("-k", "--key", help="OpenAI API Key", default="")
+
+    args = parser.parse_args()
+    main(imgs_dir=args.imgs_dir, pages=args.pages, key=args.key)
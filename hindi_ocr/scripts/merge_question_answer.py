@@ -1,6 +1,12 @@
 import os
+import sys
 import json
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "any_language")
+)
+from dataset_io import write_dataset
+
 categories = {
     "physics": "भौतिकी",
     "chemistry": "रसायन विज्ञान",
@@ -199,9 +205,11 @@ key_folders = [
     # path to keys extracted from gpt4-o
 ]
 
+# .json, .jsonl, .parquet or .arrow
+output_file = "JEE-Main-Hindi.json"
+
 all_questions = []
 for result_folder, key_folder in zip(result_folders, key_folders):
     all_questions.extend(jee_main(result_folder, key_folder))
 
-    with open("JEE-Main-Hindi.json", "w") as f:
-        json.dump(all_questions, f, indent=4)
+write_dataset(output_file, all_questions, indent=4)
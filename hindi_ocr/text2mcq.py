@@ -2,6 +2,7 @@ from os import listdir
 from os.path import isfile, join
 import os
 import re
+import sys
 import json
 import time
 import base64
@@ -18,6 +19,12 @@ from openai import (
 )
 from pdf2image import convert_from_path
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from batch_api import BatchWriter, run_batches
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+
 pre_prompt = """Extract the multiple-choice questions from the text in the {} language given below. The question should be inside the tags  <question> </question> and the choices inside the tags <choices> </choices>. Additionally, the correct answer might be present in the image either explicitly provided or by a mark next to the correct answer of the multiple choices. Provide the number or letter of the correct answer between the tags <answer> </answer>. If no answer is present, leave empty.
 The output format should be the following, depending on the number of choices present:
 <question> </question>
@@ -48,21 +55,25 @@ def chat_completion_cohere(
     max_tokens=4096,
 ) -> str:
     output = None
-    for _ in range(10):
-        try:
-            response = client.chat(
+    try:
+        response = call_with_rate_limit(
+            lambda: client.chat(
                 message=messages,
                 # preamble="",
                 model="command-r-plus",
                 temperature=temperature,
                 max_tokens=max_tokens,
-            )
-            output = response.dict().get("text")
-            break
-        # except any exception
-        except Exception as e:
-            print(f"Failed to connect to Cohere API: {e}")
-            time.sleep(20)
+            ),
+            get_limiter("cohere"),
+            # retry any exception
+            (Exception,),
+            tokens=estimate_tokens(messages, max_tokens),
+            max_attempts=10,
+            name="Cohere",
+        )
+        output = response.dict().get("text")
+    except Exception as e:
+        print(f"Failed to connect to Cohere API: {e}")
     return output
 
 
@@ -88,51 +99,62 @@ def chat_completion_openai(
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
-
-            if return_text:
-                return text
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            if return_usage:
-                return usage
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
-            return response
-        except (
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
 
+    if return_text and return_usage:
+        return text, dict(usage)
 
-def main(txt_path, api_key, lang="Hindi", api_type="openai"):
-    """
-    It performs the main text extraction pipeline of the script.
+    if return_text:
+        return text
 
-    :param dir_path: str
-    :param openai_key: str
+    if return_usage:
+        return usage
+
+    return response
+
+
+model_args = {
+    "temperature": 0.0,
+    "max_tokens": 4096,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+}
+
+
+def save_results(txt_path, response, lang):
     """
-    # create client with openai credentials
-    if "cohere" in api_type:
-        client = CohereClient(api_key=api_key)
-    else:
-        client = OpenAI(api_key=api_key)
-    f = open(txt_path, "r")
-    answer_txt = f.read()
-    print(answer_txt)
+    It parses the model output for a tesseract txt file and saves the questions.
 
+    :param txt_path: str
+    :param response: str
+    :param lang: str
+    """
     path_parts = txt_path.split(os.sep)
 
     # Construct the new path
@@ -144,32 +166,6 @@ def main(txt_path, api_key, lang="Hindi", api_type="openai"):
 
     os.makedirs(new_directory, exist_ok=True)
 
-    try:
-        if "openai" in api_type:
-            message = [{"type": "text", "text": pre_prompt.format(lang, answer_txt)}]
-            response, _ = chat_completion_openai(
-                client,
-                [{"role": "user", "content": message}],
-                model="gpt-4o",
-                return_text=True,
-                return_usage=True,
-                model_args={
-                    "temperature": 0.0,
-                    "max_tokens": 4096,
-                    "top_p": 1,
-                    "frequency_penalty": 0,
-                    "presence_penalty": 0,
-                },
-            )
-        else:
-            message = [pre_prompt.format(lang, answer_txt)]
-            response = chat_completion_cohere(
-                client, message[0], temperature=0.0, max_tokens=4096
-            )
-        # Step 4: Process gpt-4 output
-
-    except openai.BadRequestError:
-        pass
     # store extracted questions
     results = []
     questions, choices = parse_gpt_output(response)
@@ -198,11 +194,83 @@ def main(txt_path, api_key, lang="Hindi", api_type="openai"):
     print("Data saved: {}".format(json_file_path))
 
 
+def main(txt_path, api_key, lang="Hindi", api_type="openai"):
+    """
+    It performs the main text extraction pipeline of the script.
+
+    :param dir_path: str
+    :param openai_key: str
+    """
+    # create client with openai credentials
+    if "cohere" in api_type:
+        client = CohereClient(api_key=api_key)
+    else:
+        client = OpenAI(api_key=api_key)
+    f = open(txt_path, "r")
+    answer_txt = f.read()
+    print(answer_txt)
+
+    try:
+        if "openai" in api_type:
+            message = [{"type": "text", "text": pre_prompt.format(lang, answer_txt)}]
+            response, _ = chat_completion_openai(
+                client,
+                [{"role": "user", "content": message}],
+                model="gpt-4o",
+                return_text=True,
+                return_usage=True,
+                model_args=model_args,
+            )
+        else:
+            message = [pre_prompt.format(lang, answer_txt)]
+            response = chat_completion_cohere(
+                client, message[0], temperature=0.0, max_tokens=4096
+            )
+        # Step 4: Process gpt-4 output
+
+    except openai.BadRequestError:
+        pass
+    save_results(txt_path, response, lang)
+
+
+def main_batch(txt_paths, api_key, lang="Hindi", batch_file=None, poll_interval=60):
+    """
+    It runs the extraction of many tesseract txt files through the OpenAI Batch
+    API and saves each result like the online mode does.
+
+    :param txt_paths: list of str
+    :param api_key: str
+    :param lang: str
+    :param batch_file: str, path of the JSONL batch file
+    :param poll_interval: int, seconds between two status checks
+    """
+    client = OpenAI(api_key=api_key)
+    if batch_file is None:
+        batch_file = os.path.join("batch", "text2mcq_requests.jsonl")
+
+    with BatchWriter(batch_file) as writer:
+        for idx, txt_path in enumerate(txt_paths):
+            with open(txt_path, "r") as f:
+                answer_txt = f.read()
+            message = [{"type": "text", "text": pre_prompt.format(lang, answer_txt)}]
+            writer.add(
+                str(idx), "gpt-4o", [{"role": "user", "content": message}], model_args
+            )
+
+    responses = run_batches(client, writer.paths, poll_interval)
+    for idx, txt_path in enumerate(txt_paths):
+        response = responses.get(str(idx))
+        if response is None:
+            print("No response for {}".format(txt_path))
+            continue
+        save_results(txt_path, response, lang)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
-        "txt_path", type=str, help="Path to the txt file from tesseract."
+        "txt_path", type=str, nargs="+", help="Path(s) to the txt file(s) from tesseract."
     )
     parser.add_argument(
         "--api_type", type=str, help="openai or cohere.", default="openai"
@@ -220,11 +288,40 @@ if __name__ == "__main__":
         help="OpenAI API Key or Cohere Key",
         default="",
     )
+    parser.add_argument(
+        "--mode",
+        choices=["online", "batch"],
+        default="online",
+        help="online calls the API file by file, batch submits all the files to "
+        "the OpenAI Batch API (openai only).",
+    )
+    parser.add_argument(
+        "--batch_file",
+        type=str,
+        default=None,
+        help="JSONL file the batch requests are written to.",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=int,
+        default=60,
+        help="Seconds between two status checks of a batch.",
+    )
 
     args = parser.parse_args()
-    main(
-        txt_path=args.txt_path,
-        api_key=args.key,
-        lang=args.lang,
-        api_type=args.api_type,
-    )
+    if args.mode == "batch":
+        main_batch(
+            txt_paths=args.txt_path,
+            api_key=args.key,
+            lang=args.lang,
+            batch_file=args.batch_file,
+            poll_interval=args.poll_interval,
+        )
+    else:
+        for txt_path in args.txt_path:
+            main(
+                txt_path=txt_path,
+                api_key=args.key,
+                lang=args.lang,
+                api_type=args.api_type,
+            )
@@ -0,0 +1,78 @@
+"""
+Benchmark of the text extraction backends of pdf2text.py (PyMuPDF and
+PyPDF2) on the Spanish INAP exam PDFs.
+
+Every PDF is extracted with both backends. The report gives, per backend,
+the total time and the pages per second, and, per file, how close the two
+texts are: the share of words (counted with repetitions, whitespace and case
+ignored) they have in common. The extractors lay out text differently
+(line breaks, spacing, hyphenation), so parity is measured on words rather
+than characters.
+
+Usage: python bench_pdf2text.py [-i ../data/spanish/raw] [--files 20]
+"""
+
+import os
+import re
+import time
+import argparse
+from collections import Counter
+
+from pdf2text import BACKENDS, available_backends
+
+
+def word_overlap(text_a, text_b):
+    words_a = Counter(re.findall(r"\w+", text_a.lower()))
+    words_b = Counter(re.findall(r"\w+", text_b.lower()))
+    total = max(sum(words_a.values()), sum(words_b.values()))
+    if total == 0:
+        return 1.0
+    return sum((words_a & words_b).values()) / total
+
+
+def main(input_dir, files):
+    pdf_files = sorted(
+        os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith(".pdf")
+    )[:files]
+    backends = available_backends()
+    print(f"Benchmarking {', '.join(backends)} on {len(pdf_files)} PDFs from {input_dir}\n")
+
+    seconds = {name: 0.0 for name in backends}
+    pages = 0
+    parity = []
+    for pdf_file in pdf_files:
+        texts = {}
+        for name in backends:
+            start = time.perf_counter()
+            page_texts = BACKENDS[name](pdf_file)
+            seconds[name] += time.perf_counter() - start
+            texts[name] = "".join(page_texts)
+        pages += len(page_texts)
+        if len(texts) == 2:
+            parity.append((word_overlap(*texts.values()), pdf_file))
+
+    header = f"{'backend':<8} {'seconds':>8} {'pages/s':>9} {'speed-up':>9}"
+    print(header)
+    print("-" * len(header))
+    slowest = max(seconds.values())
+    for name in backends:
+        print(
+            f"{name:<8} {seconds[name]:>8.2f} {pages / max(seconds[name], 1e-9):>9.1f} "
+            f"{slowest / max(seconds[name], 1e-9):>8.1f}x"
+        )
+
+    if parity:
+        parity.sort()
+        mean = sum(p for p, _ in parity) / len(parity)
+        print(f"\nWord overlap between the backends: mean {mean:.1%}, lowest:")
+        for overlap, pdf_file in parity[:5]:
+            print(f"  {overlap:6.1%}  {pdf_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input_dir", default="../data/spanish/raw", help="Folder with the exam PDFs.")
+    parser.add_argument("--files", type=int, default=20, help="Maximum number of PDFs to benchmark.")
+
+    args = parser.parse_args()
+    main(input_dir=args.input_dir, files=args.files)
@@ -1,25 +1,17 @@
-# merge all files in a directory into a single one
+# merge all files in a directory into a single one, streaming the questions
 import os
-import json
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from merge_datasets import merge_datasets
 
 input_dir = "../data/spanish/mcq-answers"
 output_path = "../data/spanish/mcq-answers-all.jsonl"
 
-files = [file for file in os.listdir(input_dir) if file.endswith('.jsonl')]
-
-all_questions = []
-for file in files:
-    file_path = os.path.join(input_dir, file)
-    with open(file_path, 'r') as f:
-        data = f.readlines()
-        data = [json.loads(line) for line in data]
-        all_questions.extend(data)
-
 # convert answers from letter to integer
-out_questions = []
-for q in all_questions:
+def convert_answer(q):
     if q['answer'] == None:
-        continue
+        return None
 
     if q['answer'].lower() == 'a':
         q['answer'] = 1
@@ -30,9 +22,12 @@ for q in all_questions:
     elif q['answer'].lower() == 'd':
         q['answer'] = 4
 
-    out_questions.append(q)
+    return q
 
 
-with open(output_path, 'w') as f:
-    for d in out_questions:
-        f.write(json.dumps(d, ensure_ascii=False) + '\n')
\ No newline at end of file
+# the files are parsed in worker processes, which re-import this module
+# where processes are spawned (macOS, Windows)
+if __name__ == "__main__":
+    files = [os.path.join(input_dir, file) for file in os.listdir(input_dir) if file.endswith('.jsonl')]
+    stats = merge_datasets(files, output_path, transform=convert_answer, workers=min(4, len(files)))
+    print(f"Merged {stats['written']} questions from {stats['files']} files ({stats['dropped']} without answer)")
@@ -1,45 +1,109 @@
 import os
 from os import listdir
 from os.path import isfile, join
-import PyPDF2
+import sys
 import argparse
+from functools import partial
 from tqdm import tqdm
 
-def pdf_to_text(pdf_path):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from page_executor import imap_ordered
+
+# both backends are optional, PyMuPDF is the fast one and the default
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+
+def fitz_pages(pdf_path):
+    """
+    Extracts the text of each page with PyMuPDF (C library, fast).
+
+    return: list of str, one per page
+    """
+    with fitz.open(pdf_path) as document:
+        return [page.get_text() for page in document]
+
+
+def pypdf2_pages(pdf_path):
+    """
+    Extracts the text of each page with PyPDF2 (pure Python, slow).
+
+    return: list of str, one per page
+    """
     # Open the PDF file
     with open(pdf_path, 'rb') as file:
         # Create a PDF reader object
         reader = PyPDF2.PdfReader(file)
-        # Initialize text variable
-        text = ''
-        
-        # Iterate through all the pages
-        for page_num in range(len(reader.pages)):
-            # Extract text from each page
-            page = reader.pages[page_num]
-            text += page.extract_text()
-        
-    return text
-
-def main(input_dir, output_dir):
+        return [page.extract_text() for page in reader.pages]
+
+
+BACKENDS = {"fitz": fitz_pages, "pypdf2": pypdf2_pages}
+
+
+def available_backends():
+    return [name for name, module in [("fitz", fitz), ("pypdf2", PyPDF2)] if module is not None]
+
+
+def pdf_to_text(pdf_path, backend="fitz"):
+    """
+    Extracts the text of a PDF with `backend`, falling back to the other
+    available backend if it is not installed or fails on the file. The page
+    texts are collected in a list and joined once.
+
+    :param backend: str, "fitz" or "pypdf2"
+    return: str
+    """
+    backends = available_backends()
+    if not backends:
+        raise ImportError("Install pymupdf or PyPDF2 to extract text from PDFs")
+    order = [backend] + [name for name in backends if name != backend]
+    error = None
+    for name in order:
+        if name not in backends:
+            continue
+        try:
+            return "".join(BACKENDS[name](pdf_path))
+        except Exception as e:
+            error = e
+    raise error
+
+
+def convert_file(input_dir, output_dir, backend, f):
+    """
+    Extracts the text of one PDF and saves it; runs in a worker process.
+    """
+    pdf_file = "{}/{}".format(input_dir, f)
+    text = pdf_to_text(pdf_file, backend)
+
+    # save file
+    output_file = "{}.txt".format(f.split(".")[0])
+    with open(join(output_dir, output_file), 'w') as file:
+        file.write(text)
+    return f
+
+
+def main(input_dir, output_dir, backend="fitz", workers=1):
     # read pdf files in the input directory
     onlyfiles = [f for f in listdir(input_dir) if isfile(join(input_dir, f))]
     onlyfiles = [f for f in onlyfiles if f.endswith(".pdf")]
-    for f in tqdm(onlyfiles):
-        # Step 1: Reads the pdf file
-        print("Parsing file: {}".format(f))
-        pdf_file = "{}/{}".format(input_dir, f)
 
-        # Step 2: Extract text from PDF
-        text = pdf_to_text(pdf_file)
+    # create output directory if it does not exist
+    os.makedirs(output_dir, exist_ok=True)
 
-        # save file
-        # create output directory if it does not exist
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_file = "{}.txt".format(f.split(".")[0])
-        with open(join(output_dir, output_file), 'w') as file:
-            file.write(text)
+    done = imap_ordered(
+        partial(convert_file, input_dir, output_dir, backend),
+        onlyfiles,
+        max_workers=workers,
+        processes=True,
+    )
+    for f in tqdm(done, total=len(onlyfiles)):
+        print("Parsed file: {}".format(f))
 
 
 if __name__ == "__main__":
@@ -47,6 +111,8 @@ if __name__ == "__main__":
 
     parser.add_argument("-i", "--input_dir", help="", default="../data/spanish/raw")
     parser.add_argument("-o", "--output_dir", help="", default="../data/spanish/processed")
+    parser.add_argument("-b", "--backend", choices=list(BACKENDS), default="fitz", help="Text extraction library, the other one is used as a fallback")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Number of PDFs processed in parallel")
 
     args = parser.parse_args()
-    main(input_dir=args.input_dir, output_dir=args.output_dir)
\ No newline at end of file
+    main(input_dir=args.input_dir, output_dir=args.output_dir, backend=args.backend, workers=args.workers)
@@ -1,7 +1,9 @@
 import re
+import sys
 import json
 import pandas as pd
 import argparse
+from itertools import tee
 from openai import (
     OpenAI,
     AzureOpenAI,
@@ -16,6 +18,14 @@ from os import listdir
 from os.path import isfile, join
 import os
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+from response_cache import ResponseCache
+from text_chunker import DEFAULT_TOKENIZER, iter_file_chunks, load_token_counter
+from async_chat import AsyncChatClient
+
 
 pre_prompt = """Please extract the multiple-choice questions that are present in the following text. 
 Do not modify the original text in any form. It housl be copied as it is.
@@ -31,38 +41,71 @@ The text is the following:"""
 
 
 def chat_completion(
-    client, messages, model, return_text=True, return_usage=True, model_args=None
+    client,
+    messages,
+    model,
+    return_text=True,
+    return_usage=True,
+    model_args=None,
+    cache=None,
 ):
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
-
-            if return_text:
-                return text
-
-            if return_usage:
-                return usage
-
-            return response
-        except (
+    # serve repeated requests from the on-disk cache (text and usage only)
+    if cache is not None and (return_text or return_usage):
+        key = cache.make_key(model, messages, model_args)
+        cached = cache.get(key)
+        if cached is None:
+            text, usage = chat_completion(client, messages, model, model_args=model_args)
+            cached = {"text": text, "usage": usage}
+            cache.put(key, cached)
+
+        if return_text and return_usage:
+            return cached["text"], cached["usage"]
+
+        if return_text:
+            return cached["text"]
+
+        return cached["usage"]
+
+    limiter = get_limiter("vllm")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
+
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
 
 def remove_initial_number(option):
     # if first character is a number, remove it
@@ -115,50 +158,103 @@ def parse_gpt_output(q):
     return question, choice_1, choice_2, choice_3, choice_4
 
 
-def split_text_into_chunks(text, max_length=1500):
-    # Use a regular expression to identify the start of each question
-    question_pattern = re.compile(r'^\d+\.\s', re.MULTILINE)
-    
-    # Split the text based on the pattern that matches the start of a question
-    parts = question_pattern.split(text)
-    
-    # Reattach the question number to the beginning of each block
-    question_blocks = []
-    matches = list(question_pattern.finditer(text))
-    
-    for i, part in enumerate(parts):
-        if i < len(matches):
-            question_blocks.append(matches[i].group(0) + part.strip())
-        else:
-            if part.strip():
-                question_blocks.append(part.strip())
-    
-    chunks = []
-    current_chunk = ""
-
-    for block in question_blocks:
-        block = block.strip()
-        # If adding the next block would exceed the max_length, store the current chunk and start a new one
-        if len(current_chunk) + len(block) + 2 > max_length:  # 2 accounts for added "\n\n"
-            chunks.append(current_chunk.strip())
-            current_chunk = ""
-
-        # Add the question block to the current chunk
-        current_chunk += block + "\n\n"
-
-    # Add the last chunk if it's not empty
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-
-    return chunks
-        
-
-def main(dir_path):
-    # client = OpenAI(api_key=openai_key)
-    client = OpenAI(
-    base_url="http://localhost:8000/v1",
-    api_key="token-abc123"
-    )
+BASE_URL = "http://localhost:8000/v1"
+API_KEY = "token-abc123"
+MODEL = "meta-llama/Meta-Llama-3.1-70B-Instruct"
+
+model_args = {
+    "temperature": 0.0,
+    "max_tokens": 4096,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+}
+
+
+def chunk_messages(text_block):
+    prompt = "{}\n\n{}".format(pre_prompt, text_block)
+    return [{"role": "user", "content": prompt.strip()}]
+
+
+def response_rows(response, f, q_id):
+    """
+    It turns the model output for a chunk into dataset rows.
+
+    :param response: str
+    :param f: str, text file name
+    :param q_id: int, number of the first question of the chunk
+    return: list of dict
+    """
+    results = list()
+    for q in response.split("\n\n"):
+        if q:
+            (
+                question,
+                choice_1,
+                choice_2,
+                choice_3,
+                choice_4,
+            ) = parse_gpt_output(q)
+            if question is None or choice_1 is None or choice_2 is None \
+                or choice_3 is None or choice_4 is None:
+                continue
+
+            new_row = {
+                "question": question,
+                "options": [choice_1, choice_2, choice_3, choice_4],
+                "answer": None,
+                "language": "es", 
+                "country": "Spain",
+                "file_name": f,
+                "source": "https://sede.inap.gob.es/en/procesos-selectivos",
+                "license": "AGPL (Affero General Public License) , GPL (GNU General Public License)",
+                "level": "Professional",
+                "category_en": "Law and Government",
+                "category_original_lang": "Derecho y Gobierno",
+                "original_question_num": q_id,
+            }
+            q_id += 1
+            results.append(new_row)
+
+            if q_id == 70:
+                break
+    return results
+
+
+def save_results(dir_path, f, results):
+    # save data in jsonl format
+    output_file = os.path.join(dir_path, "mcq", f)
+    output_file = output_file.replace(".txt", ".jsonl")
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'w') as out:
+        for item in results:
+            out.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    print("Data saved: {}".format(output_file))
+
+
+def main(
+    dir_path,
+    cache_dir=None,
+    chunk_tokens=1500,
+    tokenizer=DEFAULT_TOKENIZER,
+    concurrency=32,
+    base_url=BASE_URL,
+    model=MODEL,
+):
+    """
+    :param dir_path: str, folder with the processed/ text files
+    :param cache_dir: str, folder of the response cache, None to disable it
+    :param chunk_tokens: int, token budget of the text sent in one request
+    :param tokenizer: str, how tokens are counted (see text_chunker.load_token_counter)
+    :param concurrency: int, requests in flight at the same time, so the
+        server batches them; 1 sends the chunks one by one
+    :param base_url: str, the OpenAI-compatible server
+    :param model: str
+    """
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    count_tokens, counter_name = load_token_counter(tokenizer)
+    print("Chunks of at most {} {}".format(chunk_tokens, counter_name))
 
     dir_path_parsed = dir_path + "/processed"
     onlyfiles = [
@@ -166,84 +262,71 @@ def main(dir_path):
     ]
     # remove files containing "respuestas"
     onlyfiles = [f for f in onlyfiles if "respuestas" not in f]
-    
-    for f in onlyfiles:
-        file_path = os.path.join(dir_path_parsed, f)
-        print("Parsing file: {}".format(f))
 
-        results = list()
-
-        # read txt file
-        with open(file_path, "r") as file:
-            text = file.read()
-
-        # split text 
-        texts = split_text_into_chunks(text)
-        # print("Number of text blocks: ", len(texts))
-        # print("Chars in last block: ", len(texts[-1]))
-        # print("i blocks: ", texts[-3])
-
-
-        q_id = 1
-        for text_block in tqdm(texts):
-            prompt = "{}\n\n{}".format(pre_prompt, text_block)
-            response, _ = chat_completion(
+    def iter_chunks():
+        # the chunks of every file, streamed in order, so the requests of the
+        # next file start while the last ones of a file are still running
+        for f in onlyfiles:
+            file_path = os.path.join(dir_path_parsed, f)
+            for text_block, _ in iter_file_chunks(file_path, count_tokens, chunk_tokens):
+                yield f, text_block
+
+    chunks, requests = tee(iter_chunks())
+    messages = (chunk_messages(text_block) for _, text_block in requests)
+
+    if concurrency > 1:
+        client = AsyncChatClient(base_url, API_KEY, concurrency=concurrency, cache=cache)
+        responses = client.imap(messages, model, model_args)
+    else:
+        client = OpenAI(base_url=base_url, api_key=API_KEY)
+        responses = (
+            chat_completion(
                 client,
-                [{"role": "user", "content": prompt.strip()}],
-                model="meta-llama/Meta-Llama-3.1-70B-Instruct",
+                m,
+                model=model,
                 return_text=True,
                 return_usage=True,
-                model_args={
-                    "temperature": 0.0,
-                    "max_tokens": 4096,
-                    "top_p": 1,
-                    "frequency_penalty": 0,
-                    "presence_penalty": 0,
-                },
+                model_args=model_args,
+                cache=cache,
             )
+            for m in messages
+        )
 
-            for q in response.split("\n\n"):
-                if q:
-                    (
-                        question,
-                        choice_1,
-                        choice_2,
-                        choice_3,
-                        choice_4,
-                    ) = parse_gpt_output(q)
-                    if question is None or choice_1 is None or choice_2 is None \
-                        or choice_3 is None or choice_4 is None:
-                        continue
-
-                    new_row = {
-                        "question": question,
-                        "options": [choice_1, choice_2, choice_3, choice_4],
-                        "answer": None,
-                        "language": "es", 
-                        "country": "Spain",
-                        "file_name": f,
-                        "source": "https://sede.inap.gob.es/en/procesos-selectivos",
-                        "license": "AGPL (Affero General Public License) , GPL (GNU General Public License)",
-                        "level": "Professional",
-                        "category_en": "Law and Government",
-                        "category_original_lang": "Derecho y Gobierno",
-                        "original_question_num": q_id,
-                    }
-                    q_id += 1
-                    results.append(new_row)
-
-                    if q_id == 70:
-                        break
-
-        # save data in jsonl format
-        output_file = os.path.join(dir_path, "mcq", f)
-        output_file = output_file.replace(".txt", ".jsonl")
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w') as f:
-            for item in results:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-
-        print("Data saved: {}".format(output_file))
+    files = iter(onlyfiles)
+
+    def start_file(f):
+        # files before f yielded no chunks: they still get an (empty) output
+        for g in files:
+            print("Parsing file: {}".format(g))
+            if g == f:
+                return
+            save_results(dir_path, g, [])
+
+    # responses come back in chunk order, whatever order they complete in
+    current, results, q_id = None, list(), 1
+    try:
+        for (f, _), (response, _) in tqdm(zip(chunks, responses), unit="chunk"):
+            if f != current:
+                if current is not None:
+                    save_results(dir_path, current, results)
+                start_file(f)
+                current, results, q_id = f, list(), 1
+            rows = response_rows(response, f, q_id)
+            q_id += len(rows)
+            results.extend(rows)
+        if current is not None:
+            save_results(dir_path, current, results)
+            current = None
+        start_file(None)
+    finally:
+        if current is not None:
+            # stopped by an error or an interrupt: keep the responses
+            # received for the current file
+            print("Saving the partial results of {}".format(current))
+            save_results(dir_path, current, results)
+        if concurrency > 1:
+            client.close()
+            client.print_stats()
 
 
 if __name__ == "__main__":
@@ -251,6 +334,45 @@ if __name__ == "__main__":
 
     parser.add_argument("-d", "--dir", help="", default="../data/spanish/")
     # parser.add_argument("-k", "--key", help="", default="")
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        help="Folder of the on-disk API response cache (disabled by default)",
+        default=None,
+    )
+    parser.add_argument(
+        "--chunk_tokens",
+        type=int,
+        help="Token budget of the exam text sent in one request",
+        default=1500,
+    )
+    parser.add_argument(
+        "--tokenizer",
+        help="Tokenizer counting the tokens: a Hugging Face model or tokenizer.json, "
+        "a tiktoken encoding (e.g. cl100k_base), approx or chars",
+        default=DEFAULT_TOKENIZER,
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        help="Requests in flight at the same time, batched by the server (1 sends them one by one)",
+        default=32,
+    )
+    parser.add_argument(
+        "--base_url",
+        help="OpenAI-compatible server, e.g. the local vLLM endpoint or mock_openai_server.py",
+        default=BASE_URL,
+    )
+    parser.add_argument("--model", help="Model served by the server", default=MODEL)
 
     args = parser.parse_args()
-    main(dir_path=args.dir)
+    main(
+        dir_path=args.dir,
+        cache_dir=args.cache_dir,
+        chunk_tokens=args.chunk_tokens,
+        tokenizer=args.tokenizer,
+        concurrency=args.concurrency,
+        base_url=args.base_url,
+        model=args.model,
+    )
@@ -1,13 +1,22 @@
-import json
+import os
+import sys
 from datasets import Dataset
 from huggingface_hub import HfApi, DatasetCard
 
-# Load the dataset
-with open('final_dataset.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "any_language"))
+from dataset_io import COLUMNS, dataset_format, extra_count, read_dataset
 
-# Create a Hugging Face dataset
-dataset = Dataset.from_list(data)
+# .json, .jsonl, .parquet or .arrow
+DATASET_FILE = 'final_dataset.json'
+
+# Create a Hugging Face dataset. Parquet files are loaded column by column
+# into a memory-mapped Arrow cache instead of a list of dicts, unless some
+# entries have keys or values kept in the "extra" column, which has to be
+# decoded.
+if dataset_format(DATASET_FILE) == 'parquet' and extra_count(DATASET_FILE) == 0:
+    dataset = Dataset.from_parquet(DATASET_FILE, columns=COLUMNS)
+else:
+    dataset = Dataset.from_list(read_dataset(DATASET_FILE))
 
 # Initialize the Hugging Face API
 api = HfApi()
@@ -1,40 +1,29 @@
-import json
 import os
-from typing import List, Dict
+import sys
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from merge_datasets import merge_datasets
 
 # Input and output paths
 INPUT_FOLDER = "checked"
 OUTPUT_FILE = "merged_dataset.json"
 
-def read_json_file(file_path: str) -> List[Dict]:
-    """Read and return data from a JSON file."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def write_json_file(file_path: str, data: List[Dict]):
-    """Write data to a JSON file."""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def merge_json_files(folder_path: str) -> List[Dict]:
-    """Merge all JSON files in the given folder."""
-    merged_data = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.json'):
-            file_path = os.path.join(folder_path, filename)
-            data = read_json_file(file_path)
-            merged_data.extend(data)
-    return merged_data
-
-def main():
-    # Merge all JSON files in the input folder
-    merged_data = merge_json_files(INPUT_FOLDER)
-
-    # Write merged data to output file
-    write_json_file(OUTPUT_FILE, merged_data)
+def main(input_folder=INPUT_FOLDER, output_file=OUTPUT_FILE, key=None, dedup=False, workers=1):
+    # Stream all dataset files in the input folder into the output file
+    stats = merge_datasets([input_folder], output_file, key=key, dedup=dedup, workers=workers)
 
-    print(f"Merged dataset saved to {OUTPUT_FILE}")
-    print(f"Total questions in merged dataset: {len(merged_data)}")
+    print(f"Merged dataset saved to {output_file}")
+    if dedup:
+        print(f"Duplicate questions dropped: {stats['duplicates']}")
+    print(f"Total questions in merged dataset: {stats['written']}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_folder", default=INPUT_FOLDER, help="Folder with the checked JSON/JSONL/Parquet/Arrow files")
+    parser.add_argument("--output_file", default=OUTPUT_FILE, help="Merged dataset, .json, .jsonl, .parquet or .arrow")
+    parser.add_argument("--key", default=None, help="Field the files are sorted by (e.g. original_question_num), to merge them in order")
+    parser.add_argument("--dedup", action="store_true", help="Drop questions with the same text and options as an earlier one")
+    parser.add_argument("--workers", type=int, default=1, help="Files parsed in parallel")
+    args = parser.parse_args()
+    main(args.input_folder, args.output_file, args.key, args.dedup, args.workers)
@@ -1,9 +1,10 @@
 import os
+import sys
 import time
-import base64
 import json
 import argparse
 import re
+from functools import partial
 import openai
 from openai import (
     OpenAI,
@@ -13,8 +14,16 @@ from openai import (
     InternalServerError,
 )
 import fitz  # PyMuPDF
+from PIL import Image
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language"))
+from dataset_io import write_dataset
+from image_encoding import ImageOptions, ImageWriter, add_image_arguments, image_message, image_options_from_args
+from page_executor import imap_ordered
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+from run_manifest import RunManifest
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -99,126 +108,181 @@ def chat_completion(
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            if return_text:
-                return text
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
-            if return_usage:
-                return usage
-
-            return response
-        except (
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 1 minute.")
-            time.sleep(60)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
 
-def encode_image(image_path):
+def render_pages(pdf_document, pdf_file, imgs_folder, image_writer=None, pages=None):
     """
-    Function to encode the image
+    Renders the pages of an open PDF one at a time and yields them as PIL images.
+    PyMuPDF documents are not thread-safe, so this runs in the calling thread.
+    `pages` restricts the rendering to these 0-based page indices.
     """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    if pages is None:
+        pages = range(len(pdf_document))
+    for i in pages:
+        # Convert page to image, in memory
+        pix = pdf_document[i].get_pixmap()
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        if image_writer is not None:
+            img_name = os.path.join(imgs_folder, f"{pdf_file}_{i+1}.png")
+            image_writer.save(image, img_name)
+        yield i, image
+
+def process_page(pdf_file, client, language, image_options, page_item):
+    """
+    Send a single rendered page to gpt-4o and return the extracted questions,
+    or None if the request was rejected
+    """
+    i, image = page_item
+    results = []
+
+    # Pass img to gpt-4 for mcq extraction
+    try:
+        message = [
+            {"type": "text", "text": pre_prompt.format(language)},
+            image_message(image, image_options),
+        ]
+        response, _ = chat_completion(
+            client,
+            [{"role": "user", "content": message}],
+            model="gpt-4o-2024-08-06",
+            return_text=True,
+            return_usage=True,
+            model_args={
+                "temperature": 0.0,
+                "max_tokens": 4096,
+                "top_p": 1,
+                "frequency_penalty": 0,
+                "presence_penalty": 0,
+            },
+        )
+
+        # Process gpt-4 output
+        parsed_data = parse_gpt_output(response)
+        for item in parsed_data:
+            new_row = {
+                "language": "sv",
+                "country": "Sweden",
+                "file_name": pdf_file,
+                "source": "https://www.umu.se/utbildning/sok/kunskapsprov/kunskapsprov-for-lakare/teoretiskt-delprov/",
+                "license": "unknown",
+                "level": "graduate",
+                "category_en": "Medicine",
+                "category_original_lang": "Medicin",
+                "original_question_num": item['question_number'],
+                "question": item['question'],
+                "options": item['choices'],
+                "answer": item['answer'],
+            }
+            results.append(new_row)
+
+    except openai.BadRequestError:
+        print(f"Error processing page {i+1}")
+        return None
 
-def process_pdf(pdf_file, dir_path, client, language):
+    return results
+
+def process_pdf(pdf_file, dir_path, client, language, manifest, workers=4, image_writer=None, image_options=ImageOptions()):
     """
-    Process a single PDF file
+    Process a single PDF file, keeping `workers` page requests in flight.
+    The questions of each page are saved to mcq/pages as soon as the page is
+    done and recorded in the manifest, so a restarted run only sends the pages
+    that are missing or failed.
     """
     print(f"Parsing file: {pdf_file}")
     pdf_document = fitz.open(os.path.join(dir_path, pdf_file))
-    results = []
+    num_pages = len(pdf_document)
 
-    # Ensure the imgs folder exists
+    # Ensure the imgs folder exists if the page images are kept
     imgs_folder = os.path.join(dir_path, "imgs")
-    os.makedirs(imgs_folder, exist_ok=True)
-
-    for i, page in enumerate(pdf_document):
-        print(f"Page: {i+1} / {len(pdf_document)}")
-        
-        # Convert page to image
-        pix = page.get_pixmap()
-        img_name = os.path.join(imgs_folder, f"{pdf_file}_{i+1}.png")
-        pix.save(img_name)
-
-        base64_image = encode_image(img_name)
-
-        # Pass img to gpt-4 for mcq extraction
-        try:
-            message = [
-                {"type": "text", "text": pre_prompt.format(language)},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    },
-                },
-            ]
-            response, _ = chat_completion(
-                client,
-                [{"role": "user", "content": message}],
-                model="gpt-4o-2024-08-06",
-                return_text=True,
-                return_usage=True,
-                model_args={
-                    "temperature": 0.0,
-                    "max_tokens": 4096,
-                    "top_p": 1,
-                    "frequency_penalty": 0,
-                    "presence_penalty": 0,
-                },
-            )
-
-            # Process gpt-4 output
-            parsed_data = parse_gpt_output(response)
-            for item in parsed_data:
-                new_row = {
-                    "language": "sv",
-                    "country": "Sweden",
-                    "file_name": pdf_file,
-                    "source": "https://www.umu.se/utbildning/sok/kunskapsprov/kunskapsprov-for-lakare/teoretiskt-delprov/",
-                    "license": "unknown",
-                    "level": "graduate",
-                    "category_en": "Medicine",
-                    "category_original_lang": "Medicin",
-                    "original_question_num": item['question_number'],
-                    "question": item['question'],
-                    "options": item['choices'],
-                    "answer": item['answer'],
-                }
-                results.append(new_row)
-            print(f"Questions extracted: {len(parsed_data)}")
-
-        except openai.BadRequestError:
-            print(f"Error processing page {i+1}")
-
-        # Remove the temporary image file
-        os.remove(img_name)
+    if image_writer is not None:
+        os.makedirs(imgs_folder, exist_ok=True)
+    pages_folder = os.path.join(dir_path, "mcq", "pages")
+    os.makedirs(pages_folder, exist_ok=True)
+
+    manifest.add_pages(pdf_file, range(1, num_pages + 1))
+    todo = manifest.remaining(pdf_file, range(1, num_pages + 1))
+    if len(todo) < num_pages:
+        print(f"Resuming: {num_pages - len(todo)} pages already done, {len(todo)} left")
+
+    pages = imap_ordered(
+        partial(process_page, pdf_file, client, language, image_options),
+        render_pages(pdf_document, pdf_file, imgs_folder, image_writer, [p - 1 for p in todo]),
+        max_workers=workers,
+    )
+    for page_num, page_results in zip(todo, pages):
+        print(f"Page: {page_num} / {num_pages}")
+        if page_results is None:
+            manifest.mark_failed(pdf_file, page_num, "request rejected by the API")
+            continue
+        page_file = os.path.join(pages_folder, f"{pdf_file.split('.')[0]}_page_{page_num}.json")
+        with open(page_file, 'w', encoding='utf-8') as f:
+            json.dump(page_results, f, ensure_ascii=False, indent=2)
+        manifest.mark_done(pdf_file, page_num, page_file)
+        print(f"Questions extracted: {len(page_results)}")
 
     # Close the PDF document
     pdf_document.close()
 
+    # Collect the saved pages, in page order
+    results = []
+    completed = manifest.completed(pdf_file)
+    for page_num in sorted(completed):
+        with open(completed[page_num], 'r', encoding='utf-8') as f:
+            results.extend(json.load(f))
+
+    failures = manifest.failures(pdf_file)
+    if failures:
+        print(f"{len(failures)} pages failed and will be retried on the next run: {', '.join(map(str, failures))}")
+
     return results
 
-def main(dir_path, language):
+def main(dir_path, language, workers=4, save_imgs=False, image_options=ImageOptions(), restart=False, output_format="json"):
     """
     It performs the main text extraction pipeline of the script.
 
     :param dir_path: str
     :param language: str
+    :param workers: int
+    :param save_imgs: bool, keep the page images in dir_path/imgs for debugging
+    :param image_options: ImageOptions, how pages are resized and encoded
+    :param restart: bool, ignore the progress recorded in mcq/manifest.sqlite
+    :param output_format: str, "json", "parquet" or "arrow" for the mcq files
     """
     # Get the API key from the environment variable
     openai_key = os.getenv('OPENAI_API_KEY')
@@ -235,15 +299,25 @@ def main(dir_path, language):
     mcq_folder = os.path.join(dir_path, "mcq")
     os.makedirs(mcq_folder, exist_ok=True)
 
+    # per-page progress, so an interrupted run picks up where it stopped
+    manifest = RunManifest(os.path.join(mcq_folder, "manifest.sqlite"))
+
+    image_writer = ImageWriter() if save_imgs else None
+
     for pdf_file in pdf_files:
-        results = process_pdf(pdf_file, dir_path, client, language)
+        if restart:
+            manifest.reset(pdf_file)
+        results = process_pdf(pdf_file, dir_path, client, language, manifest, workers, image_writer, image_options)
 
         # store extracted questions
-        output_file = os.path.join(mcq_folder, f"{pdf_file.split('.')[0]}.json")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        output_file = os.path.join(mcq_folder, f"{pdf_file.split('.')[0]}.{output_format}")
+        write_dataset(output_file, results)
         print(f"Data saved: {output_file}")
 
+    if image_writer is not None:
+        image_writer.close()
+    manifest.close()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
@@ -251,5 +325,20 @@ if __name__ == "__main__":
 
     parser.add_argument("-l", "--lang", help="", default="swedish")
 
+    parser.add_argument("-w", "--workers", type=int, help="Number of pages sent to the API concurrently", default=4)
+
+    parser.add_argument("--rpm", type=int, help="Requests per minute allowed (learned from the API headers if not set)", default=None)
+
+    parser.add_argument("--tpm", type=int, help="Tokens per minute allowed (learned from the API headers if not set)", default=None)
+
+    parser.add_argument("--save_imgs", action="store_true", help="Keep the page images in <dir>/imgs for debugging")
+
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress recorded in <dir>/mcq/manifest.sqlite and process every page again")
+
+    parser.add_argument("--output_format", choices=["json", "parquet", "arrow"], help="Format of the extracted questions in <dir>/mcq", default="json")
+
+    add_image_arguments(parser)
+
     args = parser.parse_args()
-    main(dir_path=args.dir, language=args.lang)
\ No newline at end of file
+    get_limiter("openai", requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    main(dir_path=args.dir, language=args.lang, workers=args.workers, save_imgs=args.save_imgs, image_options=image_options_from_args(args), restart=args.restart, output_format=args.output_format)
\ No newline at end of file
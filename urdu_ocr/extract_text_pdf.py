@@ -2,6 +2,7 @@ from os import listdir
 from os.path import isfile, join
 import os
 import re
+import sys
 import json
 import time
 import base64
@@ -19,6 +20,11 @@ from openai import (
 )
 from pdf2image import convert_from_path
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "any_language")
+)
+from rate_limit import call_with_rate_limit, estimate_tokens, get_limiter
+
 
 # pre_prompt = """Please extract the answer key from the attached image below. Extract the answer option of each of the questions and provide the response as a json with the key representing the question and its value the multiple choice option. Do not provide anything else.
 # """
@@ -48,21 +54,25 @@ def chat_completion_cohere(
     max_tokens=4096,
 ) -> str:
     output = None
-    for _ in range(10):
-        try:
-            response = client.chat(
+    try:
+        response = call_with_rate_limit(
+            lambda: client.chat(
                 message=messages,
                 # preamble="",
                 model="command-r-plus",
                 temperature=temperature,
                 max_tokens=max_tokens,
-            )
-            output = response.dict().get("text")
-            break
-        # except any exception
-        except Exception as e:
-            print(f"Failed to connect to Cohere API: {e}")
-            time.sleep(20)
+            ),
+            get_limiter("cohere"),
+            # retry any exception
+            (Exception,),
+            tokens=estimate_tokens(messages, max_tokens),
+            max_attempts=10,
+            name="Cohere",
+        )
+        output = response.dict().get("text")
+    except Exception as e:
+        print(f"Failed to connect to Cohere API: {e}")
     return output
 
 
@@ -96,33 +106,43 @@ def chat_completion_openai(
     if model_args is None:
         model_args = {}
 
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model, messages=messages, **model_args
-            )
-            text = response.choices[0].message.content.strip()
-            usage = response.usage
-
-            if return_text and return_usage:
-                return text, dict(usage)
+    limiter = get_limiter("openai")
+    estimated = estimate_tokens(messages, model_args.get("max_tokens"))
 
-            if return_text:
-                return text
+    def create():
+        raw = client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, **model_args
+        )
+        limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
-            if return_usage:
-                return usage
-
-            return response
-        except (
+    response = call_with_rate_limit(
+        create,
+        limiter,
+        (
             APITimeoutError,
             APIConnectionError,
             RateLimitError,
             InternalServerError,
-        ) as e:
-            print(f"OpenAI error: {str(e)}. Waiting for 30 secs.")
-            time.sleep(30)
-            continue
+        ),
+        tokens=estimated,
+        name="OpenAI",
+    )
+    if response.usage is not None:
+        limiter.record_usage(estimated, response.usage.total_tokens)
+    text = response.choices[0].message.content.strip()
+    usage = response.usage
+
+    if return_text and return_usage:
+        return text, dict(usage)
+
+    if return_text:
+        return text
+
+    if return_usage:
+        return usage
+
+    return response
 
 
 def main(pdf_path, api_key):